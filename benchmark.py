@@ -0,0 +1,327 @@
+"""Benchmarks for the processing and encoding paths of enhanced_image_converter.
+
+Synthetic images are generated from a fixed seed, so every run (and every
+machine) times exactly the same pixels. Each case is timed several times
+and the results are written as JSON, which a later run can be compared
+against to flag regressions:
+
+    python benchmark.py --output baseline.json
+    python benchmark.py --output current.json --baseline baseline.json
+    python benchmark.py --compare baseline.json current.json
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+
+from PIL import Image, ImageChops, ImageDraw
+
+import enhanced_image_converter as converter
+
+# Megapixel sizes run by default; the full range is 0.1 to 100
+DEFAULT_SIZES = (0.1, 1.0)
+ALL_SIZES = (0.1, 1.0, 4.0, 16.0, 100.0)
+
+CONTENTS = ("photo", "lineart")
+MODES = ("RGB", "RGBA", "L")
+BACKGROUNDS = ("black", "white", "custom")
+VARIANTS = ("plain", "invert", "alpha", "replace", "resize", "crop")
+FORMATS = ("png", "jpeg", "webp", "tiff", "bmp")
+
+# Custom key colour: the dark blue of the photo-like images' surround
+CUSTOM_COLOR = (20, 30, 60)
+
+# Bump when cases are renamed or generated differently, so old baselines aren't compared
+RESULTS_FORMAT = 1
+
+
+# Synthetic images
+
+def image_size(megapixels):
+    """Width and height of a 4:3 image with about this many megapixels"""
+    width = max(1, round(math.sqrt(megapixels * 1e6 * 4 / 3)))
+    return width, max(1, round(width * 3 / 4))
+
+
+def photo_image(width, height, seed=0):
+    """A photo-like RGB image: smooth colour fields and grain inside a dark blue surround"""
+    rng = random.Random(seed)
+    field = Image.frombytes("RGB", (16, 12), rng.randbytes(16 * 12 * 3)).resize((width, height), Image.BICUBIC)
+
+    # Tile one block of grain rather than drawing random bytes for every pixel
+    tile = Image.frombytes("L", (256, 256), rng.randbytes(256 * 256))
+    grain = Image.new("L", (width, height))
+    for top in range(0, height, 256):
+        for left in range(0, width, 256):
+            grain.paste(tile, (left, top))
+    image = Image.blend(field, Image.merge("RGB", (grain, grain, grain)), 0.15)
+
+    # Fade to the surround colour towards the edges
+    vignette = ImageChops.invert(Image.radial_gradient("L")).resize((width, height), Image.BICUBIC)
+    surround = Image.new("RGB", (width, height), CUSTOM_COLOR)
+    return Image.composite(image, surround, vignette.point(lambda v: min(255, v * 2)))
+
+
+def lineart_image(width, height, seed=0):
+    """A line-art RGB image: lines, outlines and text-like marks on black"""
+    rng = random.Random(seed)
+    image = Image.new("RGB", (width, height), (0, 0, 0))
+    draw = ImageDraw.Draw(image)
+    palette = [(255, 255, 255), (230, 40, 40), (40, 200, 90), (250, 200, 30), (60, 120, 250)]
+    stroke = max(1, width // 400)
+
+    for _ in range(120):
+        points = [(rng.randrange(width), rng.randrange(height)) for _ in range(2)]
+        draw.line(points, fill=rng.choice(palette), width=stroke)
+    for _ in range(40):
+        left, top = rng.randrange(width), rng.randrange(height)
+        box = [left, top, left + rng.randrange(1, max(2, width // 5)), top + rng.randrange(1, max(2, height // 5))]
+        if rng.random() < 0.5:
+            draw.rectangle(box, outline=rng.choice(palette), width=stroke)
+        else:
+            draw.ellipse(box, outline=rng.choice(palette), width=stroke)
+    return image
+
+
+def synthetic_image(megapixels, mode, content, seed=0):
+    """A deterministic test image of the given size, mode and kind of content"""
+    width, height = image_size(megapixels)
+    if content == "photo":
+        image = photo_image(width, height, seed)
+    else:
+        image = lineart_image(width, height, seed)
+    return image.convert(mode)
+
+
+# Cases
+
+def case_options(background, variant, engine, size):
+    """Processing options for one background mode and variant"""
+    width, height = size
+    options = dict(converter.DEFAULT_OPTIONS, background_mode=background, invert_colors=variant == "invert",
+                   engine=engine or converter.DEFAULT_ENGINE)
+    if background == "custom":
+        options.update(custom_color=CUSTOM_COLOR, tolerance=30)
+    if variant == "alpha":
+        options.update(adjust_alpha=True, alpha_value=128)
+    elif variant == "replace":
+        options.update(replace_background=True, replacement_color=(255, 255, 255))
+    elif variant == "resize":
+        options.update(resize=True, width=max(1, width // 2), height=max(1, height // 2))
+    elif variant == "crop":
+        options.update(crop=True, crop_left=width // 10, crop_top=height // 10,
+                       crop_right=width - width // 10, crop_bottom=height - height // 10)
+    # Build the key tables now, so no timed run pays for them
+    return converter.compile_options(options, use_cache=False).install().options
+
+
+def time_case(func, repeat, warmup):
+    """Run func warmup times untimed, then repeat times, returning the seconds of each timed run"""
+    for _ in range(warmup):
+        func()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def run_benchmarks(args):
+    """Time every selected case, returning the results document"""
+    processor = converter.ImageProcessor()
+    results = []
+
+    def record(case_id, kind, megapixels, times, **extra):
+        median = statistics.median(times)
+        result = dict(id=case_id, kind=kind, megapixels=megapixels, runs=len(times), min=min(times),
+                      median=median, max=max(times), mpix_per_s=megapixels / median if median else None, **extra)
+        results.append(result)
+        if not args.quiet:
+            print(f"{case_id:58s} {median * 1000:11.1f} ms {result['mpix_per_s']:9.2f} MP/s", flush=True)
+
+    for megapixels in args.sizes:
+        for content in args.contents:
+            for mode in args.modes:
+                image = synthetic_image(megapixels, mode, content, args.seed)
+                prefix = f"{content}/{mode}/{megapixels:g}MP"
+
+                for background in args.backgrounds:
+                    # The engines differ only in how custom colours are keyed
+                    for engine in args.engines if background == "custom" else [None]:
+                        for variant in args.variants:
+                            case_id = f"process/{prefix}/{background}/{variant}" + (f"/{engine}" if engine else "")
+                            if args.filter and args.filter not in case_id:
+                                continue
+                            options = case_options(background, variant, engine, image.size)
+                            times = time_case(lambda: processor.process_image(converter.open_image(image), options),
+                                              args.repeat, args.warmup)
+                            record(case_id, "process", megapixels, times)
+
+                # Encode the result of the default processing in every format
+                encode_input = None
+                for format_option in args.formats:
+                    case_id = f"encode/{prefix}/{format_option}"
+                    if args.filter and args.filter not in case_id:
+                        continue
+                    if encode_input is None:
+                        options = case_options("black", "invert", None, image.size)
+                        encode_input = processor.process_image(converter.open_image(image), options)
+                    size = len(processor.encode_image(encode_input, format_option, args.quality))
+                    times = time_case(lambda: processor.encode_image(encode_input, format_option, args.quality),
+                                      args.repeat, args.warmup)
+                    record(case_id, "encode", megapixels, times, bytes=size)
+
+    return {
+        "format": RESULTS_FORMAT,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": environment(),
+        "settings": {"seed": args.seed, "repeat": args.repeat, "warmup": args.warmup, "quality": args.quality},
+        "results": results
+    }
+
+
+def environment():
+    """The versions and machine a run happened on, to tell apart results that can't be compared"""
+    import PIL
+
+    return {
+        "app_version": converter.APP_VERSION,
+        "python": platform.python_version(),
+        "pillow": PIL.__version__,
+        "machine": platform.machine(),
+        "system": platform.system(),
+        "cpus": os.cpu_count()
+    }
+
+
+# Comparing runs
+
+def compare_results(baseline, current, threshold=0.10):
+    """Compare the median time of every case both runs have.
+
+    Returns (regressions, improvements, rows): cases at least threshold
+    slower or faster than the baseline, and a row per shared case.
+    """
+    base_cases = {result["id"]: result for result in baseline["results"]}
+    regressions, improvements, rows = [], [], []
+    for result in current["results"]:
+        base = base_cases.get(result["id"])
+        if base is None or not base["median"]:
+            continue
+        ratio = result["median"] / base["median"]
+        row = {"id": result["id"], "baseline": base["median"], "current": result["median"], "ratio": ratio}
+        rows.append(row)
+        if ratio > 1 + threshold:
+            regressions.append(row)
+        elif ratio < 1 / (1 + threshold):
+            improvements.append(row)
+    return regressions, improvements, rows
+
+
+def print_comparison(baseline, current, threshold):
+    """Print how a run compares with a baseline, returning the number of regressions"""
+    if baseline.get("format") != current.get("format"):
+        print("Warning: the runs use different benchmark formats; only cases with the same name are compared")
+    changed = [key for key, value in current["environment"].items() if baseline["environment"].get(key) != value]
+    if changed:
+        print(f"Warning: the runs differ in {', '.join(changed)}; timings may not be comparable")
+
+    regressions, improvements, rows = compare_results(baseline, current, threshold)
+    for title, items in (("Regressions", regressions), ("Improvements", improvements)):
+        if items:
+            print(f"{title} (more than {threshold:.0%} change in median time):")
+            for row in sorted(items, key=lambda row: -abs(math.log(row["ratio"]))):
+                print(f"  {row['id']:58s} {row['baseline'] * 1000:10.1f} ms -> {row['current'] * 1000:10.1f} ms "
+                      f"({row['ratio'] - 1:+.1%})")
+    print(f"{len(rows)} cases compared: {len(regressions)} slower, {len(improvements)} faster")
+    return len(regressions)
+
+
+def load_results(path):
+    """Read a results file written by this script"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        raise Exception(f"Failed to load benchmark results: {str(e)}")
+
+
+# Command line
+
+def parse_list(text, allowed=None, convert=str):
+    """Parse a comma-separated list, checking each item against the allowed values"""
+    items = [convert(item.strip()) for item in text.split(",") if item.strip()]
+    for item in items:
+        if allowed is not None and item not in allowed:
+            raise argparse.ArgumentTypeError(f"invalid choice: {item!r} (choose from {', '.join(map(str, allowed))})")
+    return items
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the processing and encoding of synthetic images.")
+    parser.add_argument("--sizes", type=lambda text: parse_list(text, convert=float), default=list(DEFAULT_SIZES),
+                        help=f"megapixel sizes, comma-separated (default: {','.join(map(str, DEFAULT_SIZES))}; "
+                             "'all' for " + ",".join(f"{size:g}" for size in ALL_SIZES) + ")")
+    parser.add_argument("--contents", type=lambda text: parse_list(text, CONTENTS), default=list(CONTENTS),
+                        help="image contents: photo, lineart")
+    parser.add_argument("--modes", type=lambda text: parse_list(text, MODES), default=list(MODES),
+                        help="source image modes: RGB, RGBA, L")
+    parser.add_argument("--backgrounds", type=lambda text: parse_list(text, BACKGROUNDS), default=list(BACKGROUNDS),
+                        help="background modes: black, white, custom")
+    parser.add_argument("--variants", type=lambda text: parse_list(text, VARIANTS), default=list(VARIANTS),
+                        help="processing variants: plain, invert, alpha, replace, resize, crop")
+    parser.add_argument("--engines", type=lambda text: parse_list(text, converter.PROCESSING_ENGINES),
+                        default=list(converter.PROCESSING_ENGINES), help="engines for custom colours: reference, lut")
+    parser.add_argument("--formats", type=lambda text: parse_list(text, FORMATS), default=list(FORMATS),
+                        help="output formats to encode: png, jpeg, webp, tiff, bmp")
+    parser.add_argument("--filter", help="only run cases whose name contains this text")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per case (default: 3)")
+    parser.add_argument("--warmup", type=int, default=1, help="untimed runs before timing (default: 1)")
+    parser.add_argument("--quality", type=int, default=95, help="encoder quality (default: 95)")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the synthetic images (default: 0)")
+    parser.add_argument("--output", metavar="PATH", help="write the results to this JSON file")
+    parser.add_argument("--baseline", metavar="PATH", help="compare the results with this earlier results file")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"),
+                        help="compare two results files without running anything")
+    parser.add_argument("--threshold", type=float, default=10.0,
+                        help="percent change in median time flagged as a regression (default: 10)")
+    parser.add_argument("--quiet", action="store_true", help="don't print each case as it finishes")
+
+    # "all" is easier to type than the full list of sizes
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if "--sizes" in argv and argv.index("--sizes") + 1 < len(argv) and argv[argv.index("--sizes") + 1] == "all":
+        argv[argv.index("--sizes") + 1] = ",".join(f"{size:g}" for size in ALL_SIZES)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    threshold = args.threshold / 100
+
+    try:
+        if args.compare:
+            baseline, current = (load_results(path) for path in args.compare)
+            return 1 if print_comparison(baseline, current, threshold) else 0
+
+        baseline = load_results(args.baseline) if args.baseline else None
+        current = run_benchmarks(args)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(current, f, indent=2)
+        if baseline is not None:
+            return 1 if print_comparison(baseline, current, threshold) else 0
+        return 0
+    except Exception as e:
+        print(str(e))
+        return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
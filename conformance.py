@@ -0,0 +1,325 @@
+"""Conformance checks for the processing engines of enhanced_image_converter.
+
+The reference engine, the original per-pixel Python loop, is the oracle:
+every other way of processing an image has to give exactly the same pixels.
+Each case draws options and a small image from a seeded generator, favouring
+the values where engines tend to disagree (tolerance 0 and 100, pure black
+and white, the 240/15 invert cut-offs, pixels right on a key colour's
+tolerance sphere, alpha 0, 1, 254 and 255), and runs it through every
+backend:
+
+    engines    every engine besides "reference", such as "lut"
+    strips     the reference engine split into tiny strips
+    variants   several presets sharing one decode and their key masks
+    workers    strips processed in worker processes through shared memory
+
+The first mismatching pixel of a failing case is reported together with the
+command that reruns just that case:
+
+    python conformance.py
+    python conformance.py --cases 2000 --backends engines,variants
+    python conformance.py --seed 0 --case 17
+"""
+
+import argparse
+import json
+import math
+import random
+import sys
+import time
+
+from PIL import Image
+
+import enhanced_image_converter as converter
+
+BACKENDS = ("engines", "strips", "variants", "workers")
+# Worker processes take a moment to start, so they are only checked on request
+DEFAULT_BACKENDS = ("engines", "strips", "variants")
+
+# Channel values where the black and white modes change behaviour
+EDGE_VALUES = (0, 1, 14, 15, 16, 239, 240, 241, 254, 255)
+ALPHA_VALUES = (0, 1, 127, 128, 254, 255)
+TOLERANCES = (0, 1, 50, 99, 100)
+SPECIAL_COLORS = ((0, 0, 0), (255, 255, 255))
+
+# Fixed sets of extra keys large enough to be folded into a colour cube;
+# cubes are slow to build, so random cases reuse these
+CUBE_KEY_SETS = (
+    [{"color": (200, 30, 30), "tolerance": 10}, {"color": (30, 200, 30), "tolerance": 20},
+     {"color": (30, 30, 200), "tolerance": 5}, {"color": (128, 128, 128), "tolerance": 15}],
+    [{"color": (0, 0, 0), "tolerance": 30}, {"color": (255, 255, 255), "tolerance": 30},
+     {"color": (250, 120, 0), "tolerance": 0}, {"color": (10, 240, 250), "tolerance": 100}],
+)
+# Padded with small keys up to ColorKeyMatcher.CUBE_MIN_KEYS
+CUBE_KEY_SETS = tuple(
+    keys + [{"color": (index * 37 % 256, index * 91 % 256, index * 53 % 256), "tolerance": index % 4 * 3}
+            for index in range(converter.ColorKeyMatcher.CUBE_MIN_KEYS - len(keys))]
+    for keys in CUBE_KEY_SETS
+)
+
+
+class ReferenceProcessor(converter.ImageProcessor):
+    """The reference engine over the whole image at once: the oracle"""
+
+    TILE_PIXELS = sys.maxsize
+
+
+class StripProcessor(converter.ImageProcessor):
+    """Splits images into strips of a row or two, with a ragged last strip"""
+
+    TILE_PIXELS = 97
+
+
+# Cases
+
+def fixed_cases():
+    """Options for the edge combinations every run checks before the random cases"""
+    cases = []
+    for mode in ("black", "white", "custom"):
+        for tolerance in (0, 100):
+            for color in SPECIAL_COLORS if mode == "custom" else [(0, 0, 0)]:
+                for invert in (False, True):
+                    cases.append(dict(converter.DEFAULT_OPTIONS, background_mode=mode, tolerance=tolerance,
+                                      custom_color=color, invert_colors=invert))
+    return cases
+
+
+def random_color(rng):
+    return tuple(rng.randrange(256) for _ in range(3))
+
+
+def random_options(rng, size):
+    """Processing options drawn with a bias towards edge values"""
+    mode = rng.choice(("black", "white", "custom"))
+    options = dict(converter.DEFAULT_OPTIONS, background_mode=mode, invert_colors=rng.random() < 0.5,
+                   tolerance=rng.choice(TOLERANCES + (rng.randint(0, 100),)))
+
+    if mode == "custom":
+        options["custom_color"] = rng.choice(SPECIAL_COLORS + (random_color(rng),) * 2)
+        choice = rng.random()
+        if choice < 0.15:
+            options["key_colors"] = rng.choice(CUBE_KEY_SETS)
+        elif choice < 0.45:
+            options["key_colors"] = [{"color": random_color(rng), "tolerance": rng.choice(TOLERANCES)}
+                                     for _ in range(rng.randint(1, 2))]
+        if rng.random() < 0.2:
+            # Hue ranges may wrap around red, where low is above high
+            options["key_ranges"] = [{"hue": (rng.randrange(361), rng.randrange(361)),
+                                      "saturation": tuple(sorted((rng.randrange(101), rng.randrange(101)))),
+                                      "value": tuple(sorted((rng.randrange(101), rng.randrange(101))))}]
+
+    if rng.random() < 0.3:
+        options.update(adjust_alpha=True, alpha_value=rng.choice(ALPHA_VALUES))
+    if rng.random() < 0.3:
+        color = random_color(rng) + ((rng.choice(ALPHA_VALUES),) if rng.random() < 0.5 else ())
+        options.update(replace_background=True, replacement_color=color)
+
+    width, height = size
+    if rng.random() < 0.1:
+        options.update(resize=True, width=rng.randint(1, width * 2), height=rng.randint(1, height * 2))
+    elif rng.random() < 0.1:
+        left, top = rng.randrange(width), rng.randrange(height)
+        options.update(crop=True, crop_left=left, crop_top=top,
+                       crop_right=rng.randint(left + 1, width), crop_bottom=rng.randint(top + 1, height))
+    return options
+
+
+def sphere_point(rng, color, tolerance):
+    """A colour about on the surface of a key colour's tolerance sphere"""
+    radius = tolerance * 255 / 100 + rng.uniform(-1.5, 1.5)
+    direction = [rng.gauss(0, 1) for _ in range(3)]
+    norm = math.sqrt(sum(d * d for d in direction)) or 1.0
+    return tuple(min(255, max(0, round(c + radius * d / norm))) for c, d in zip(color, direction))
+
+
+def random_image(rng, size, options):
+    """An RGBA image whose pixels sit on the edges these options care about"""
+    tolerance = options["tolerance"]
+    edges = EDGE_VALUES + tuple(min(255, max(0, value)) for value in
+                                (tolerance - 1, tolerance, tolerance + 1, 254 - tolerance, 255 - tolerance,
+                                 256 - tolerance))
+    keys = [(options["custom_color"], tolerance)]
+    keys += [(key["color"], key["tolerance"]) for key in options.get("key_colors") or []]
+
+    data = bytearray()
+    for _ in range(size[0] * size[1]):
+        choice = rng.random()
+        if choice < 0.3:
+            color = random_color(rng)
+        elif choice < 0.6 or options["background_mode"] != "custom":
+            color = tuple(rng.choice(edges) for _ in range(3))
+        else:
+            color = sphere_point(rng, *rng.choice(keys))
+        alpha = rng.choice(ALPHA_VALUES) if rng.random() < 0.5 else rng.randrange(256)
+        data.extend(color + (alpha,))
+    return Image.frombytes("RGBA", size, bytes(data))
+
+
+def make_case(seed, index, size):
+    """The options and image of one case; the same seed and index always give the same case"""
+    rng = random.Random(f"{seed}:{index}")
+    fixed = fixed_cases()
+    options = fixed[index] if index < len(fixed) else random_options(rng, size)
+    return options, random_image(rng, size, options)
+
+
+# Backends
+
+def backend_runs(backends, image, options, workers=None):
+    """Return (backend name, options, run) for every backend, run() giving its results for those options"""
+    runs = []
+    if "engines" in backends:
+        for engine in converter.PROCESSING_ENGINES:
+            if engine != "reference":
+                runs.append((engine, options, lambda engine=engine: converter.ImageProcessor().process_image(
+                    image, dict(options, engine=engine))))
+
+    if "strips" in backends:
+        runs.append(("strips", options,
+                     lambda: StripProcessor().process_image(image, dict(options, engine="reference"))))
+
+    if "variants" in backends:
+        # A second preset keying the same colours shares each strip's mask with the first
+        engine = converter.DEFAULT_ENGINE
+        twin = dict(options, invert_colors=not options["invert_colors"])
+        variants = []
+
+        def run_variants(index):
+            if not variants:
+                variants.extend(StripProcessor().process_variants(image, [dict(options, engine=engine),
+                                                                          dict(twin, engine=engine)]))
+            return variants[index]
+
+        runs.append(("variants", options, lambda: run_variants(0)))
+        runs.append(("variants (shared mask)", twin, lambda: run_variants(1)))
+
+    if "workers" in backends and workers is not None:
+        def run_workers():
+            with workers.process(StripProcessor(), image, dict(options, engine=converter.DEFAULT_ENGINE)) as shared:
+                return shared.image().copy()
+
+        runs.append(("workers", options, run_workers))
+    return runs
+
+
+def first_mismatch(expected, actual):
+    """Return (x, y) of the first pixel that differs, or None if the images are identical"""
+    expected_bytes, actual_bytes = expected.tobytes(), actual.tobytes()
+    if expected_bytes == actual_bytes:
+        return None
+    # Narrow down a block at a time before looking at single bytes
+    block = 4096
+    start = 0
+    while expected_bytes[start:start + block] == actual_bytes[start:start + block]:
+        start += block
+    offset = next(i for i in range(start, start + block) if expected_bytes[i] != actual_bytes[i])
+    pixel = offset // 4
+    return pixel % expected.width, pixel // expected.width
+
+
+def check_case(seed, index, size, backends, workers=None):
+    """Run one case through every backend, returning its options and a description of each failure"""
+    options, image = make_case(seed, index, size)
+    options = converter.compile_options(dict(options, engine="reference"), use_cache=False).options
+    expected = ReferenceProcessor().process_image(image, options)
+
+    failures = []
+    for backend, case_options, run in backend_runs(backends, image, options, workers):
+        try:
+            result = run()
+        except Exception as e:
+            failures.append(f"{backend}: {str(e)}")
+            continue
+        oracle = expected
+        if case_options is not options:
+            oracle = ReferenceProcessor().process_image(image, case_options)
+
+        if result.size != oracle.size or result.mode != oracle.mode:
+            failures.append(f"{backend}: gave a {result.mode} image of {result.size}, "
+                            f"expected {oracle.mode} of {oracle.size}")
+            continue
+        position = first_mismatch(oracle, result)
+        if position is not None:
+            source = converter.ImageProcessor().prepare_image(image, case_options)[0]
+            failures.append(f"{backend}: first mismatch at {position}: source {source.getpixel(position)}, "
+                            f"expected {oracle.getpixel(position)}, got {result.getpixel(position)}")
+    return options, failures
+
+
+def describe_options(options):
+    """The options of a case as compact JSON, leaving out the ones at their defaults"""
+    changed = {key: value for key, value in options.items()
+               if key != "engine" and converter.DEFAULT_OPTIONS.get(key) != value}
+    return json.dumps(changed, default=list)
+
+
+# Command line
+
+def parse_size(text):
+    try:
+        width, height = (int(part) for part in text.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid size: {text!r} (use WIDTHxHEIGHT)")
+    if width <= 0 or height <= 0:
+        raise argparse.ArgumentTypeError(f"invalid size: {text!r}")
+    return width, height
+
+
+def parse_backends(text):
+    backends = [item.strip() for item in text.split(",") if item.strip()]
+    for backend in backends:
+        if backend not in BACKENDS:
+            raise argparse.ArgumentTypeError(f"invalid backend: {backend!r} (choose from {', '.join(BACKENDS)})")
+    return backends
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Check that every processing engine matches the reference engine "
+                                                 "pixel for pixel.")
+    parser.add_argument("--cases", type=int, default=300,
+                        help=f"number of cases, the first {len(fixed_cases())} being fixed edge cases (default: 300)")
+    parser.add_argument("--case", type=int, help="run only this case, to reproduce a failure")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the random cases (default: 0)")
+    parser.add_argument("--size", type=parse_size, default=(48, 32), help="image size, WIDTHxHEIGHT (default: 48x32)")
+    parser.add_argument("--backends", type=parse_backends, default=list(DEFAULT_BACKENDS),
+                        help=f"comma-separated backends to check: {', '.join(BACKENDS)} "
+                             f"(default: {','.join(DEFAULT_BACKENDS)})")
+    parser.add_argument("--max-failures", type=int, default=10, help="stop after this many failing cases (default: 10)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    indexes = [args.case] if args.case is not None else range(args.cases)
+    workers = converter.ProcessWorkers(2) if "workers" in args.backends else None
+
+    start = time.perf_counter()
+    checked = failed = 0
+    try:
+        for index in indexes:
+            checked += 1
+            try:
+                options, failures = check_case(args.seed, index, args.size, args.backends, workers)
+            except Exception as e:
+                options, failures = make_case(args.seed, index, args.size)[0], [f"error: {str(e)}"]
+            if failures:
+                failed += 1
+                print(f"Case {index} failed (rerun with --seed {args.seed} --case {index} "
+                      f"--size {args.size[0]}x{args.size[1]}):")
+                print(f"  options: {describe_options(options)}")
+                for failure in failures:
+                    print(f"  {failure}")
+                if failed >= args.max_failures:
+                    print(f"Stopping after {failed} failing cases")
+                    break
+    finally:
+        if workers is not None:
+            workers.shutdown()
+
+    print(f"{checked} case{'s' if checked != 1 else ''} checked against the reference engine on {', '.join(args.backends)} "
+          f"in {time.perf_counter() - start:.1f} s: {failed} failed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
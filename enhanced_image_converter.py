@@ -1,1698 +1,6552 @@
-import tkinter as tk
-from tkinter import filedialog, messagebox, StringVar, IntVar, BooleanVar, Radiobutton, Label, Entry, Frame, Button, \
-    ttk, colorchooser, Menu, Scale, HORIZONTAL, simpledialog
-from PIL import Image, ImageTk, ImageOps
-import os
-import json
-import threading
-import time
-import shutil
-from datetime import datetime
-import webbrowser
-import sys
-
-# Global variables
-RECENT_FILES = []
-MAX_RECENT = 10
-PRESETS = {}
-APP_VERSION = "1.0.0"
-DEFAULT_SETTINGS = {
-    "recent_files": [],
-    "recent_folders": [],
-    "presets": {},
-    "last_output_dir": "",
-    "theme": "light",
-    "preserve_metadata": True,
-    "overwrite_existing": False,
-    "custom_naming": "{filename}_converted",
-    "default_format": "png"
-}
-SETTINGS_FILE = os.path.join(os.path.expanduser("~"), ".image_converter_settings.json")
-
-
-# Load settings
-def load_settings():
-    try:
-        if os.path.exists(SETTINGS_FILE):
-            with open(SETTINGS_FILE, 'r') as f:
-                return json.load(f)
-        return DEFAULT_SETTINGS.copy()
-    except Exception as e:
-        print(f"Error loading settings: {e}")
-        return DEFAULT_SETTINGS.copy()
-
-
-# Save settings
-def save_settings(settings):
-    try:
-        with open(SETTINGS_FILE, 'w') as f:
-            json.dump(settings, f, indent=2)
-    except Exception as e:
-        print(f"Error saving settings: {e}")
-
-
-# Initialize settings
-settings = load_settings()
-
-
-class ImageProcessor:
-    def __init__(self):
-        self.preview_image = None
-        self.original_image = None
-        self.processed_image = None
-        self.processing_thread = None
-        self.stop_processing = False
-
-    def load_image(self, image_path):
-        try:
-            self.original_image = Image.open(image_path).convert("RGBA")
-            return self.original_image
-        except Exception as e:
-            raise Exception(f"Failed to load image: {str(e)}")
-
-    def process_image(self, image, options):
-        """Process an image with the given options"""
-        try:
-            # Make a copy to avoid modifying the original
-            img = image.copy()
-
-            # Resize if needed
-            if options["resize"] and options["width"] > 0 and options["height"] > 0:
-                img = img.resize((options["width"], options["height"]), Image.LANCZOS)
-
-            # Crop if needed
-            if options["crop"]:
-                img = img.crop((options["crop_left"], options["crop_top"],
-                                options["crop_right"], options["crop_bottom"]))
-
-            # Process transparency and colors
-            if options["background_mode"] == "custom":
-                # Custom color transparency
-                bg_color = options["custom_color"]
-                tolerance = options["tolerance"] / 100.0
-
-                new_data = []
-                for item in img.getdata():
-                    r, g, b, a = item
-
-                    # Calculate color distance (simple Euclidean distance)
-                    distance = (
-                                       ((r - bg_color[0]) / 255) ** 2 +
-                                       ((g - bg_color[1]) / 255) ** 2 +
-                                       ((b - bg_color[2]) / 255) ** 2
-                               ) ** 0.5
-
-                    if distance < tolerance:
-                        # Background → transparent
-                        new_data.append((0, 0, 0, 0))
-                    elif options["invert_colors"]:
-                        # Invert non-background colors if requested
-                        new_data.append((255 - r, 255 - g, 255 - b, a))
-                    else:
-                        # Keep original colors
-                        new_data.append((r, g, b, a))
-            else:
-                # Black or white background
-                new_data = []
-
-                if options["background_mode"] == "black":
-                    # Black background
-                    tolerance = options["tolerance"]
-                    for item in img.getdata():
-                        r, g, b, a = item
-                        # Check if pixel is close to black
-                        if r <= tolerance and g <= tolerance and b <= tolerance:
-                            # Black background → transparent
-                            new_data.append((0, 0, 0, 0))
-                        elif options["invert_colors"]:
-                            if r > 240 and g > 240 and b > 240:
-                                # White → black
-                                new_data.append((0, 0, 0, 255))
-                            else:
-                                # Other colors → invert
-                                new_data.append((255 - r, 255 - g, 255 - b, a))
-                        else:
-                            # Keep original colors
-                            new_data.append((r, g, b, a))
-                else:
-                    # White background
-                    tolerance = 255 - options["tolerance"]
-                    for item in img.getdata():
-                        r, g, b, a = item
-                        # Check if pixel is close to white
-                        if r >= tolerance and g >= tolerance and b >= tolerance:
-                            # White background → transparent
-                            new_data.append((0, 0, 0, 0))
-                        elif options["invert_colors"]:
-                            if r < 15 and g < 15 and b < 15:
-                                # Black → white
-                                new_data.append((255, 255, 255, 255))
-                            else:
-                                # Other colors → invert
-                                new_data.append((255 - r, 255 - g, 255 - b, a))
-                        else:
-                            # Keep original colors
-                            new_data.append((r, g, b, a))
-
-            img.putdata(new_data)
-
-            # Apply alpha adjustment if needed
-            if options["adjust_alpha"] and options["alpha_value"] < 255:
-                alpha_value = options["alpha_value"]
-                alpha_data = []
-                for item in img.getdata():
-                    r, g, b, a = item
-                    if a > 0:  # Only adjust non-transparent pixels
-                        new_alpha = min(a, alpha_value)
-                        alpha_data.append((r, g, b, new_alpha))
-                    else:
-                        alpha_data.append((r, g, b, a))
-                img.putdata(alpha_data)
-
-            # Apply background replacement if needed
-            if options["replace_background"]:
-                bg_img = Image.new("RGBA", img.size, options["replacement_color"])
-                img = Image.alpha_composite(bg_img, img)
-
-            return img
-
-        except Exception as e:
-            raise Exception(f"Error processing image: {str(e)}")
-
-    def get_image_preview(self, image, max_size=(300, 300)):
-        """Create a thumbnail preview of the image"""
-        if image is None:
-            return None
-
-        # Create a copy to avoid modifying the original
-        img = image.copy()
-        img.thumbnail(max_size)
-        return ImageTk.PhotoImage(img)
-
-    def save_image(self, image, output_path, format_option, quality=95, optimize=True, preserve_metadata=False):
-        """Save the processed image"""
-        try:
-            # Get the appropriate format and extension
-            format_map = {
-                "png": "PNG",
-                "jpg": "JPEG",
-                "jpeg": "JPEG",
-                "webp": "WEBP",
-                "tiff": "TIFF",
-                "bmp": "BMP"
-            }
-
-            format_name = format_map.get(format_option.lower(), "PNG")
-
-            # Ensure the output path has the correct extension
-            base, _ = os.path.splitext(output_path)
-            output_path = f"{base}.{format_option.lower()}"
-
-            # Handle JPEG format (no alpha channel)
-            if format_name == "JPEG":
-                # Create a white background
-                bg = Image.new("RGB", image.size, (255, 255, 255))
-                bg.paste(image, (0, 0), image)
-
-                # Save with quality setting
-                bg.save(output_path, format=format_name, quality=quality, optimize=optimize)
-            else:
-                # Save with appropriate settings for the format
-                if format_name == "PNG":
-                    image.save(output_path, format=format_name, optimize=optimize)
-                elif format_name == "WEBP":
-                    image.save(output_path, format=format_name, quality=quality, lossless=quality > 90)
-                else:
-                    image.save(output_path, format=format_name)
-
-            return output_path
-        except Exception as e:
-            raise Exception(f"Failed to save image: {str(e)}")
-
-
-class App:
-    def __init__(self, root):
-        self.root = root
-        self.root.title("Background Remover and Color Inverter")
-        self.root.geometry("900x700")
-        self.root.minsize(800, 600)
-
-        # Set icon if available
-        try:
-            if os.name == 'nt':  # Windows
-                self.root.iconbitmap('icon.ico')
-            else:  # Linux/Mac
-                icon = tk.PhotoImage(file='icon.png')
-                self.root.iconphoto(True, icon)
-        except:
-            pass
-
-        # Initialize the image processor
-        self.processor = ImageProcessor()
-
-        # Initialize variables
-        self.init_variables()
-
-        # Create the UI
-        self.create_menu()
-        self.create_main_ui()
-
-        # Apply theme
-        self.apply_theme(settings.get("theme", "light"))
-
-        # Set up drag and drop
-        self.setup_drag_drop()
-
-        # Update recent files menu
-        self.update_recent_files_menu()
-
-        # Create processing queue
-        self.processing_queue = []
-        self.is_processing = False
-
-        # Add creator info
-        self.add_creator_info()
-
-    def init_variables(self):
-        """Initialize all variables used in the application"""
-        # Background mode
-        self.bg_mode_var = StringVar(value="black")
-
-        # Custom color
-        self.custom_color_var = StringVar(value="#000000")
-        self.custom_color_rgb = (0, 0, 0)
-
-        # Tolerance
-        self.tolerance_var = IntVar(value=15)
-
-        # Resize options
-        self.resize_var = BooleanVar(value=False)
-        self.width_var = StringVar(value="")
-        self.height_var = StringVar(value="")
-
-        # Crop options
-        self.crop_var = BooleanVar(value=False)
-        self.crop_left_var = IntVar(value=0)
-        self.crop_top_var = IntVar(value=0)
-        self.crop_right_var = IntVar(value=100)
-        self.crop_bottom_var = IntVar(value=100)
-
-        # Color options
-        self.invert_colors_var = BooleanVar(value=True)
-
-        # Alpha options
-        self.adjust_alpha_var = BooleanVar(value=False)
-        self.alpha_value_var = IntVar(value=255)
-
-        # Background replacement
-        self.replace_bg_var = BooleanVar(value=False)
-        self.replacement_color_var = StringVar(value="#FFFFFF")
-        self.replacement_color_rgb = (255, 255, 255)
-
-        # Output options
-        self.output_format_var = StringVar(value=settings.get("default_format", "png"))
-        self.output_quality_var = IntVar(value=95)
-        self.output_optimize_var = BooleanVar(value=True)
-        self.preserve_metadata_var = BooleanVar(value=settings.get("preserve_metadata", True))
-        self.overwrite_var = BooleanVar(value=settings.get("overwrite_existing", False))
-        self.custom_output_var = BooleanVar(value=False)
-        self.output_dir_var = StringVar(value=settings.get("last_output_dir", ""))
-        self.naming_pattern_var = StringVar(value=settings.get("custom_naming", "{filename}_converted"))
-
-        # Preview
-        self.preview_var = BooleanVar(value=True)
-
-        # Current file/folder
-        self.current_file = None
-        self.current_folder = None
-
-        # Preview images
-        self.original_preview = None
-        self.processed_preview = None
-
-    def create_menu(self):
-        """Create the application menu"""
-        self.menu_bar = Menu(self.root)
-
-        # File menu
-        self.file_menu = Menu(self.menu_bar, tearoff=0)
-        self.file_menu.add_command(label="Open File...", command=self.open_file, accelerator="Ctrl+O")
-        self.file_menu.add_command(label="Open Folder...", command=self.open_folder, accelerator="Ctrl+Shift+O")
-        self.file_menu.add_command(label="Open Multiple Files...", command=self.open_multiple_files)
-
-        # Recent files submenu
-        self.recent_menu = Menu(self.file_menu, tearoff=0)
-        self.file_menu.add_cascade(label="Recent Files", menu=self.recent_menu)
-
-        self.file_menu.add_separator()
-        self.file_menu.add_command(label="Save Current Image...", command=self.save_current_image, accelerator="Ctrl+S")
-        self.file_menu.add_command(label="Save All", command=self.process_queue, accelerator="Ctrl+Shift+S")
-        self.file_menu.add_separator()
-        self.file_menu.add_command(label="Exit", command=self.root.quit, accelerator="Alt+F4")
-
-        self.menu_bar.add_cascade(label="File", menu=self.file_menu)
-
-        # Edit menu
-        self.edit_menu = Menu(self.menu_bar, tearoff=0)
-        self.edit_menu.add_command(label="Clear Queue", command=self.clear_queue)
-        self.edit_menu.add_separator()
-
-        # Presets submenu
-        self.presets_menu = Menu(self.edit_menu, tearoff=0)
-        self.presets_menu.add_command(label="Save Current Settings as Preset...", command=self.save_preset)
-        self.presets_menu.add_command(label="Manage Presets...", command=self.manage_presets)
-        self.presets_menu.add_separator()
-
-        # Add default presets
-        self.presets_menu.add_command(label="Logo on Black", command=lambda: self.load_preset("logo_black"))
-        self.presets_menu.add_command(label="Logo on White", command=lambda: self.load_preset("logo_white"))
-        self.presets_menu.add_command(label="Product Image", command=lambda: self.load_preset("product"))
-
-        self.edit_menu.add_cascade(label="Presets", menu=self.presets_menu)
-        self.edit_menu.add_separator()
-        self.edit_menu.add_command(label="Preferences...", command=self.show_preferences)
-
-        self.menu_bar.add_cascade(label="Edit", menu=self.edit_menu)
-
-        # View menu
-        self.view_menu = Menu(self.menu_bar, tearoff=0)
-        self.view_menu.add_checkbutton(label="Show Preview", variable=self.preview_var,
-                                       command=self.toggle_preview)
-
-        # Theme submenu
-        self.theme_menu = Menu(self.view_menu, tearoff=0)
-        self.theme_menu.add_command(label="Light", command=lambda: self.apply_theme("light"))
-        self.theme_menu.add_command(label="Dark", command=lambda: self.apply_theme("dark"))
-
-        self.view_menu.add_cascade(label="Theme", menu=self.theme_menu)
-
-        self.menu_bar.add_cascade(label="View", menu=self.view_menu)
-
-        # Help menu
-        self.help_menu = Menu(self.menu_bar, tearoff=0)
-        self.help_menu.add_command(label="Documentation", command=self.show_documentation)
-        self.help_menu.add_command(label="About", command=self.show_about)
-
-        self.menu_bar.add_cascade(label="Help", menu=self.help_menu)
-
-        self.root.config(menu=self.menu_bar)
-
-        # Keyboard shortcuts
-        self.root.bind("<Control-o>", lambda event: self.open_file())
-        self.root.bind("<Control-Shift-O>", lambda event: self.open_folder())
-        self.root.bind("<Control-s>", lambda event: self.save_current_image())
-        self.root.bind("<Control-Shift-S>", lambda event: self.process_queue())
-
-    def create_main_ui(self):
-        """Create the main user interface"""
-        # Main container with two columns
-        self.main_frame = ttk.PanedWindow(self.root, orient=tk.HORIZONTAL)
-        self.main_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
-
-        # Left column - Settings
-        self.settings_frame = ttk.Frame(self.main_frame)
-        self.main_frame.add(self.settings_frame, weight=40)
-
-        # Right column - Preview
-        self.preview_frame = ttk.Frame(self.main_frame)
-        self.main_frame.add(self.preview_frame, weight=60)
-
-        # Create settings UI
-        self.create_settings_ui()
-
-        # Create preview UI
-        self.create_preview_ui()
-
-        # Create status bar
-        self.create_status_bar()
-
-    def create_settings_ui(self):
-        """Create the settings panel UI"""
-        # Use a notebook for tabs
-        self.settings_notebook = ttk.Notebook(self.settings_frame)
-        self.settings_notebook.pack(fill=tk.BOTH, expand=True)
-
-        # Basic tab
-        self.basic_frame = ttk.Frame(self.settings_notebook)
-        self.settings_notebook.add(self.basic_frame, text="Basic")
-
-        # Advanced tab
-        self.advanced_frame = ttk.Frame(self.settings_notebook)
-        self.settings_notebook.add(self.advanced_frame, text="Advanced")
-
-        # Output tab
-        self.output_frame = ttk.Frame(self.settings_notebook)
-        self.settings_notebook.add(self.output_frame, text="Output")
-
-        # Batch tab
-        self.batch_frame = ttk.Frame(self.settings_notebook)
-        self.settings_notebook.add(self.batch_frame, text="Batch")
-
-        # Fill the basic tab
-        self.create_basic_settings()
-
-        # Fill the advanced tab
-        self.create_advanced_settings()
-
-        # Fill the output tab
-        self.create_output_settings()
-
-        # Fill the batch tab
-        self.create_batch_settings()
-
-    def create_basic_settings(self):
-        """Create basic settings UI"""
-        # Background mode frame
-        bg_frame = ttk.LabelFrame(self.basic_frame, text="Background Detection")
-        bg_frame.pack(fill=tk.X, padx=10, pady=5)
-
-        # Background mode radio buttons
-        ttk.Radiobutton(bg_frame, text="Black Background", variable=self.bg_mode_var,
-                        value="black", command=self.update_preview).pack(anchor="w", padx=10, pady=2)
-        ttk.Radiobutton(bg_frame, text="White Background", variable=self.bg_mode_var,
-                        value="white", command=self.update_preview).pack(anchor="w", padx=10, pady=2)
-        ttk.Radiobutton(bg_frame, text="Custom Color", variable=self.bg_mode_var,
-                        value="custom", command=self.update_preview).pack(anchor="w", padx=10, pady=2)
-
-        # Custom color picker
-        color_frame = ttk.Frame(bg_frame)
-        color_frame.pack(fill=tk.X, padx=10, pady=5)
-
-        ttk.Label(color_frame, text="Custom Color:").pack(side=tk.LEFT, padx=5)
-        self.color_preview = ttk.Label(color_frame, text="      ", background="#000000")
-        self.color_preview.pack(side=tk.LEFT, padx=5)
-        ttk.Button(color_frame, text="Pick Color", command=self.pick_color).pack(side=tk.LEFT, padx=5)
-
-        # Tolerance slider
-        tolerance_frame = ttk.Frame(bg_frame)
-        tolerance_frame.pack(fill=tk.X, padx=10, pady=5)
-
-        ttk.Label(tolerance_frame, text="Tolerance:").pack(side=tk.LEFT, padx=5)
-        ttk.Scale(tolerance_frame, from_=0, to=100, orient=HORIZONTAL,
-                  variable=self.tolerance_var, command=lambda _: self.update_preview()).pack(side=tk.LEFT, fill=tk.X,
-                                                                                             expand=True, padx=5)
-        ttk.Label(tolerance_frame, textvariable=self.tolerance_var).pack(side=tk.LEFT, padx=5)
-
-        # Color options frame
-        color_options_frame = ttk.LabelFrame(self.basic_frame, text="Color Options")
-        color_options_frame.pack(fill=tk.X, padx=10, pady=5)
-
-        ttk.Checkbutton(color_options_frame, text="Invert Colors", variable=self.invert_colors_var,
-                        command=self.update_preview).pack(anchor="w", padx=10, pady=5)
-
-        # Resize frame
-        resize_frame = ttk.LabelFrame(self.basic_frame, text="Resize")
-        resize_frame.pack(fill=tk.X, padx=10, pady=5)
-
-        ttk.Checkbutton(resize_frame, text="Resize Image", variable=self.resize_var,
-                        command=self.toggle_resize).pack(anchor="w", padx=10, pady=2)
-
-        # Width and height inputs
-        size_frame = ttk.Frame(resize_frame)
-        size_frame.pack(fill=tk.X, padx=10, pady=5)
-
-        ttk.Label(size_frame, text="Width:").grid(row=0, column=0, padx=5, pady=2, sticky="w")
-        ttk.Entry(size_frame, textvariable=self.width_var, width=8).grid(row=0, column=1, padx=5, pady=2)
-        ttk.Label(size_frame, text="pixels").grid(row=0, column=2, padx=5, pady=2, sticky="w")
-
-        ttk.Label(size_frame, text="Height:").grid(row=1, column=0, padx=5, pady=2, sticky="w")
-        ttk.Entry(size_frame, textvariable=self.height_var, width=8).grid(row=1, column=1, padx=5, pady=2)
-        ttk.Label(size_frame, text="pixels").grid(row=1, column=2, padx=5, pady=2, sticky="w")
-
-        # Action buttons
-        action_frame = ttk.Frame(self.basic_frame)
-        action_frame.pack(fill=tk.X, padx=10, pady=10)
-
-        ttk.Button(action_frame, text="Open File", command=self.open_file).pack(side=tk.LEFT, padx=5)
-        ttk.Button(action_frame, text="Open Folder", command=self.open_folder).pack(side=tk.LEFT, padx=5)
-        ttk.Button(action_frame, text="Process & Save", command=self.process_current).pack(side=tk.LEFT, padx=5)
-
-    def create_advanced_settings(self):
-        """Create advanced settings UI"""
-        # Crop frame
-        crop_frame = ttk.LabelFrame(self.advanced_frame, text="Crop")
-        crop_frame.pack(fill=tk.X, padx=10, pady=5)
-
-        ttk.Checkbutton(crop_frame, text="Crop Image", variable=self.crop_var,
-                        command=self.toggle_crop).pack(anchor="w", padx=10, pady=2)
-
-        # Crop controls
-        crop_controls = ttk.Frame(crop_frame)
-        crop_controls.pack(fill=tk.X, padx=10, pady=5)
-
-        ttk.Label(crop_controls, text="Left:").grid(row=0, column=0, padx=5, pady=2, sticky="w")
-        ttk.Scale(crop_controls, from_=0, to=100, orient=HORIZONTAL,
-                  variable=self.crop_left_var, command=lambda _: self.update_preview()).grid(row=0, column=1, padx=5,
-                                                                                             pady=2, sticky="ew")
-
-        ttk.Label(crop_controls, text="Top:").grid(row=1, column=0, padx=5, pady=2, sticky="w")
-        ttk.Scale(crop_controls, from_=0, to=100, orient=HORIZONTAL,
-                  variable=self.crop_top_var, command=lambda _: self.update_preview()).grid(row=1, column=1, padx=5,
-                                                                                            pady=2, sticky="ew")
-
-        ttk.Label(crop_controls, text="Right:").grid(row=2, column=0, padx=5, pady=2, sticky="w")
-        ttk.Scale(crop_controls, from_=0, to=100, orient=HORIZONTAL,
-                  variable=self.crop_right_var, command=lambda _: self.update_preview()).grid(row=2, column=1, padx=5,
-                                                                                              pady=2, sticky="ew")
-
-        ttk.Label(crop_controls, text="Bottom:").grid(row=3, column=0, padx=5, pady=2, sticky="w")
-        ttk.Scale(crop_controls, from_=0, to=100, orient=HORIZONTAL,
-                  variable=self.crop_bottom_var, command=lambda _: self.update_preview()).grid(row=3, column=1, padx=5,
-                                                                                               pady=2, sticky="ew")
-
-        crop_controls.columnconfigure(1, weight=1)
-
-        # Alpha adjustment frame
-        alpha_frame = ttk.LabelFrame(self.advanced_frame, text="Transparency")
-        alpha_frame.pack(fill=tk.X, padx=10, pady=5)
-
-        ttk.Checkbutton(alpha_frame, text="Adjust Transparency", variable=self.adjust_alpha_var,
-                        command=self.toggle_alpha).pack(anchor="w", padx=10, pady=2)
-
-        # Alpha slider
-        alpha_slider_frame = ttk.Frame(alpha_frame)
-        alpha_slider_frame.pack(fill=tk.X, padx=10, pady=5)
-
-        ttk.Label(alpha_slider_frame, text="Alpha:").pack(side=tk.LEFT, padx=5)
-        ttk.Scale(alpha_slider_frame, from_=0, to=255, orient=HORIZONTAL,
-                  variable=self.alpha_value_var, command=lambda _: self.update_preview()).pack(side=tk.LEFT, fill=tk.X,
-                                                                                               expand=True, padx=5)
-        ttk.Label(alpha_slider_frame, textvariable=self.alpha_value_var).pack(side=tk.LEFT, padx=5)
-
-        # Background replacement frame
-        bg_replace_frame = ttk.LabelFrame(self.advanced_frame, text="Background Replacement")
-        bg_replace_frame.pack(fill=tk.X, padx=10, pady=5)
-
-        ttk.Checkbutton(bg_replace_frame, text="Replace Background", variable=self.replace_bg_var,
-                        command=self.toggle_bg_replacement).pack(anchor="w", padx=10, pady=2)
-
-        # Background color picker
-        bg_color_frame = ttk.Frame(bg_replace_frame)
-        bg_color_frame.pack(fill=tk.X, padx=10, pady=5)
-
-        ttk.Label(bg_color_frame, text="Background Color:").pack(side=tk.LEFT, padx=5)
-        self.bg_color_preview = ttk.Label(bg_color_frame, text="      ", background="#FFFFFF")
-        self.bg_color_preview.pack(side=tk.LEFT, padx=5)
-        ttk.Button(bg_color_frame, text="Pick Color", command=self.pick_bg_color).pack(side=tk.LEFT, padx=5)
-
-    def create_output_settings(self):
-        """Create output settings UI"""
-        # Format frame
-        format_frame = ttk.LabelFrame(self.output_frame, text="Output Format")
-        format_frame.pack(fill=tk.X, padx=10, pady=5)
-
-        formats = [("PNG (with transparency)", "png"),
-                   ("JPEG (no transparency)", "jpg"),
-                   ("WebP (with transparency)", "webp"),
-                   ("TIFF (with transparency)", "tiff"),
-                   ("BMP (no transparency)", "bmp")]
-
-        for text, value in formats:
-            ttk.Radiobutton(format_frame, text=text, variable=self.output_format_var,
-                            value=value).pack(anchor="w", padx=10, pady=2)
-
-        # Quality settings (for JPEG/WebP)
-        quality_frame = ttk.Frame(format_frame)
-        quality_frame.pack(fill=tk.X, padx=10, pady=5)
-
-        ttk.Label(quality_frame, text="Quality:").pack(side=tk.LEFT, padx=5)
-        ttk.Scale(quality_frame, from_=1, to=100, orient=HORIZONTAL,
-                  variable=self.output_quality_var).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
-        ttk.Label(quality_frame, textvariable=self.output_quality_var).pack(side=tk.LEFT, padx=5)
-
-        ttk.Checkbutton(format_frame, text="Optimize File Size",
-                        variable=self.output_optimize_var).pack(anchor="w", padx=10, pady=2)
-
-        # Output location frame
-        location_frame = ttk.LabelFrame(self.output_frame, text="Output Location")
-        location_frame.pack(fill=tk.X, padx=10, pady=5)
-
-        ttk.Radiobutton(location_frame, text="Save to 'converted' subfolder",
-                        variable=self.custom_output_var, value=False).pack(anchor="w", padx=10, pady=2)
-        ttk.Radiobutton(location_frame, text="Save to custom location",
-                        variable=self.custom_output_var, value=True).pack(anchor="w", padx=10, pady=2)
-
-        # Custom output directory
-        dir_frame = ttk.Frame(location_frame)
-        dir_frame.pack(fill=tk.X, padx=10, pady=5)
-
-        self.output_dir_entry = ttk.Entry(dir_frame, textvariable=self.output_dir_var)
-        self.output_dir_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
-        ttk.Button(dir_frame, text="Browse...", command=self.browse_output_dir).pack(side=tk.LEFT, padx=5)
-
-        # File naming frame
-        naming_frame = ttk.LabelFrame(self.output_frame, text="File Naming")
-        naming_frame.pack(fill=tk.X, padx=10, pady=5)
-
-        ttk.Label(naming_frame, text="Pattern:").pack(anchor="w", padx=10, pady=2)
-        ttk.Entry(naming_frame, textvariable=self.naming_pattern_var).pack(fill=tk.X, padx=10, pady=2)
-
-        ttk.Label(naming_frame, text="Available variables: {filename}, {date}, {time}, {counter}").pack(anchor="w",
-                                                                                                        padx=10, pady=2)
-
-        # File handling options
-        options_frame = ttk.Frame(self.output_frame)
-        options_frame.pack(fill=tk.X, padx=10, pady=5)
-
-        ttk.Checkbutton(options_frame, text="Preserve metadata",
-                        variable=self.preserve_metadata_var).pack(anchor="w", padx=10, pady=2)
-        ttk.Checkbutton(options_frame, text="Overwrite existing files",
-                        variable=self.overwrite_var).pack(anchor="w", padx=10, pady=2)
-
-    def create_batch_settings(self):
-        """Create batch processing UI"""
-        # Queue frame
-        queue_frame = ttk.LabelFrame(self.batch_frame, text="Processing Queue")
-        queue_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
-
-        # Queue list
-        self.queue_list = ttk.Treeview(queue_frame, columns=("path", "status"), show="headings")
-        self.queue_list.heading("path", text="File Path")
-        self.queue_list.heading("status", text="Status")
-        self.queue_list.column("path", width=300)
-        self.queue_list.column("status", width=100)
-        self.queue_list.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
-
-        # Scrollbar for queue list
-        scrollbar = ttk.Scrollbar(queue_frame, orient="vertical", command=self.queue_list.yview)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        self.queue_list.configure(yscrollcommand=scrollbar.set)
-
-        # Queue controls
-        controls_frame = ttk.Frame(self.batch_frame)
-        controls_frame.pack(fill=tk.X, padx=10, pady=5)
-
-        ttk.Button(controls_frame, text="Add Files", command=self.open_multiple_files).pack(side=tk.LEFT, padx=5)
-        ttk.Button(controls_frame, text="Remove Selected", command=self.remove_selected).pack(side=tk.LEFT, padx=5)
-        ttk.Button(controls_frame, text="Clear Queue", command=self.clear_queue).pack(side=tk.LEFT, padx=5)
-        ttk.Button(controls_frame, text="Process All", command=self.process_queue).pack(side=tk.LEFT, padx=5)
-
-    def create_preview_ui(self):
-        """Create the preview panel UI"""
-        # Preview container
-        preview_container = ttk.Frame(self.preview_frame)
-        preview_container.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
-
-        # Original image preview
-        original_frame = ttk.LabelFrame(preview_container, text="Original Image")
-        original_frame.pack(fill=tk.BOTH, expand=True, side=tk.LEFT, padx=5, pady=5)
-
-        self.original_canvas = tk.Canvas(original_frame, bg="#f0f0f0")
-        self.original_canvas.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
-
-        # Processed image preview
-        processed_frame = ttk.LabelFrame(preview_container, text="Processed Image")
-        processed_frame.pack(fill=tk.BOTH, expand=True, side=tk.LEFT, padx=5, pady=5)
-
-        self.processed_canvas = tk.Canvas(processed_frame, bg="#f0f0f0")
-        self.processed_canvas.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
-
-        # Preview controls
-        controls_frame = ttk.Frame(self.preview_frame)
-        controls_frame.pack(fill=tk.X, padx=10, pady=5)
-
-        ttk.Button(controls_frame, text="Update Preview", command=self.update_preview).pack(side=tk.LEFT, padx=5)
-        ttk.Checkbutton(controls_frame, text="Auto Preview", variable=self.preview_var).pack(side=tk.LEFT, padx=5)
-
-    def create_status_bar(self):
-        """Create the status bar"""
-        self.status_bar = ttk.Frame(self.root, relief=tk.SUNKEN, borderwidth=1)
-        self.status_bar.pack(side=tk.BOTTOM, fill=tk.X)
-
-        self.status_label = ttk.Label(self.status_bar, text="Ready")
-        self.status_label.pack(side=tk.LEFT, padx=5, pady=2)
-
-        self.progress_bar = ttk.Progressbar(self.status_bar, orient="horizontal", length=200, mode="determinate")
-        self.progress_bar.pack(side=tk.RIGHT, padx=5, pady=2)
-
-    def add_creator_info(self):
-        """Add creator information to the status bar"""
-        creator_label = ttk.Label(self.status_bar, text="Created by Vinay Ahari")
-        creator_label.pack(side=tk.RIGHT, padx=10, pady=2)
-
-    def setup_drag_drop(self):
-        """Set up drag and drop functionality"""
-        try:
-            # This will only work on Windows with additional libraries
-            if os.name == 'nt':
-                self.root.drop_target_register("DND_Files")
-                self.root.dnd_bind('<<Drop>>', self.handle_drop)
-        except:
-            # If drag and drop is not available, just pass
-            pass
-
-    def handle_drop(self, event):
-        """Handle drag and drop events"""
-        files = self.root.tk.splitlist(event.data)
-        for file in files:
-            if os.path.isfile(file) and file.lower().endswith((".png", ".jpg", ".jpeg", ".webp", ".tiff", ".bmp")):
-                self.add_to_queue(file)
-            elif os.path.isdir(file):
-                self.process_folder_path(file)
-
-    def update_recent_files_menu(self):
-        """Update the recent files menu"""
-        # Clear the menu
-        self.recent_menu.delete(0, tk.END)
-
-        # Add recent files
-        recent_files = settings.get("recent_files", [])
-        if recent_files:
-            for file in recent_files:
-                self.recent_menu.add_command(label=os.path.basename(file),
-                                             command=lambda f=file: self.open_recent_file(f))
-
-            self.recent_menu.add_separator()
-            self.recent_menu.add_command(label="Clear Recent Files", command=self.clear_recent_files)
-        else:
-            self.recent_menu.add_command(label="No Recent Files", state=tk.DISABLED)
-
-    def apply_theme(self, theme_name):
-        """Apply the selected theme"""
-        if theme_name == "dark":
-            # Set dark theme colors
-            self.root.configure(bg="#2d2d2d")
-            style = ttk.Style()
-            style.theme_use("clam")
-            style.configure(".", background="#2d2d2d", foreground="#ffffff")
-            style.configure("TFrame", background="#2d2d2d")
-            style.configure("TLabel", background="#2d2d2d", foreground="#ffffff")
-            style.configure("TButton", background="#3d3d3d", foreground="#ffffff")
-            style.configure("TCheckbutton", background="#2d2d2d", foreground="#ffffff")
-            style.configure("TRadiobutton", background="#2d2d2d", foreground="#ffffff")
-            style.configure("TNotebook", background="#2d2d2d", foreground="#ffffff")
-            style.configure("TNotebook.Tab", background="#3d3d3d", foreground="#ffffff")
-
-            # Update canvas colors
-            self.original_canvas.configure(bg="#3d3d3d")
-            self.processed_canvas.configure(bg="#3d3d3d")
-        else:
-            # Set light theme colors
-            self.root.configure(bg="#f0f0f0")
-            style = ttk.Style()
-            style.theme_use("clam")
-            style.configure(".", background="#f0f0f0", foreground="#000000")
-            style.configure("TFrame", background="#f0f0f0")
-            style.configure("TLabel", background="#f0f0f0", foreground="#000000")
-            style.configure("TButton", background="#e0e0e0", foreground="#000000")
-            style.configure("TCheckbutton", background="#f0f0f0", foreground="#000000")
-            style.configure("TRadiobutton", background="#f0f0f0", foreground="#000000")
-            style.configure("TNotebook", background="#f0f0f0", foreground="#000000")
-            style.configure("TNotebook.Tab", background="#e0e0e0", foreground="#000000")
-
-            # Update canvas colors
-            self.original_canvas.configure(bg="#ffffff")
-            self.processed_canvas.configure(bg="#ffffff")
-
-        # Save the theme setting
-        settings["theme"] = theme_name
-        save_settings(settings)
-
-    # File operations
-    def open_file(self):
-        """Open a single image file"""
-        file_path = filedialog.askopenfilename(
-            filetypes=[("Image files", "*.png;*.jpg;*.jpeg;*.webp;*.tiff;*.bmp")]
-        )
-
-        if file_path:
-            self.load_image(file_path)
-            self.add_to_recent_files(file_path)
-
-    def open_folder(self):
-        """Open a folder of images"""
-        folder_path = filedialog.askdirectory()
-        if folder_path:
-            self.process_folder_path(folder_path)
-
-    def open_multiple_files(self):
-        """Open multiple image files"""
-        file_paths = filedialog.askopenfilenames(
-            filetypes=[("Image files", "*.png;*.jpg;*.jpeg;*.webp;*.tiff;*.bmp")]
-        )
-
-        if file_paths:
-            for file_path in file_paths:
-                self.add_to_queue(file_path)
-
-            # Load the first image for preview
-            if not self.current_file:
-                self.load_image(file_paths[0])
-
-    def open_recent_file(self, file_path):
-        """Open a file from the recent files list"""
-        if os.path.exists(file_path):
-            self.load_image(file_path)
-        else:
-            messagebox.showerror("File Not Found", f"The file {file_path} no longer exists.")
-            # Remove from recent files
-            recent_files = settings.get("recent_files", [])
-            if file_path in recent_files:
-                recent_files.remove(file_path)
-                settings["recent_files"] = recent_files
-                save_settings(settings)
-                self.update_recent_files_menu()
-
-    def add_to_recent_files(self, file_path):
-        """Add a file to the recent files list"""
-        recent_files = settings.get("recent_files", [])
-
-        # Remove if already exists
-        if file_path in recent_files:
-            recent_files.remove(file_path)
-
-        # Add to the beginning
-        recent_files.insert(0, file_path)
-
-        # Limit to MAX_RECENT
-        recent_files = recent_files[:MAX_RECENT]
-
-        # Save to settings
-        settings["recent_files"] = recent_files
-        save_settings(settings)
-
-        # Update menu
-        self.update_recent_files_menu()
-
-    def clear_recent_files(self):
-        """Clear the recent files list"""
-        settings["recent_files"] = []
-        save_settings(settings)
-        self.update_recent_files_menu()
-
-    def load_image(self, file_path):
-        """Load an image for editing"""
-        try:
-            self.current_file = file_path
-            self.original_image = self.processor.load_image(file_path)
-
-            # Update status
-            self.status_label.config(text=f"Loaded: {os.path.basename(file_path)}")
-
-            # Update preview
-            self.update_preview()
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to load image: {str(e)}")
-
-    def process_folder_path(self, folder_path):
-        """Process all images in a folder"""
-        count = 0
-        for filename in os.listdir(folder_path):
-            if filename.lower().endswith((".png", ".jpg", ".jpeg", ".webp", ".tiff", ".bmp")):
-                file_path = os.path.join(folder_path, filename)
-                self.add_to_queue(file_path)
-                count += 1
-
-        if count > 0:
-            self.status_label.config(text=f"Added {count} images from folder to queue")
-
-            # Load the first image for preview if no image is currently loaded
-            if not self.current_file and count > 0:
-                for filename in os.listdir(folder_path):
-                    if filename.lower().endswith((".png", ".jpg", ".jpeg", ".webp", ".tiff", ".bmp")):
-                        self.load_image(os.path.join(folder_path, filename))
-                        break
-        else:
-            messagebox.showinfo("No Images", "No supported image files found in the selected folder.")
-
-    def add_to_queue(self, file_path):
-        """Add a file to the processing queue"""
-        # Check if already in queue
-        for item in self.queue_list.get_children():
-            if self.queue_list.item(item, "values")[0] == file_path:
-                return
-
-        # Add to queue
-        self.queue_list.insert("", "end", values=(file_path, "Pending"))
-
-    def remove_selected(self):
-        """Remove selected items from the queue"""
-        selected = self.queue_list.selection()
-        for item in selected:
-            self.queue_list.delete(item)
-
-    def clear_queue(self):
-        """Clear the processing queue"""
-        for item in self.queue_list.get_children():
-            self.queue_list.delete(item)
-
-    def process_queue(self):
-        """Process all files in the queue"""
-        if self.is_processing:
-            messagebox.showinfo("Processing", "Already processing files. Please wait.")
-            return
-
-        # Get all files from queue
-        files = []
-        for item in self.queue_list.get_children():
-            file_path = self.queue_list.item(item, "values")[0]
-            files.append((item, file_path))
-
-        if not files:
-            messagebox.showinfo("Empty Queue", "No files in the processing queue.")
-            return
-
-        # Start processing thread
-        self.is_processing = True
-        threading.Thread(target=self.process_files_thread, args=(files,), daemon=True).start()
-
-    def process_files_thread(self, files):
-        """Process files in a separate thread"""
-        total = len(files)
-        processed = 0
-        errors = 0
-
-        # Update progress bar max
-        self.root.after(0, lambda: self.progress_bar.configure(maximum=total))
-
-        for item_id, file_path in files:
-            if not os.path.exists(file_path):
-                self.root.after(0,
-                                lambda id=item_id: self.queue_list.item(id, values=(file_path, "File not found")))
-                errors += 1
-                continue
-
-            try:
-                # Update status
-                self.root.after(0, lambda: self.status_label.config(
-                    text=f"Processing {os.path.basename(file_path)}..."))
-                self.root.after(0, lambda id=item_id: self.queue_list.item(id, values=(file_path, "Processing")))
-
-                # Load image
-                img = self.processor.load_image(file_path)
-
-                # Get processing options
-                options = self.get_processing_options()
-
-                # Process image
-                result = self.processor.process_image(img, options)
-
-                # Get output path
-                output_path = self.get_output_path(file_path)
-
-                # Save image
-                self.processor.save_image(
-                    result,
-                    output_path,
-                    self.output_format_var.get(),
-                    self.output_quality_var.get(),
-                    self.output_optimize_var.get(),
-                    self.preserve_metadata_var.get()
-                )
-
-                # Update queue item
-                self.root.after(0, lambda id=item_id: self.queue_list.item(id, values=(file_path, "Completed")))
-                processed += 1
-
-            except Exception as e:
-                print(f"Error processing {file_path}: {str(e)}")
-                self.root.after(0, lambda id=item_id, err=str(e): self.queue_list.item(id, values=(
-                    file_path, f"Error: {err[:20]}...")))
-                errors += 1
-
-            # Update progress
-            self.root.after(0, lambda p=processed: self.progress_bar.configure(value=p))
-
-        # Update status when done
-        status_text = f"Completed: {processed} files processed"
-        if errors > 0:
-            status_text += f", {errors} errors"
-
-        self.root.after(0, lambda: self.status_label.config(text=status_text))
-        self.is_processing = False
-
-    def process_current(self):
-        """Process and save the current image"""
-        if not self.current_file:
-            messagebox.showinfo("No Image", "Please open an image first.")
-            return
-
-        try:
-            # Get processing options
-            options = self.get_processing_options()
-
-            # Process image
-            result = self.processor.process_image(self.original_image, options)
-
-            # Get output path
-            output_path = self.get_output_path(self.current_file)
-
-            # Save image
-            saved_path = self.processor.save_image(
-                result,
-                output_path,
-                self.output_format_var.get(),
-                self.output_quality_var.get(),
-                self.output_optimize_var.get(),
-                self.preserve_metadata_var.get()
-            )
-
-            messagebox.showinfo("Success", f"Image saved to:\n{saved_path}")
-
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to process image: {str(e)}")
-
-    def save_current_image(self):
-        """Save the current processed image"""
-        if not self.current_file or not self.processor.processed_image:
-            messagebox.showinfo("No Image", "Please open and process an image first.")
-            return
-
-        try:
-            # Get default filename
-            directory = os.path.dirname(self.current_file)
-            filename = os.path.basename(self.current_file)
-            base_name, _ = os.path.splitext(filename)
-            default_filename = f"{base_name}_converted.{self.output_format_var.get()}"
-
-            # Ask for save location
-            output_path = filedialog.asksaveasfilename(
-                initialdir=directory,
-                initialfile=default_filename,
-                defaultextension=f".{self.output_format_var.get()}",
-                filetypes=[
-                    ("PNG files", "*.png"),
-                    ("JPEG files", "*.jpg"),
-                    ("WebP files", "*.webp"),
-                    ("TIFF files", "*.tiff"),
-                    ("BMP files", "*.bmp"),
-                    ("All files", "*.*")
-                ]
-            )
-
-            if output_path:
-                # Save image
-                self.processor.save_image(
-                    self.processor.processed_image,
-                    output_path,
-                    self.output_format_var.get(),
-                    self.output_quality_var.get(),
-                    self.output_optimize_var.get(),
-                    self.preserve_metadata_var.get()
-                )
-
-                messagebox.showinfo("Success", f"Image saved to:\n{output_path}")
-
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to save image: {str(e)}")
-
-    def get_processing_options(self):
-        """Get all processing options as a dictionary"""
-        try:
-            width = int(self.width_var.get()) if self.resize_var.get() and self.width_var.get() else 0
-            height = int(self.height_var.get()) if self.resize_var.get() and self.height_var.get() else 0
-        except ValueError:
-            width, height = 0, 0
-
-        return {
-            "background_mode": self.bg_mode_var.get(),
-            "custom_color": self.custom_color_rgb,
-            "tolerance": self.tolerance_var.get(),
-            "resize": self.resize_var.get(),
-            "width": width,
-            "height": height,
-            "crop": self.crop_var.get(),
-            "crop_left": self.crop_left_var.get(),
-            "crop_top": self.crop_top_var.get(),
-            "crop_right": self.crop_right_var.get(),
-            "crop_bottom": self.crop_bottom_var.get(),
-            "invert_colors": self.invert_colors_var.get(),
-            "adjust_alpha": self.adjust_alpha_var.get(),
-            "alpha_value": self.alpha_value_var.get(),
-            "replace_background": self.replace_bg_var.get(),
-            "replacement_color": self.replacement_color_rgb
-        }
-
-    def get_output_path(self, input_path):
-        """Generate output path based on settings"""
-        directory = os.path.dirname(input_path)
-        filename = os.path.basename(input_path)
-        base_name, _ = os.path.splitext(filename)
-
-        # Get output directory
-        if self.custom_output_var.get() and self.output_dir_var.get():
-            output_dir = self.output_dir_var.get()
-            # Save the last used directory
-            settings["last_output_dir"] = output_dir
-            save_settings(settings)
-        else:
-            output_dir = os.path.join(directory, "converted")
-
-        # Create directory if it doesn't exist
-        os.makedirs(output_dir, exist_ok=True)
-
-        # Generate filename using pattern
-        pattern = self.naming_pattern_var.get()
-        if not pattern:
-            pattern = "{filename}_converted"
-
-        # Replace variables in pattern
-        now = datetime.now()
-        counter = 1
-
-        output_filename = pattern.replace("{filename}", base_name)
-        output_filename = output_filename.replace("{date}", now.strftime("%Y%m%d"))
-        output_filename = output_filename.replace("{time}", now.strftime("%H%M%S"))
-        output_filename = output_filename.replace("{counter}", str(counter))
-
-        # Add extension
-        output_filename = f"{output_filename}.{self.output_format_var.get()}"
-
-        # Full path
-        output_path = os.path.join(output_dir, output_filename)
-
-        # Handle file exists
-        if not self.overwrite_var.get() and os.path.exists(output_path):
-            counter = 1
-            while os.path.exists(output_path):
-                output_filename = pattern.replace("{filename}", base_name)
-                output_filename = output_filename.replace("{date}", now.strftime("%Y%m%d"))
-                output_filename = output_filename.replace("{time}", now.strftime("%H%M%S"))
-                output_filename = output_filename.replace("{counter}", str(counter))
-                output_filename = f"{output_filename}.{self.output_format_var.get()}"
-                output_path = os.path.join(output_dir, output_filename)
-                counter += 1
-
-        return output_path
-
-    # UI event handlers
-    def update_preview(self):
-        """Update the image preview"""
-        if not self.current_file or not self.original_image:
-            return
-
-        if not self.preview_var.get():
-            return
-
-        try:
-            # Clear canvases
-            self.original_canvas.delete("all")
-            self.processed_canvas.delete("all")
-
-            # Get original preview
-            original_preview = self.processor.get_image_preview(self.original_image)
-            if original_preview:
-                self.original_preview = original_preview  # Keep reference to prevent garbage collection
-                self.original_canvas.create_image(
-                    self.original_canvas.winfo_width() // 2,
-                    self.original_canvas.winfo_height() // 2,
-                    image=self.original_preview
-                )
-
-            # Process image with current settings
-            options = self.get_processing_options()
-            processed = self.processor.process_image(self.original_image, options)
-            self.processor.processed_image = processed  # Store for later use
-
-            # Get processed preview
-            processed_preview = self.processor.get_image_preview(processed)
-            if processed_preview:
-                self.processed_preview = processed_preview  # Keep reference to prevent garbage collection
-                self.processed_canvas.create_image(
-                    self.processed_canvas.winfo_width() // 2,
-                    self.processed_canvas.winfo_height() // 2,
-                    image=self.processed_preview
-                )
-
-        except Exception as e:
-            print(f"Preview error: {str(e)}")
-
-    def toggle_preview(self):
-        """Toggle automatic preview"""
-        if self.preview_var.get():
-            self.update_preview()
-
-    def toggle_resize(self):
-        """Enable/disable resize fields"""
-        state = "normal" if self.resize_var.get() else "disabled"
-        for widget in self.settings_frame.winfo_children():
-            if isinstance(widget, ttk.Entry) and (
-                    widget.winfo_name() == "width" or widget.winfo_name() == "height"):
-                widget.configure(state=state)
-
-        self.update_preview()
-
-    def toggle_crop(self):
-        """Enable/disable crop controls"""
-        state = "normal" if self.crop_var.get() else "disabled"
-        # Enable/disable crop sliders
-        for widget in self.advanced_frame.winfo_children():
-            if isinstance(widget, ttk.Scale) and widget.winfo_name().startswith("crop_"):
-                widget.configure(state=state)
-
-        self.update_preview()
-
-    def toggle_alpha(self):
-        """Enable/disable alpha slider"""
-        state = "normal" if self.adjust_alpha_var.get() else "disabled"
-        # Enable/disable alpha slider
-        for widget in self.advanced_frame.winfo_children():
-            if isinstance(widget, ttk.Scale) and widget.winfo_name() == "alpha":
-                widget.configure(state=state)
-
-        self.update_preview()
-
-    def toggle_bg_replacement(self):
-        """Enable/disable background replacement controls"""
-        state = "normal" if self.replace_bg_var.get() else "disabled"
-        # Enable/disable background color picker
-        for widget in self.advanced_frame.winfo_children():
-            if isinstance(widget, ttk.Button) and widget.winfo_name() == "bg_color_picker":
-                widget.configure(state=state)
-
-        self.update_preview()
-
-    def pick_color(self):
-        """Open color picker for background color"""
-        color = colorchooser.askcolor(initialcolor=self.custom_color_var.get())
-        if color[1]:  # If color is selected (not canceled)
-            self.custom_color_var.set(color[1])
-            self.custom_color_rgb = color[0]
-            self.color_preview.configure(background=color[1])
-            self.update_preview()
-
-    def pick_bg_color(self):
-        """Open color picker for replacement background color"""
-        color = colorchooser.askcolor(initialcolor=self.replacement_color_var.get())
-        if color[1]:  # If color is selected (not canceled)
-            self.replacement_color_var.set(color[1])
-            self.replacement_color_rgb = color[0]
-            self.bg_color_preview.configure(background=color[1])
-            self.update_preview()
-
-    def browse_output_dir(self):
-        """Browse for output directory"""
-        directory = filedialog.askdirectory(initialdir=self.output_dir_var.get() or os.path.expanduser("~"))
-        if directory:
-            self.output_dir_var.set(directory)
-
-    # Preset management
-    def save_preset(self):
-        """Save current settings as a preset"""
-        preset_name = simpledialog.askstring("Save Preset", "Enter a name for this preset:")
-        if preset_name:
-            # Get current settings
-            preset = {
-                "background_mode": self.bg_mode_var.get(),
-                "custom_color": self.custom_color_var.get(),
-                "tolerance": self.tolerance_var.get(),
-                "invert_colors": self.invert_colors_var.get(),
-                "resize": self.resize_var.get(),
-                "width": self.width_var.get(),
-                "height": self.height_var.get(),
-                "crop": self.crop_var.get(),
-                "crop_left": self.crop_left_var.get(),
-                "crop_top": self.crop_top_var.get(),
-                "crop_right": self.crop_right_var.get(),
-                "crop_bottom": self.crop_bottom_var.get(),
-                "adjust_alpha": self.adjust_alpha_var.get(),
-                "alpha_value": self.alpha_value_var.get(),
-                "replace_background": self.replace_bg_var.get(),
-                "replacement_color": self.replacement_color_var.get(),
-                "output_format": self.output_format_var.get(),
-                "output_quality": self.output_quality_var.get(),
-                "output_optimize": self.output_optimize_var.get()
-            }
-
-            # Save to settings
-            presets = settings.get("presets", {})
-            presets[preset_name] = preset
-            settings["presets"] = presets
-            save_settings(settings)
-
-            # Update presets menu
-            self.update_presets_menu()
-
-            messagebox.showinfo("Preset Saved", f"Preset '{preset_name}' has been saved.")
-
-    def load_preset(self, preset_name):
-        """Load a preset"""
-        presets = settings.get("presets", {})
-
-        # Default presets
-        default_presets = {
-            "logo_black": {
-                "background_mode": "black",
-                "tolerance": 15,
-                "invert_colors": True,
-                "resize": False,
-                "crop": False,
-                "adjust_alpha": False,
-                "replace_background": False,
-                "output_format": "png",
-                "output_quality": 95,
-                "output_optimize": True
-            },
-            "logo_white": {
-                "background_mode": "white",
-                "tolerance": 15,
-                "invert_colors": True,
-                "resize": False,
-                "crop": False,
-                "adjust_alpha": False,
-                "replace_background": False,
-                "output_format": "png",
-                "output_quality": 95,
-                "output_optimize": True
-            },
-            "product": {
-                "background_mode": "white",
-                "tolerance": 25,
-                "invert_colors": False,
-                "resize": True,
-                "width": "800",
-                "height": "800",
-                "crop": False,
-                "adjust_alpha": False,
-                "replace_background": True,
-                "replacement_color": "#FFFFFF",
-                "output_format": "png",
-                "output_quality": 90,
-                "output_optimize": True
-            }
-        }
-
-        # Get preset (from saved or default)
-        preset = presets.get(preset_name, default_presets.get(preset_name))
-
-        if not preset:
-            messagebox.showerror("Error", f"Preset '{preset_name}' not found.")
-            return
-
-        # Apply preset settings
-        self.bg_mode_var.set(preset.get("background_mode", "black"))
-        self.custom_color_var.set(preset.get("custom_color", "#000000"))
-        self.tolerance_var.set(preset.get("tolerance", 15))
-        self.invert_colors_var.set(preset.get("invert_colors", True))
-        self.resize_var.set(preset.get("resize", False))
-        self.width_var.set(preset.get("width", ""))
-        self.height_var.set(preset.get("height", ""))
-        self.crop_var.set(preset.get("crop", False))
-        self.crop_left_var.set(preset.get("crop_left", 0))
-        self.crop_top_var.set(preset.get("crop_top", 0))
-        self.crop_right_var.set(preset.get("crop_right", 100))
-        self.crop_bottom_var.set(preset.get("crop_bottom", 100))
-        self.adjust_alpha_var.set(preset.get("adjust_alpha", False))
-        self.alpha_value_var.set(preset.get("alpha_value", 255))
-        self.replace_bg_var.set(preset.get("replace_background", False))
-        self.replacement_color_var.set(preset.get("replacement_color", "#FFFFFF"))
-        self.output_format_var.set(preset.get("output_format", "png"))
-        self.output_quality_var.set(preset.get("output_quality", 95))
-        self.output_optimize_var.set(preset.get("output_optimize", True))
-
-        # Update UI states
-        self.toggle_resize()
-        self.toggle_crop()
-        self.toggle_alpha()
-        self.toggle_bg_replacement()
-
-        # Update preview
-        self.update_preview()
-
-        self.status_label.config(text=f"Loaded preset: {preset_name}")
-
-    def update_presets_menu(self):
-        """Update the presets menu with saved presets"""
-        # Clear user presets
-        for i in range(self.presets_menu.index("end") - 3):
-            self.presets_menu.delete(3)
-
-        # Add saved presets
-        presets = settings.get("presets", {})
-        for preset_name in presets:
-            self.presets_menu.add_command(label=preset_name,
-                                          command=lambda name=preset_name: self.load_preset(name))
-
-    def manage_presets(self):
-        """Open a dialog to manage presets"""
-        presets = settings.get("presets", {})
-        if not presets:
-            messagebox.showinfo("No Presets", "You don't have any saved presets.")
-            return
-
-        # Create preset manager dialog
-        preset_manager = tk.Toplevel(self.root)
-        preset_manager.title("Manage Presets")
-        preset_manager.geometry("300x300")
-        preset_manager.resizable(False, False)
-        preset_manager.transient(self.root)
-        preset_manager.grab_set()
-
-        # Create listbox for presets
-        preset_list = tk.Listbox(preset_manager)
-        preset_list.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
-
-        # Add presets to listbox
-        for preset_name in presets:
-            preset_list.insert(tk.END, preset_name)
-
-        # Create buttons
-        button_frame = ttk.Frame(preset_manager)
-        button_frame.pack(fill=tk.X, padx=10, pady=10)
-
-        ttk.Button(button_frame, text="Load",
-                   command=lambda: self.load_preset_from_manager(preset_list, preset_manager)).pack(
-            side=tk.LEFT, padx=5)
-        ttk.Button(button_frame, text="Delete",
-                   command=lambda: self.delete_preset(preset_list)).pack(side=tk.LEFT, padx=5)
-        ttk.Button(button_frame, text="Close",
-                   command=preset_manager.destroy).pack(side=tk.RIGHT, padx=5)
-
-    def load_preset_from_manager(self, preset_list, manager):
-        """Load a preset from the preset manager"""
-        selection = preset_list.curselection()
-        if selection:
-            preset_name = preset_list.get(selection[0])
-            manager.destroy()
-            self.load_preset(preset_name)
-
-    def delete_preset(self, preset_list):
-        """Delete a preset"""
-        selection = preset_list.curselection()
-        if selection:
-            preset_name = preset_list.get(selection[0])
-            confirm = messagebox.askyesno("Confirm Delete",
-                                          f"Are you sure you want to delete the preset '{preset_name}'?")
-            if confirm:
-                presets = settings.get("presets", {})
-                if preset_name in presets:
-                    del presets[preset_name]
-                    settings["presets"] = presets
-                    save_settings(settings)
-                    preset_list.delete(selection[0])
-                    self.update_presets_menu()
-
-    # Preferences and help
-    def show_preferences(self):
-        """Show preferences dialog"""
-        prefs = tk.Toplevel(self.root)
-        prefs.title("Preferences")
-        prefs.geometry("400x300")
-        prefs.resizable(False, False)
-        prefs.transient(self.root)
-        prefs.grab_set()
-
-        # Create notebook for preference tabs
-        pref_notebook = ttk.Notebook(prefs)
-        pref_notebook.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
-
-        # General tab
-        general_frame = ttk.Frame(pref_notebook)
-        pref_notebook.add(general_frame, text="General")
-
-        # Theme selection
-        theme_frame = ttk.LabelFrame(general_frame, text="Theme")
-        theme_frame.pack(fill=tk.X, padx=10, pady=5)
-
-        theme_var = StringVar(value=settings.get("theme", "light"))
-        ttk.Radiobutton(theme_frame, text="Light Theme", variable=theme_var,
-                        value="light").pack(anchor="w", padx=10, pady=2)
-        ttk.Radiobutton(theme_frame, text="Dark Theme", variable=theme_var,
-                        value="dark").pack(anchor="w", padx=10, pady=2)
-
-        # Default format
-        format_frame = ttk.LabelFrame(general_frame, text="Default Output Format")
-        format_frame.pack(fill=tk.X, padx=10, pady=5)
-
-        format_var = StringVar(value=settings.get("default_format", "png"))
-        ttk.Radiobutton(format_frame, text="PNG", variable=format_var,
-                        value="png").pack(anchor="w", padx=10, pady=2)
-        ttk.Radiobutton(format_frame, text="JPEG", variable=format_var,
-                        value="jpg").pack(anchor="w", padx=10, pady=2)
-        ttk.Radiobutton(format_frame, text="WebP", variable=format_var,
-                        value="webp").pack(anchor="w", padx=10, pady=2)
-
-        # File handling tab
-        file_frame = ttk.Frame(pref_notebook)
-        pref_notebook.add(file_frame, text="File Handling")
-
-        # Metadata option
-        metadata_var = BooleanVar(value=settings.get("preserve_metadata", True))
-        ttk.Checkbutton(file_frame, text="Preserve image metadata by default",
-                        variable=metadata_var).pack(anchor="w", padx=10, pady=5)
-
-        # Overwrite option
-        overwrite_var = BooleanVar(value=settings.get("overwrite_existing", False))
-        ttk.Checkbutton(file_frame, text="Overwrite existing files by default",
-                        variable=overwrite_var).pack(anchor="w", padx=10, pady=5)
-
-        # Default naming pattern
-        naming_frame = ttk.LabelFrame(file_frame, text="Default Naming Pattern")
-        naming_frame.pack(fill=tk.X, padx=10, pady=5)
-
-        naming_var = StringVar(value=settings.get("custom_naming", "{filename}_converted"))
-        ttk.Entry(naming_frame, textvariable=naming_var).pack(fill=tk.X, padx=10, pady=5)
-        ttk.Label(naming_frame, text="Available variables: {filename}, {date}, {time}, {counter}").pack(
-            anchor="w", padx=10, pady=2)
-
-        # Save button
-        def save_preferences():
-            settings["theme"] = theme_var.get()
-            settings["default_format"] = format_var.get()
-            settings["preserve_metadata"] = metadata_var.get()
-            settings["overwrite_existing"] = overwrite_var.get()
-            settings["custom_naming"] = naming_var.get()
-            save_settings(settings)
-
-            # Apply theme
-            self.apply_theme(theme_var.get())
-
-            # Update variables
-            self.output_format_var.set(format_var.get())
-            self.preserve_metadata_var.set(metadata_var.get())
-            self.overwrite_var.set(overwrite_var.get())
-            self.naming_pattern_var.set(naming_var.get())
-
-            prefs.destroy()
-            messagebox.showinfo("Preferences", "Preferences have been saved.")
-
-        ttk.Button(prefs, text="Save", command=save_preferences).pack(side=tk.RIGHT, padx=10, pady=10)
-        ttk.Button(prefs, text="Cancel", command=prefs.destroy).pack(side=tk.RIGHT, padx=0, pady=10)
-
-    def show_documentation(self):
-        """Show documentation"""
-        # Try to open documentation in web browser
-        try:
-            webbrowser.open("https://github.com/vinayhr5/enhanced-image-converter/blob/main/README.md")
-        except:
-            # If web browser can't be opened, show documentation in a dialog
-            doc = tk.Toplevel(self.root)
-            doc.title("Documentation")
-            doc.geometry("600x500")
-            doc.transient(self.root)
-
-            # Create text widget with scrollbar
-            text_frame = ttk.Frame(doc)
-            text_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
-
-            scrollbar = ttk.Scrollbar(text_frame)
-            scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-
-            text = tk.Text(text_frame, wrap=tk.WORD, yscrollcommand=scrollbar.set)
-            text.pack(fill=tk.BOTH, expand=True)
-            scrollbar.config(command=text.yview)
-
-            # Add documentation text
-            documentation = """
-                            # Background Remover and Color Inverter
-
-    ## Basic Usage
-
-    1. Open an image file using File > Open File or the "Open File" button.
-    2. Select the background type (black, white, or custom color).
-    3. Adjust the tolerance slider to control how much of the background is removed.
-    4. Check "Invert Colors" if you want to invert the colors of the non-background areas.
-    5. Click "Process & Save" to save the processed image.
-
-    ## Advanced Features
-
-        ### Resize
-
-    Check "Resize Image" and enter the desired width and height in pixels.
-
-    ### Crop
-
-    Check "Crop Image" and use the sliders to adjust the crop area.
-
-    ### Transparency
-
-    Check "Adjust Transparency" and use the slider to control the overall transparency.
-
-    ### Background Replacement
-
-    Check "Replace Background" and choose a color to replace the transparent areas.
-
-    ## Batch Processing
-
-    1. Add multiple files to the queue using File > Open Multiple Files.
-    2. Configure your processing settings.
-    3. Click "Process All" to process all files in the queue.
-
-    ## Presets
-
-    Save your current settings as a preset using Edit > Presets > Save Current Settings as Preset.
-    Load a preset using Edit > Presets and selecting the preset name.
-
-    ## Output Options
-
-    - Choose the output format (PNG, JPEG, WebP, etc.)
-    - Adjust quality settings for JPEG and WebP
-    - Set custom output directory
-    - Configure file naming pattern
-            """
-
-            text.insert(tk.END, documentation)
-            text.config(state=tk.DISABLED)
-
-            ttk.Button(doc, text="Close", command=doc.destroy).pack(pady=10)
-
-    def show_about(self):
-        """Show about dialog"""
-        about = tk.Toplevel(self.root)
-        about.title("About")
-        about.geometry("400x300")
-        about.resizable(False, False)
-        about.transient(self.root)
-        about.grab_set()
-
-        # App icon
-        try:
-            if os.name == 'nt':  # Windows
-                logo = tk.PhotoImage(file='icon.png')
-                logo_label = ttk.Label(about, image=logo)
-                logo_label.image = logo  # Keep a reference
-                logo_label.pack(pady=10)
-            else:  # Linux/Mac
-                logo = tk.PhotoImage(file='icon.png')
-                logo_label = ttk.Label(about, image=logo)
-                logo_label.image = logo  # Keep a reference
-                logo_label.pack(pady=10)
-        except:
-            pass
-
-        # App info
-        ttk.Label(about, text="Background Remover and Color Inverter",
-                  font=("Helvetica", 14, "bold")).pack(pady=5)
-        ttk.Label(about, text=f"Version {APP_VERSION}").pack()
-        ttk.Label(about, text="Created by Vinay Ahari").pack(pady=5)
-
-        # Description
-        description = ttk.Label(about, text="A tool for removing backgrounds from images and inverting colors.",
-                                wraplength=350, justify="center")
-        description.pack(pady=10)
-
-        # Close button
-        ttk.Button(about, text="Close", command=about.destroy).pack(pady=10)
-
-
-def main():
-    root = tk.Tk()
-    app = App(root)
-    root.mainloop()
-
-    # Save settings on exit
-    save_settings(settings)
-
-
-if __name__ == "__main__":
-    main()
+import time
+
+# Reference point for the startup report
+STARTUP_START = time.perf_counter()
+
+try:
+    import tkinter as tk
+    from tkinter import filedialog, messagebox, StringVar, IntVar, BooleanVar, Radiobutton, Label, Entry, Frame, \
+        Button, ttk, colorchooser, Menu, Scale, HORIZONTAL, simpledialog
+except ImportError:
+    # Without Tk the module still works as a library, service and command line tool
+    tk = None
+from PIL import Image, ImageChops, ImageMath
+import os
+import json
+import argparse
+import math
+import itertools
+import fnmatch
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from datetime import datetime
+import sys
+
+# Rarely needed modules (ImageTk, ImageOps, TiffImagePlugin, shared memory,
+# process pools, webbrowser) are imported where they are used, so they don't
+# slow down startup.
+
+# Global variables
+RECENT_FILES = []
+MAX_RECENT = 10
+PRESETS = {}
+APP_VERSION = "1.0.0"
+DEFAULT_SETTINGS = {
+    "recent_files": [],
+    "recent_folders": [],
+    "presets": {},
+    "last_output_dir": "",
+    "theme": "light",
+    "preserve_metadata": True,
+    "overwrite_existing": False,
+    "custom_naming": "{filename}_converted",
+    "default_format": "png",
+    "processing_engine": "lut",
+    "batch_workers": 0,
+    "memory_budget_mb": 0,
+    "worker_processes": 0,
+    "queue_order": "fifo",
+    "profile_slow_files": False,
+    "profile_threshold": 10.0,
+    "profile_dir": ""
+}
+SETTINGS_FILE = os.path.join(os.path.expanduser("~"), ".image_converter_settings.json")
+# One journal per batch, named after its input files and where its outputs go
+JOURNAL_DIR = os.path.join(os.path.expanduser("~"), ".image_converter_journals")
+PLAN_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".image_converter_cache")
+
+# Outputs are written under this suffix and renamed once complete
+PARTIAL_SUFFIX = ".part"
+
+# Supported input file extensions
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".tiff", ".tif", ".bmp", ".gif")
+
+# Archives of images accepted as inputs and output targets
+ARCHIVE_EXTENSIONS = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+
+# Built-in presets
+DEFAULT_PRESETS = {
+    "logo_black": {
+        "background_mode": "black",
+        "tolerance": 15,
+        "invert_colors": True,
+        "resize": False,
+        "crop": False,
+        "adjust_alpha": False,
+        "replace_background": False,
+        "output_format": "png",
+        "output_quality": 95,
+        "output_optimize": True
+    },
+    "logo_white": {
+        "background_mode": "white",
+        "tolerance": 15,
+        "invert_colors": True,
+        "resize": False,
+        "crop": False,
+        "adjust_alpha": False,
+        "replace_background": False,
+        "output_format": "png",
+        "output_quality": 95,
+        "output_optimize": True
+    },
+    "product": {
+        "background_mode": "white",
+        "tolerance": 25,
+        "invert_colors": False,
+        "resize": True,
+        "width": "800",
+        "height": "800",
+        "crop": False,
+        "adjust_alpha": False,
+        "replace_background": True,
+        "replacement_color": "#FFFFFF",
+        "output_format": "png",
+        "output_quality": 90,
+        "output_optimize": True
+    }
+}
+
+# Processing options used when nothing else is set (headless runs, presets)
+DEFAULT_OPTIONS = {
+    "background_mode": "black",
+    "custom_color": (0, 0, 0),
+    "tolerance": 15,
+    "auto_detect": False,
+    "resize": False,
+    "width": 0,
+    "height": 0,
+    "crop": False,
+    "crop_left": 0,
+    "crop_top": 0,
+    "crop_right": 100,
+    "crop_bottom": 100,
+    "invert_colors": True,
+    "adjust_alpha": False,
+    "alpha_value": 255,
+    "replace_background": False,
+    "replacement_color": (255, 255, 255),
+    "key_colors": [],
+    "key_ranges": []
+}
+
+
+# Startup phases as (name, seconds since STARTUP_START)
+STARTUP_TIMES = []
+
+
+def mark_startup(phase):
+    """Record that a startup phase has finished"""
+    STARTUP_TIMES.append((phase, time.perf_counter() - STARTUP_START))
+
+
+# Load settings
+def load_settings():
+    try:
+        if os.path.exists(SETTINGS_FILE):
+            with open(SETTINGS_FILE, 'r') as f:
+                return json.load(f)
+        return DEFAULT_SETTINGS.copy()
+    except Exception as e:
+        print(f"Error loading settings: {e}")
+        return DEFAULT_SETTINGS.copy()
+
+
+# Save settings
+def save_settings(settings):
+    try:
+        with open(SETTINGS_FILE, 'w') as f:
+            json.dump(settings, f, indent=2)
+    except Exception as e:
+        print(f"Error saving settings: {e}")
+
+
+# Initialize settings
+mark_startup("imports")
+settings = load_settings()
+mark_startup("settings")
+
+
+def hex_to_rgb(color):
+    """Convert a "#rrggbb" string to an (r, g, b) tuple"""
+    color = color.lstrip("#")
+    return tuple(int(color[i:i + 2], 16) for i in (0, 2, 4))
+
+
+def get_preset(preset_name):
+    """Return a saved preset, falling back to the built-in ones"""
+    return settings.get("presets", {}).get(preset_name, DEFAULT_PRESETS.get(preset_name))
+
+
+def preset_to_options(preset):
+    """Turn a stored preset (or options read back from JSON) into processing options"""
+    options = dict(DEFAULT_OPTIONS, engine=settings.get("processing_engine", DEFAULT_ENGINE))
+    for key in options:
+        if key in preset:
+            options[key] = preset[key]
+
+    for key in ("custom_color", "replacement_color"):
+        if isinstance(options[key], str):
+            options[key] = hex_to_rgb(options[key])
+        elif isinstance(options[key], list):
+            options[key] = tuple(options[key])
+    for key in ("width", "height"):
+        try:
+            options[key] = int(options[key] or 0)
+        except ValueError:
+            options[key] = 0
+    return options
+
+
+class FrozenOptions(dict):
+    """A read-only snapshot of processing options or output settings.
+
+    Batches, the preview and library calls each take one when they start and
+    share it between threads and processes. Nested lists and dicts (such as
+    the extra key colours) are frozen too, so a snapshot can't change while
+    something is working from it; dict(options, key=value) gives a changed,
+    ordinary copy.
+    """
+
+    __slots__ = ()
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("Options snapshots are read-only; use dict(options, ...) for a changed copy")
+
+    __setitem__ = __delitem__ = __ior__ = clear = pop = popitem = setdefault = update = _read_only
+
+    def __reduce__(self):
+        return FrozenOptions, (dict(self),)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+def freeze_options(options):
+    """Take a read-only snapshot of options, freezing nested lists into tuples"""
+    def freeze(value):
+        if isinstance(value, dict):
+            return FrozenOptions((key, freeze(item)) for key, item in value.items())
+        if isinstance(value, (list, tuple)):
+            return tuple(freeze(item) for item in value)
+        return value
+
+    if options is None or isinstance(options, FrozenOptions):
+        return options
+    return freeze(options)
+
+
+def parse_output_set(widths, formats=""):
+    """Parse comma-separated widths and formats for a responsive output set.
+
+    Returns the widths, largest first, and the format extensions. Anything
+    that isn't a width or a known format raises an Exception.
+    """
+    try:
+        sizes = sorted({int(width) for width in widths.replace(",", " ").split()}, reverse=True)
+    except ValueError:
+        raise Exception(f"Invalid output widths: {widths!r}")
+    format_list = [fmt.lower().lstrip(".") for fmt in formats.replace(",", " ").split()]
+    for fmt in format_list:
+        if fmt not in ImageProcessor.FORMAT_MAP:
+            raise Exception(f"Invalid output format: {fmt!r}")
+    if any(width <= 0 for width in sizes):
+        raise Exception(f"Invalid output widths: {widths!r}")
+    return sizes, format_list
+
+
+def collect_image_files(paths):
+    """Expand files and folders into the list of supported image files"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for filename in sorted(os.listdir(path)):
+                if filename.lower().endswith(IMAGE_EXTENSIONS):
+                    files.append(os.path.join(path, filename))
+        elif path.lower().endswith(IMAGE_EXTENSIONS) or is_archive(path):
+            files.append(path)
+    return files
+
+
+def is_archive(path):
+    """Whether a path names a zip or tar archive"""
+    return path.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def split_archive_name(filename):
+    """Split a file name into stem and extension, treating .tar.gz and the like as one extension"""
+    lower = filename.lower()
+    for extension in ARCHIVE_EXTENSIONS:
+        if lower.endswith(extension):
+            return filename[:-len(extension)], filename[-len(extension):]
+    return os.path.splitext(filename)
+
+
+def render_output_name(input_path, naming_pattern="{filename}_converted", counter=1, preset=None, now=None):
+    """Fill in a naming pattern for an input file, giving the output name without folder or extension"""
+    pattern = naming_pattern or "{filename}_converted"
+    if preset and "{preset}" not in pattern:
+        pattern += "_{preset}"
+    now = now or datetime.now()
+
+    output_filename = pattern.replace("{filename}", split_archive_name(os.path.basename(input_path))[0])
+    output_filename = output_filename.replace("{date}", now.strftime("%Y%m%d"))
+    output_filename = output_filename.replace("{time}", now.strftime("%H%M%S"))
+    output_filename = output_filename.replace("{counter}", str(counter))
+    return output_filename.replace("{preset}", preset or "")
+
+
+def output_set_paths(output_path, widths, formats, manifest=False):
+    """The files a responsive output set saved under output_path is written to, manifest last"""
+    base, _ = os.path.splitext(output_path)
+    paths = [f"{base}-{width}w.{format_option.lower()}" for width in widths for format_option in formats]
+    if manifest:
+        paths.append(f"{base}.srcset.json")
+    return paths
+
+
+def build_output_path(input_path, output_format, output_dir=None, naming_pattern="{filename}_converted",
+                      overwrite=False, reserved=(), preset=None, sizes=None, formats=None, manifest=False):
+    """Generate the output path for an input file.
+
+    Without an output directory the file goes into a "converted" folder next
+    to the input. A counter is bumped until the name is free; existing files
+    don't count when overwriting, but paths in reserved (planned for other
+    files of the same batch) always do. With a preset name, {preset} in the
+    pattern is replaced by it, or it is appended if the pattern lacks one.
+    With output set sizes, the name is free only if every file of the set
+    (see output_set_paths) is.
+    """
+    directory = os.path.dirname(input_path)
+
+    if not output_dir:
+        output_dir = os.path.join(directory, "converted")
+
+    # Create directory if it doesn't exist
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Generate filename using pattern
+    pattern = naming_pattern or "{filename}_converted"
+    if preset and "{preset}" not in pattern:
+        pattern += "_{preset}"
+    now = datetime.now()
+
+    def render(counter):
+        output_filename = render_output_name(input_path, pattern, counter, preset, now)
+        return os.path.join(output_dir, f"{output_filename}.{output_format}")
+
+    output_path = render(1)
+
+    def set_exists(path):
+        # Widths beyond the image's own are saved at its width, so any width of the set counts
+        import glob
+        import re
+
+        base = os.path.splitext(path)[0]
+        for format_option in formats or [output_format]:
+            for existing in glob.glob(f"{glob.escape(base)}-*w.{format_option.lower()}"):
+                if re.fullmatch(r"-\d+w", os.path.splitext(existing)[0][len(base):]):
+                    return True
+        return False
+
+    def taken(path):
+        if not sizes:
+            return path in reserved or (not overwrite and os.path.exists(path))
+        files = [path] + output_set_paths(path, sizes, formats or [output_format], manifest)
+        if any(file in reserved for file in files):
+            return True
+        return not overwrite and (set_exists(path) or (manifest and os.path.exists(files[-1])))
+
+    # Handle file exists
+    if taken(output_path):
+        if "{counter}" not in pattern:
+            # Without a counter in the pattern every name would be the same
+            pattern += "_{counter}"
+        counter = 1
+        while taken(output_path):
+            output_path = render(counter)
+            counter += 1
+
+    return output_path
+
+
+# Header probing
+
+# Threads reading file headers for the queue and for planning batches
+PROBE_WORKERS = 4
+# Probed files remembered, so the queue, the scheduler and the memory budget share one header read
+PROBE_CACHE_SIZE = 50000
+_PROBES = OrderedDict()
+_PROBES_LOCK = threading.Lock()
+
+
+def probe_image(source):
+    """Read an image's size, mode, format and frame count from its header, without decoding pixels.
+
+    Probes of paths are remembered until the file changes and include the
+    file size. Archives give only their type and size. Unreadable files raise
+    an Exception.
+    """
+    if not isinstance(source, str):
+        return read_header(source)
+
+    stat = os.stat(source)
+    key = os.path.abspath(source)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    with _PROBES_LOCK:
+        cached = _PROBES.get(key)
+        if cached and cached[0] == signature:
+            _PROBES.move_to_end(key)
+            return dict(cached[1])
+
+    if is_archive(source):
+        extension = split_archive_name(os.path.basename(source))[1]
+        info = {"width": 0, "height": 0, "mode": "", "bands": 0, "format": extension.lstrip(".").upper(),
+                "frames": 0}
+    else:
+        info = read_header(source)
+    info["bytes"] = stat.st_size
+
+    with _PROBES_LOCK:
+        _PROBES[key] = (signature, info)
+        if len(_PROBES) > PROBE_CACHE_SIZE:
+            _PROBES.popitem(last=False)
+    return dict(info)
+
+
+def read_header(source):
+    """Open an image just far enough to read its header"""
+    try:
+        with STAGE_STATS.time("probe"):
+            with Image.open(source) as im:
+                return {"width": im.width, "height": im.height, "mode": im.mode, "bands": len(im.getbands()),
+                        "format": im.format or "", "frames": getattr(im, "n_frames", 1)}
+    except Exception as e:
+        raise Exception(f"Failed to read image header: {str(e)}")
+
+
+def probe_files(paths, control=None):
+    """Probe many files at once on a few threads, giving None for those that can't be read.
+
+    Given a BatchControl, each probe waits while the batch is paused and
+    BatchCancelled is raised once it is cancelled.
+    """
+    def probe(path):
+        if control:
+            control.checkpoint()
+        try:
+            return probe_image(path)
+        except Exception:
+            return None
+
+    paths = list(dict.fromkeys(paths))
+    if len(paths) < 2:
+        return {path: probe(path) for path in paths}
+    with ThreadPoolExecutor(max_workers=PROBE_WORKERS) as pool:
+        return dict(zip(paths, pool.map(probe, paths)))
+
+
+def probe_pixels(info):
+    """Pixels a probed image holds over all its frames, or None if unknown (archives and unreadable files)"""
+    if not info or not info["width"]:
+        return None
+    return info["width"] * info["height"] * info["frames"]
+
+
+def format_file_size(size):
+    """A byte count in KB, MB or GB"""
+    for unit in ("bytes", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "bytes" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+# Queue columns filled in from the file headers
+QUEUE_PROBE_COLUMNS = ("dimensions", "mode", "format", "frames", "file_size")
+
+
+class HeaderProber:
+    """Probes queued files on a few background threads and hands the results out in bulk.
+
+    The UI submits files as they are queued and collects the finished probes
+    with flush() on its own thread, at its own pace, like BatchProgress.
+    """
+
+    def __init__(self, workers=PROBE_WORKERS):
+        self.workers = workers
+        self._executor = None
+        self._pending = 0
+        self._results = {}
+        self._lock = threading.Lock()
+
+    @property
+    def busy(self):
+        """Whether probes are still running or waiting to be flushed"""
+        with self._lock:
+            return self._pending > 0 or bool(self._results)
+
+    def submit(self, item_id, file_path):
+        """Probe a file in the background"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers)
+        with self._lock:
+            self._pending += 1
+        self._executor.submit(self._probe, item_id, file_path)
+
+    def flush(self):
+        """Return {item_id: probe, or None if unreadable} for the probes finished since the last flush"""
+        with self._lock:
+            results, self._results = self._results, {}
+            return results
+
+    def _probe(self, item_id, file_path):
+        try:
+            info = probe_image(file_path)
+        except Exception:
+            info = None
+        with self._lock:
+            self._pending -= 1
+            self._results[item_id] = info
+
+
+# Stage timing
+
+class StageTimer:
+    """Times one run of a stage; set nbytes inside the block if the size is only known there"""
+
+    __slots__ = ("stats", "name", "nbytes", "start")
+
+    def __init__(self, stats, name, nbytes):
+        self.stats = stats
+        self.name = name
+        self.nbytes = nbytes
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.stats.add(self.name, time.perf_counter() - self.start, self.nbytes)
+        return False
+
+
+class StageStats:
+    """Call counts, time and bytes for each stage of loading, processing and saving.
+
+    Timing a stage costs two clock reads and a short locked update, so the
+    stats are always on. Collectors attached with attach() get a copy of
+    every record while attached; that is how a batch gathers its own totals.
+    """
+
+    def __init__(self):
+        self._stages = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def time(self, name, nbytes=0):
+        """Context manager timing one run of a stage"""
+        return StageTimer(self, name, nbytes)
+
+    def add(self, name, seconds, nbytes=0):
+        """Record one run of a stage"""
+        with self._lock:
+            stage = self._stages.get(name)
+            if stage is None:
+                stage = self._stages[name] = [0, 0.0, 0.0, 0]
+            stage[0] += 1
+            stage[1] += seconds
+            stage[2] = max(stage[2], seconds)
+            stage[3] += nbytes
+            collectors = self._collectors
+        for collector in collectors:
+            collector.add(name, seconds, nbytes)
+
+    def attach(self, collector):
+        """Copy every record from now on into another StageStats"""
+        with self._lock:
+            self._collectors = self._collectors + [collector]
+
+    def detach(self, collector):
+        """Stop copying records into a collector"""
+        with self._lock:
+            self._collectors = [other for other in self._collectors if other is not collector]
+
+    def snapshot(self):
+        """Return {stage: {"count", "seconds", "max_ms", "bytes", "share"}}, slowest stage first"""
+        with self._lock:
+            stages = {name: list(values) for name, values in self._stages.items()}
+        total = sum(seconds for _, seconds, _, _ in stages.values()) or 1.0
+        return {
+            name: {"count": count, "seconds": round(seconds, 6), "max_ms": round(longest * 1000, 3),
+                   "bytes": nbytes, "share": round(seconds / total, 4)}
+            for name, (count, seconds, longest, nbytes) in sorted(stages.items(), key=lambda item: -item[1][1])
+        }
+
+    def save_json(self, path, **extra):
+        """Write the snapshot, plus any extra fields, as a JSON file"""
+        report = dict(extra, version=APP_VERSION, stages=self.snapshot())
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+            return path
+        except Exception as e:
+            raise Exception(f"Failed to save stage stats: {str(e)}")
+
+
+# Totals for everything processed in this process
+STAGE_STATS = StageStats()
+
+
+# Profiling slow files
+
+# Stack depth kept for each traced allocation
+PROFILE_FRAMES = 10
+
+
+class SlowFileProfiler:
+    """Profiles each file of a batch and keeps the reports of the slow ones.
+
+    Every file runs under cProfile while tracemalloc traces allocations, but
+    only files taking at least `threshold` seconds have a report written: a
+    .prof file for pstats (or any viewer reading that format) and a .txt file
+    with the hottest functions and the top allocation sites. Reports go to
+    `directory`, or to a "profiles" folder beside the file's output.
+
+    tracemalloc traces the whole process, so allocation sites include files
+    processed at the same time. Where the interpreter allows only one active
+    profiler, a file starting while another is profiled is timed but not
+    profiled.
+    """
+
+    def __init__(self, threshold, directory=None, top=25):
+        self.threshold = threshold
+        self.directory = directory
+        self.top = top
+        self._started_tracing = False
+
+    def start(self):
+        """Begin tracing allocations for a batch"""
+        import tracemalloc
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(PROFILE_FRAMES)
+            self._started_tracing = True
+
+    def stop(self):
+        """Stop tracing allocations, if start() began it"""
+        import tracemalloc
+
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def run(self, file_path, output_dir, func, *args):
+        """Call func(*args) for one file, writing a report if it turns out slow"""
+        import cProfile
+        import tracemalloc
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another file is being profiled and the interpreter allows only one
+            profile = None
+        before = None
+        if tracemalloc.is_tracing():
+            before = tracemalloc.take_snapshot()
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        error = None
+        try:
+            return func(*args)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            if profile:
+                profile.disable()
+            if elapsed >= self.threshold:
+                after = None
+                if before is not None and tracemalloc.is_tracing():
+                    after = tracemalloc.take_snapshot()
+                    after.peak = tracemalloc.get_traced_memory()[1]
+                try:
+                    report = self.write_report(file_path, self.directory or os.path.join(output_dir, "profiles"),
+                                               elapsed, profile, before, after, error)
+                    print(f"Profiled slow file {file_path} ({elapsed:.1f} s): {report}")
+                except Exception as e:
+                    print(f"Error writing profile for {file_path}: {str(e)}")
+
+    def write_report(self, file_path, directory, elapsed, profile, before, after, error=None):
+        """Write the .prof and .txt report of one file, returning the text report's path"""
+        import io
+        import pstats
+
+        try:
+            os.makedirs(directory, exist_ok=True)
+            stem = os.path.join(directory, f"{os.path.basename(file_path)}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}")
+
+            lines = [f"File: {file_path}", f"Time: {elapsed:.3f} s"]
+            if error is not None:
+                lines.append(f"Error: {error!r}")
+            try:
+                with Image.open(file_path) as im:
+                    lines.append(f"Image: {im.format} {im.mode} {im.width}x{im.height}, "
+                                 f"{getattr(im, 'n_frames', 1)} frame(s)")
+            except Exception:
+                pass
+
+            if profile is not None:
+                profile.dump_stats(stem + ".prof")
+                text = io.StringIO()
+                pstats.Stats(profile, stream=text).sort_stats("cumulative").print_stats(self.top)
+                lines += ["", "Hottest functions (cumulative time)", text.getvalue()]
+            else:
+                lines += ["", "Not profiled: another file was being profiled at the same time"]
+
+            if after is not None:
+                import tracemalloc
+
+                # Leave out the profiler's own bookkeeping
+                noise = [tracemalloc.Filter(False, pattern) for pattern in
+                         ("<frozen importlib._bootstrap*>", tracemalloc.__file__, "*/linecache.py")]
+                stats = after.filter_traces(noise).compare_to(before.filter_traces(noise), "lineno")
+                lines += ["", f"Peak traced Python memory: {after.peak / (1024 * 1024):.1f} MB",
+                          "", "Top allocation sites (growth while the file was processed)"]
+                lines += [str(stat) for stat in stats[:self.top]]
+
+            with open(stem + ".txt", "w", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+            return stem + ".txt"
+        except Exception as e:
+            raise Exception(f"Failed to save profile: {str(e)}")
+
+
+def slow_file_profiler():
+    """A SlowFileProfiler from the settings, or None when profiling is off"""
+    if not settings.get("profile_slow_files"):
+        return None
+    return SlowFileProfiler(float(settings.get("profile_threshold") or 0), settings.get("profile_dir") or None)
+
+# Processing engines: "reference" is the original per-pixel Python loop,
+# "lut" keys custom colours with precomputed lookup tables applied in C
+PROCESSING_ENGINES = ("reference", "lut")
+DEFAULT_ENGINE = "lut"
+
+
+def remove_partial(temp_path):
+    """Delete a half-written output file, if there is one"""
+    if temp_path and os.path.exists(temp_path):
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+
+
+def _image_math(expression, **operands):
+    """Evaluate an ImageMath expression on both old and new Pillow versions"""
+    if hasattr(ImageMath, "unsafe_eval"):
+        return ImageMath.unsafe_eval(expression, **operands)
+    return ImageMath.eval(expression, **operands)
+
+
+def _custom_color_distance(dr, dg, db):
+    """Colour distance exactly as the reference custom-colour loop computes it"""
+    return (
+                   (dr / 255) ** 2 +
+                   (dg / 255) ** 2 +
+                   (db / 255) ** 2
+           ) ** 0.5
+
+
+# Thresholds worked out so far, or installed from a compiled plan, by tolerance
+_THRESHOLDS = {}
+
+
+def custom_color_thresholds(tolerance):
+    """Return the cached keying thresholds for a tolerance, working them out once"""
+    thresholds = _THRESHOLDS.get(tolerance)
+    if thresholds is None:
+        thresholds = _THRESHOLDS.setdefault(tolerance, compute_custom_color_thresholds(tolerance))
+    return thresholds
+
+
+def compute_custom_color_thresholds(tolerance):
+    """Work out which squared channel distances are keyed at a tolerance.
+
+    Returns (threshold, boundary): every pixel whose summed squared channel
+    distance is <= threshold is keyed, and boundary maps the few sums that sit
+    on the float rounding edge to the set of (dr, dg, db) triples the reference
+    formula keys. Only the sums next to (tolerance * 255) ** 2 can be ambiguous,
+    so only those are checked triple by triple.
+    """
+    limit = tolerance / 100.0
+    exact = (limit * 255) ** 2
+    low = max(0, math.floor(exact) - 1)
+    high = min(3 * 255 * 255, math.ceil(exact) + 1)
+
+    threshold = low - 1
+    boundary = {}
+    for total in range(low, high + 1):
+        keyed = set()
+        count = 0
+        for dr in range(256):
+            rest_r = total - dr * dr
+            if rest_r < 0:
+                break
+            for dg in range(256):
+                rest = rest_r - dg * dg
+                if rest < 0:
+                    break
+                db = math.isqrt(rest)
+                if db > 255 or db * db != rest:
+                    continue
+                count += 1
+                if _custom_color_distance(dr, dg, db) < limit:
+                    keyed.add((dr, dg, db))
+
+        if count and len(keyed) == count and not boundary:
+            # Everything up to here is keyed, so just raise the threshold
+            threshold = total
+        elif keyed:
+            boundary[total] = frozenset(keyed)
+
+    return threshold, boundary
+
+
+class CustomColorKey:
+    """Lookup tables that decide which pixels match a custom key colour.
+
+    Whether a pixel is keyed depends only on its RGB value, so the reference
+    distance test is worked out once per (key colour, tolerance). Per-channel
+    ``Image.point`` tables give the squared distance to the key, ``ImageMath``
+    sums and thresholds them in C, and the rare pixels on the rounding edge are
+    settled with the reference formula.
+    """
+
+    def __init__(self, key_color, tolerance):
+        self.key_color = tuple(int(c) for c in key_color[:3])
+        self.tolerance = tolerance
+        self.tables = [[(value - c) ** 2 for value in range(256)] for c in self.key_color]
+        self.threshold, self.boundary = custom_color_thresholds(tolerance)
+
+    @staticmethod
+    def supports(key_color):
+        """The tables need whole-number key channels like the colour picker returns"""
+        try:
+            return all(float(c).is_integer() and 0 <= c <= 255 for c in key_color[:3])
+        except (TypeError, ValueError):
+            return False
+
+    def mask(self, image):
+        """Return an "L" mask that is 255 where the image matches the key colour"""
+        channels = image.convert("RGB").split()
+        squares = [channel.point(table, "I") for channel, table in zip(channels, self.tables)]
+        distance = _image_math("r + g + b", r=squares[0], g=squares[1], b=squares[2])
+
+        mask = _image_math("convert(d <= t, 'L')", d=distance, t=self.threshold)
+        mask = mask.point([0] + [255] * 255)
+
+        for total, keyed in self.boundary.items():
+            edge = _image_math("convert(d == t, 'L')", d=distance, t=total)
+            bbox = edge.getbbox()
+            if bbox is None:
+                continue
+
+            # Settle the rounding-edge pixels one by one against the reference
+            edge_pixels = edge.load()
+            rgb_pixels = image.load()
+            mask_pixels = mask.load()
+            cr, cg, cb = self.key_color
+            for y in range(bbox[1], bbox[3]):
+                for x in range(bbox[0], bbox[2]):
+                    if edge_pixels[x, y]:
+                        r, g, b = rgb_pixels[x, y][:3]
+                        if (abs(r - cr), abs(g - cg), abs(b - cb)) in keyed:
+                            mask_pixels[x, y] = 255
+
+        return mask
+
+
+@lru_cache(maxsize=32)
+def get_custom_color_key(key_color, tolerance):
+    """Return the cached lookup tables for a key colour and tolerance"""
+    return CustomColorKey(key_color, tolerance)
+
+
+@lru_cache(maxsize=65536)
+def _pillow_hsv(r, g, b):
+    """HSV bytes for one colour, converted the same way Pillow converts images"""
+    return Image.new("RGB", (1, 1), (r, g, b)).convert("HSV").getpixel((0, 0))
+
+
+def _range_table(low, high):
+    """Point table that is 255 inside [low, high], wrapping around when low > high"""
+    if low <= high:
+        return [255 if low <= value <= high else 0 for value in range(256)]
+    return [255 if value >= low or value <= high else 0 for value in range(256)]
+
+
+def normalize_key_range(key_range):
+    """Turn an HSV range in degrees and percent into Pillow HSV byte bounds"""
+    hue = key_range.get("hue", (0, 360))
+    saturation = key_range.get("saturation", (0, 100))
+    value = key_range.get("value", (0, 100))
+    return tuple(
+        tuple(round(min(max(bound, 0), full) / full * 255) for bound in bounds)
+        for bounds, full in ((hue, 360), (saturation, 100), (value, 100))
+    )
+
+
+def color_key_spec(options, include_primary=True):
+    """Collect the custom mode key colours and HSV ranges as hashable tuples"""
+    key_colors = []
+    if include_primary:
+        key_colors.append((tuple(int(c) for c in options["custom_color"][:3]), options["tolerance"]))
+    for key in options.get("key_colors") or []:
+        key_colors.append((tuple(int(round(c)) for c in key["color"][:3]), int(key["tolerance"])))
+
+    key_ranges = tuple(normalize_key_range(key_range) for key_range in options.get("key_ranges") or [])
+    return tuple(key_colors), key_ranges
+
+
+class ColorKeyMatcher:
+    """Match pixels against several key colours and HSV ranges at once.
+
+    With only a few keys each one is applied as its own C pass. Past that the
+    keys are folded into a colour-cube bitmap holding one byte per RGB value,
+    so matching an image costs a single lookup per pixel however many keys
+    and ranges there are.
+    """
+
+    # Number of keys and ranges at which the cube beats one pass per key: a
+    # pass costs about 70 ms per 4 MP image, a cube lookup 0.7-1 s however
+    # many keys there are, and building the cube 0.3-1 s
+    CUBE_MIN_KEYS = 12
+
+    def __init__(self, key_colors=(), key_ranges=()):
+        self.key_colors = key_colors
+        self.key_ranges = key_ranges
+        self._cube = None
+        self._cube_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.key_colors) + len(self.key_ranges)
+
+    @property
+    def nbytes(self):
+        """Memory held by the colour cube, if it has been built"""
+        cube = self._cube
+        return len(cube) if cube is not None else 0
+
+    def matches(self, r, g, b):
+        """Check a single colour, evaluated exactly like the image masks"""
+        for (cr, cg, cb), tolerance in self.key_colors:
+            if _custom_color_distance(r - cr, g - cg, b - cb) < tolerance / 100.0:
+                return True
+
+        if self.key_ranges:
+            hsv = _pillow_hsv(r, g, b)
+            for bounds in self.key_ranges:
+                if all(low <= v <= high if low <= high else (v >= low or v <= high)
+                       for v, (low, high) in zip(hsv, bounds)):
+                    return True
+        return False
+
+    def mask(self, image):
+        """Return an "L" mask that is 255 where any key or range matches"""
+        if len(self) >= self.CUBE_MIN_KEYS:
+            return self._cube_mask(image)
+        return self._direct_mask(image)
+
+    def _direct_mask(self, image, key_colors=None):
+        """OR together one C pass per key colour and HSV range"""
+        key_colors = self.key_colors if key_colors is None else key_colors
+        mask = Image.new("L", image.size, 0)
+        for color, tolerance in key_colors:
+            mask = ImageChops.lighter(mask, get_custom_color_key(color, tolerance).mask(image))
+
+        if self.key_ranges:
+            hsv = image.convert("RGB").convert("HSV").split()
+            for bounds in self.key_ranges:
+                tables = [channel.point(_range_table(low, high)) for channel, (low, high) in zip(hsv, bounds)]
+                in_range = ImageChops.multiply(ImageChops.multiply(tables[0], tables[1]), tables[2])
+                mask = ImageChops.lighter(mask, in_range)
+        return mask
+
+    @property
+    def cube(self):
+        """The colour-cube bitmap, indexed by r << 16 | g << 8 | b"""
+        with self._cube_lock:
+            built = self._cube is None
+            if built:
+                self._cube = self._build_cube()
+            cube = self._cube
+        if built:
+            _trim_matchers()
+        return cube
+
+    def load_cube(self, cube):
+        """Use a cube built earlier, such as one from a compiled plan, returning the cube in use"""
+        with self._cube_lock:
+            loaded = self._cube is None
+            if loaded:
+                self._cube = cube
+            cube = self._cube
+        if loaded:
+            _trim_matchers()
+        return cube
+
+    def _build_cube(self):
+        """Fill the cube one red plane at a time, reusing the image mask code"""
+        cube = bytearray(1 << 24)
+        green = Image.linear_gradient("L")
+        blue = green.transpose(Image.TRANSPOSE)
+
+        for red in range(256):
+            # Only the keys whose sphere reaches this red plane take part
+            plane_keys = []
+            for color, tolerance in self.key_colors:
+                threshold, boundary = custom_color_thresholds(tolerance)
+                largest = max([threshold] + list(boundary))
+                if largest >= 0 and abs(red - color[0]) <= math.isqrt(largest):
+                    plane_keys.append((color, tolerance))
+
+            if not plane_keys and not self.key_ranges:
+                continue
+
+            plane = Image.merge("RGB", (Image.new("L", (256, 256), red), green, blue))
+            cube[red << 16:(red + 1) << 16] = self._direct_mask(plane, plane_keys).tobytes()
+        return cube
+
+    def _cube_mask(self, image):
+        """Look every pixel up in the cube with a single C-level map"""
+        r, g, b = image.convert("RGB").split()
+        zero = Image.new("L", image.size, 0)
+        order = (b, g, r, zero) if sys.byteorder == "little" else (zero, r, g, b)
+        packed = memoryview(Image.merge("RGBA", order).tobytes()).cast("I")
+        return Image.frombytes("L", image.size, bytes(map(self.cube.__getitem__, packed)))
+
+
+# Matchers kept for reuse, least recently used first. The cache is bounded by
+# the size of their 16 MiB colour cubes, and matchers without one by count
+MATCHER_CACHE_BYTES = 64 << 20
+MATCHER_CACHE_SIZE = 256
+_MATCHERS = OrderedDict()
+_MATCHERS_LOCK = threading.Lock()
+
+
+def get_color_key_matcher(key_colors, key_ranges):
+    """Return the cached matcher for a set of key colours and HSV ranges"""
+    key = (key_colors, key_ranges)
+    with _MATCHERS_LOCK:
+        matcher = _MATCHERS.get(key)
+        if matcher is None:
+            matcher = _MATCHERS[key] = ColorKeyMatcher(key_colors, key_ranges)
+        _MATCHERS.move_to_end(key)
+    _trim_matchers()
+    return matcher
+
+
+def _trim_matchers():
+    """Drop the least recently used matchers until the cache is within its limits"""
+    with _MATCHERS_LOCK:
+        total = sum(matcher.nbytes for matcher in _MATCHERS.values())
+        # The most recently used matcher always stays
+        while len(_MATCHERS) > 1 and (total > MATCHER_CACHE_BYTES or len(_MATCHERS) > MATCHER_CACHE_SIZE):
+            _, matcher = _MATCHERS.popitem(last=False)
+            total -= matcher.nbytes
+
+
+class ImageProcessor:
+    """Decodes, processes and encodes images.
+
+    It keeps no state between calls: every method works only on the images
+    and option snapshots it is given, so one instance can serve the preview
+    and any number of batch workers at the same time. The image being edited
+    belongs to the UI.
+    """
+
+    # Output formats by file extension
+    FORMAT_MAP = {
+        "png": "PNG",
+        "jpg": "JPEG",
+        "jpeg": "JPEG",
+        "webp": "WEBP",
+        "tiff": "TIFF",
+        "bmp": "BMP"
+    }
+
+    # Output formats that can hold several frames or pages
+    MULTI_FRAME_FORMATS = ("PNG", "WEBP", "TIFF")
+
+    # GIF disposal methods mapped onto their APNG equivalents
+    APNG_DISPOSAL = {0: 0, 1: 0, 2: 1, 3: 2}
+    # Larger images are keyed in strips of about this many pixels
+    TILE_PIXELS = 1 << 20
+
+    def load_image(self, image_path):
+        try:
+            with STAGE_STATS.time("decode") as timer:
+                image = Image.open(image_path)
+                image.load()
+                timer.nbytes = self._source_size(image_path)
+            with STAGE_STATS.time("convert", image.width * image.height * 4):
+                return image.convert("RGBA")
+        except Exception as e:
+            raise Exception(f"Failed to load image: {str(e)}")
+
+    @staticmethod
+    def _source_size(image_path):
+        try:
+            return os.path.getsize(image_path)
+        except (OSError, TypeError):
+            return 0
+
+    def process_image(self, image, options, control=None):
+        """Process an image with the given options"""
+        try:
+            if control:
+                control.checkpoint()
+
+            img, options = self.prepare_image(image, options)
+
+            # Process transparency and colors, strip by strip on large images
+            # so a pause or cancel is noticed between strips
+            rows = self.strip_rows(img.size)
+            if img.height <= rows:
+                img = self.process_pixels(img, options)
+            else:
+                for top in range(0, img.height, rows):
+                    if control:
+                        control.checkpoint()
+                    box = (0, top, img.width, min(img.height, top + rows))
+                    img.paste(self.process_pixels(img.crop(box), options), box)
+
+            return img
+
+        except BatchCancelled:
+            raise
+        except Exception as e:
+            raise Exception(f"Error processing image: {str(e)}")
+
+    def process_variants(self, image, options_list, control=None):
+        """Process one decoded image with several sets of options, returning one result each.
+
+        Variants with the same resize and crop share a single prepared image,
+        and variants keyed with the same colours share each strip's mask, so
+        work common to several presets is done once.
+        """
+        try:
+            if control:
+                control.checkpoint()
+
+            # Resize, crop and detect once per distinct geometry
+            prepared = {}
+            detected = {}
+            variants = []
+            for options in options_list:
+                geometry = self.geometry_key(options)
+                if geometry not in prepared:
+                    prepared[geometry] = self.prepare_image(image, dict(options, auto_detect=False))[0]
+                if options.get("auto_detect"):
+                    if geometry not in detected:
+                        detected[geometry] = self.detect_background(prepared[geometry])
+                    options = dict(options, **detected[geometry])
+                variants.append((geometry, options))
+
+            results = [Image.new("RGBA", prepared[geometry].size) for geometry, _ in variants]
+            for geometry, base in prepared.items():
+                members = [index for index, (other, _) in enumerate(variants) if other == geometry]
+                rows = self.strip_rows(base.size)
+                for top in range(0, base.height, rows):
+                    if control:
+                        control.checkpoint()
+                    box = (0, top, base.width, min(base.height, top + rows))
+                    strip = base.crop(box)
+                    masks = {}
+                    for index in members:
+                        results[index].paste(self.process_pixels(strip.copy(), variants[index][1], masks), box)
+
+            return results
+
+        except BatchCancelled:
+            raise
+        except Exception as e:
+            raise Exception(f"Error processing image: {str(e)}")
+
+    @staticmethod
+    def geometry_key(options):
+        """The resize and crop an image gets before keying, for grouping variants"""
+        size = None
+        if options["resize"] and options["width"] > 0 and options["height"] > 0:
+            size = (options["width"], options["height"])
+        box = None
+        if options["crop"]:
+            box = (options["crop_left"], options["crop_top"], options["crop_right"], options["crop_bottom"])
+        return size, box
+
+    def prepare_image(self, image, options):
+        """Resize, crop and detect the background, returning the image and final options"""
+        # Make a copy to avoid modifying the original
+        with STAGE_STATS.time("copy", image.width * image.height * 4):
+            img = image.copy()
+
+        # Resize if needed
+        if options["resize"] and options["width"] > 0 and options["height"] > 0:
+            with STAGE_STATS.time("resize", options["width"] * options["height"] * 4):
+                img = img.resize((options["width"], options["height"]), Image.LANCZOS)
+
+        # Crop if needed
+        if options["crop"]:
+            with STAGE_STATS.time("crop"):
+                img = img.crop((options["crop_left"], options["crop_top"],
+                                options["crop_right"], options["crop_bottom"]))
+
+        # Detect this image's own background if requested
+        if options.get("auto_detect"):
+            with STAGE_STATS.time("detect"):
+                options = dict(options, **self.detect_background(img))
+
+        return img, options
+
+    def strip_rows(self, size):
+        """Number of rows per strip when processing an image of the given size"""
+        return max(1, self.TILE_PIXELS // max(1, size[0]))
+
+    @staticmethod
+    def uses_lut(options):
+        """Whether the options are keyed by the lookup-table engine"""
+        return (options.get("engine", DEFAULT_ENGINE) == "lut" and options["background_mode"] == "custom"
+                and CustomColorKey.supports(options["custom_color"]))
+
+    def process_pixels(self, img, options, masks=None):
+        """Key, adjust alpha and replace the background of an image or one strip of it.
+
+        Every step here depends only on the pixel itself, so strips can be
+        processed separately, in any order or process. masks, if given, holds
+        key masks already worked out for this strip by other variants.
+        """
+        with STAGE_STATS.time("mask", img.width * img.height * 4):
+            if self.uses_lut(options):
+                img = self.key_custom_color_lut(img, options, masks)
+            else:
+                img = self.key_background_reference(img, options)
+
+        # Apply alpha adjustment if needed
+        if options["adjust_alpha"] and options["alpha_value"] < 255:
+            with STAGE_STATS.time("alpha", img.width * img.height * 4):
+                alpha_value = options["alpha_value"]
+                alpha_data = []
+                for item in img.getdata():
+                    r, g, b, a = item
+                    if a > 0:  # Only adjust non-transparent pixels
+                        new_alpha = min(a, alpha_value)
+                        alpha_data.append((r, g, b, new_alpha))
+                    else:
+                        alpha_data.append((r, g, b, a))
+                img.putdata(alpha_data)
+
+        # Apply background replacement if needed
+        if options["replace_background"]:
+            with STAGE_STATS.time("composite", img.width * img.height * 4):
+                bg_img = Image.new("RGBA", img.size, options["replacement_color"])
+                img = Image.alpha_composite(bg_img, img)
+
+        return img
+
+    def key_background_reference(self, img, options):
+        """Key out the background with the reference per-pixel loop"""
+        if options["background_mode"] == "custom":
+            # Custom color transparency
+            bg_color = options["custom_color"]
+            tolerance = options["tolerance"] / 100.0
+
+            # Additional key colours and HSV ranges, if any
+            extra_keys = None
+            if options.get("key_colors") or options.get("key_ranges"):
+                extra_keys = get_color_key_matcher(*color_key_spec(options, include_primary=False))
+
+            new_data = []
+            for item in img.getdata():
+                r, g, b, a = item
+
+                # Calculate color distance (simple Euclidean distance)
+                distance = (
+                                   ((r - bg_color[0]) / 255) ** 2 +
+                                   ((g - bg_color[1]) / 255) ** 2 +
+                                   ((b - bg_color[2]) / 255) ** 2
+                           ) ** 0.5
+
+                if distance < tolerance or (extra_keys and extra_keys.matches(r, g, b)):
+                    # Background → transparent
+                    new_data.append((0, 0, 0, 0))
+                elif options["invert_colors"]:
+                    # Invert non-background colors if requested
+                    new_data.append((255 - r, 255 - g, 255 - b, a))
+                else:
+                    # Keep original colors
+                    new_data.append((r, g, b, a))
+        else:
+            # Black or white background
+            new_data = []
+
+            if options["background_mode"] == "black":
+                # Black background
+                tolerance = options["tolerance"]
+                for item in img.getdata():
+                    r, g, b, a = item
+                    # Check if pixel is close to black
+                    if r <= tolerance and g <= tolerance and b <= tolerance:
+                        # Black background → transparent
+                        new_data.append((0, 0, 0, 0))
+                    elif options["invert_colors"]:
+                        if r > 240 and g > 240 and b > 240:
+                            # White → black
+                            new_data.append((0, 0, 0, 255))
+                        else:
+                            # Other colors → invert
+                            new_data.append((255 - r, 255 - g, 255 - b, a))
+                    else:
+                        # Keep original colors
+                        new_data.append((r, g, b, a))
+            else:
+                # White background
+                tolerance = 255 - options["tolerance"]
+                for item in img.getdata():
+                    r, g, b, a = item
+                    # Check if pixel is close to white
+                    if r >= tolerance and g >= tolerance and b >= tolerance:
+                        # White background → transparent
+                        new_data.append((0, 0, 0, 0))
+                    elif options["invert_colors"]:
+                        if r < 15 and g < 15 and b < 15:
+                            # Black → white
+                            new_data.append((255, 255, 255, 255))
+                        else:
+                            # Other colors → invert
+                            new_data.append((255 - r, 255 - g, 255 - b, a))
+                    else:
+                        # Keep original colors
+                        new_data.append((r, g, b, a))
+
+        img.putdata(new_data)
+        return img
+
+    def key_custom_color_lut(self, img, options, masks=None):
+        """Key out custom colours with lookup tables instead of a Python loop"""
+        spec = color_key_spec(options)
+        mask = masks.get(spec) if masks is not None else None
+        if mask is None:
+            # The primary key gets its own pass, so changing its tolerance
+            # leaves the extra keys' matcher (and any cube) as it is
+            mask = get_custom_color_key(*spec[0][0]).mask(img)
+            extra_keys = get_color_key_matcher(spec[0][1:], spec[1])
+            if len(extra_keys):
+                mask = ImageChops.lighter(mask, extra_keys.mask(img))
+            if masks is not None:
+                masks[spec] = mask
+
+        if options["invert_colors"]:
+            # Invert non-background colors, keeping the original alpha
+            alpha = img.getchannel("A")
+            img = ImageChops.invert(img.convert("RGB"))
+            img.putalpha(alpha)
+
+        # Background → transparent
+        img.paste((0, 0, 0, 0), mask=mask)
+        return img
+
+    def detect_background(self, image, proxy_size=256):
+        """Propose a background mode, key colour and tolerance for an image.
+
+        Works on a nearest-neighbour proxy so it stays fast on huge images. The
+        key colour is the per-channel median of the proxy's border, and the
+        tolerance sits at the first valley of the histogram of distances to it.
+        """
+        factor = max(1, max(image.size) // proxy_size)
+        proxy = image
+        if factor > 1:
+            proxy = image.resize((max(1, image.width // factor), max(1, image.height // factor)), Image.NEAREST)
+        proxy = proxy.convert("RGB")
+        width, height = proxy.size
+
+        # Sample a thin border all the way round the proxy
+        edge = max(1, min(width, height) // 64)
+        strips = [proxy.crop((0, 0, width, edge)), proxy.crop((0, height - edge, width, height)),
+                  proxy.crop((0, 0, edge, height)), proxy.crop((width - edge, 0, width, height))]
+        histogram = [sum(counts) for counts in zip(*(strip.histogram() for strip in strips))]
+        key_color = tuple(self._histogram_median(histogram[i * 256:(i + 1) * 256]) for i in range(3))
+
+        # Distance of every proxy pixel to the key, in the units the tolerance uses
+        r, g, b = proxy.split()
+        if max(key_color) <= 40:
+            mode = "black"
+            distance = ImageChops.lighter(ImageChops.lighter(r, g), b)
+        elif min(key_color) >= 215:
+            mode = "white"
+            distance = ImageChops.invert(ImageChops.darker(ImageChops.darker(r, g), b))
+        else:
+            mode = "custom"
+            squares = [channel.point([(value - c) ** 2 for value in range(256)], "I")
+                       for channel, c in zip((r, g, b), key_color)]
+            distance = _image_math("convert(min(float(r + g + b) ** 0.5 * (100 / 255.0), 255), 'L')",
+                                   r=squares[0], g=squares[1], b=squares[2])
+
+        # Smooth the distance histogram and walk down from the background peak
+        counts = distance.histogram()[:102]
+        smoothed = [sum(counts[max(0, i - 2):i + 3]) for i in range(len(counts))]
+        valley = max(reversed(range(51)), key=lambda i: smoothed[i])
+        while valley < 100 and smoothed[valley + 1] < smoothed[valley]:
+            valley += 1
+
+        # On a flat stretch, settle a little way in rather than at either end
+        flat_end = valley
+        while flat_end < 100 and smoothed[flat_end + 1] == smoothed[valley]:
+            flat_end += 1
+        tolerance = max(1, valley + min(10, (flat_end - valley) // 2))
+
+        return {"background_mode": mode, "custom_color": key_color, "tolerance": tolerance}
+
+    @staticmethod
+    def _histogram_median(counts):
+        """Median value of a 256-bin channel histogram"""
+        half = sum(counts) / 2
+        running = 0
+        for value, count in enumerate(counts):
+            running += count
+            if running >= half:
+                return value
+        return 0
+
+    def encoder_settings(self, format_option, quality=95, optimize=True):
+        """Resolve the Pillow format name and save parameters for an output format"""
+        format_name = self.FORMAT_MAP.get(format_option.lower(), "PNG")
+        if format_name == "JPEG":
+            return format_name, {"quality": quality, "optimize": optimize}
+        if format_name == "PNG":
+            return format_name, {"optimize": optimize}
+        if format_name == "WEBP":
+            return format_name, {"quality": quality, "lossless": quality > 90}
+        return format_name, {}
+
+    @staticmethod
+    def encoder_input(image, format_name):
+        """The image to hand the encoder, flattened onto white for formats without alpha"""
+        if format_name == "JPEG":
+            # Create a white background
+            bg = Image.new("RGB", image.size, (255, 255, 255))
+            bg.paste(image, (0, 0), image)
+            return bg
+        return image
+
+    def encode_image(self, image, format_option, quality=95, optimize=True):
+        """Encode a processed image in memory, returning the file's bytes"""
+        import io
+
+        try:
+            format_name, params = self.encoder_settings(format_option, quality, optimize)
+            buffer = io.BytesIO()
+            with STAGE_STATS.time("flatten"):
+                image = self.encoder_input(image, format_name)
+            with STAGE_STATS.time("encode") as timer:
+                image.save(buffer, format=format_name, **params)
+                timer.nbytes = buffer.tell()
+            return buffer.getvalue()
+        except Exception as e:
+            raise Exception(f"Failed to encode image: {str(e)}")
+
+    def save_image(self, image, output_path, format_option, quality=95, optimize=True, preserve_metadata=False):
+        """Save the processed image"""
+        temp_path = None
+        try:
+            # Get the appropriate format and parameters
+            format_name, params = self.encoder_settings(format_option, quality, optimize)
+
+            # Ensure the output path has the correct extension
+            base, _ = os.path.splitext(output_path)
+            output_path = f"{base}.{format_option.lower()}"
+
+            # Write beside the output and rename, so it is never left half-written
+            temp_path = output_path + PARTIAL_SUFFIX
+
+            with STAGE_STATS.time("flatten"):
+                image = self.encoder_input(image, format_name)
+            with STAGE_STATS.time("encode") as timer:
+                image.save(temp_path, format=format_name, **params)
+                timer.nbytes = os.path.getsize(temp_path)
+
+            os.replace(temp_path, output_path)
+            return output_path
+        except Exception as e:
+            remove_partial(temp_path)
+            raise Exception(f"Failed to save image: {str(e)}")
+
+    def estimate_memory(self, image_path, options, format_option="png", outputs=1):
+        """Estimate the peak memory, in bytes, of processing a file from its header alone.
+
+        outputs is the number of presets sharing one decode of the file.
+        """
+        info = probe_image(image_path)
+        width, height, bands, frames = info["width"], info["height"], info["bands"], info["frames"]
+
+        out_pixels = width * height
+        if options["resize"] and options["width"] > 0 and options["height"] > 0:
+            out_pixels = options["width"] * options["height"]
+
+        # The native and RGBA decodes, then the working copy, result and encoder input at output size
+        frame_bytes = width * height * (bands + 4) + out_pixels * 4 * 3 * outputs
+        # Keying temporaries for one strip: the lookup tables' channel planes, or a tuple per pixel
+        strip_bytes = min(out_pixels, self.TILE_PIXELS) * (64 if self.uses_lut(options) else 120)
+        if frames == 1:
+            return frame_bytes + strip_bytes
+
+        # A few frames per worker are in flight, and animated writers keep every frame
+        total = min(frames, 2 * (os.cpu_count() or 1)) * (frame_bytes + strip_bytes)
+        if self.FORMAT_MAP.get(format_option.lower(), "PNG") in ("PNG", "WEBP"):
+            total += frames * out_pixels * 4
+        return total
+
+    # Animated and multi-page images
+    def get_frame_count(self, image_path):
+        """Return the number of frames or pages in an image file"""
+        return probe_image(image_path)["frames"]
+
+    def iter_frames(self, image_path, frame_info=None, limit=None):
+        """Yield each frame or page of an image as RGBA, decoding one at a time.
+
+        frame_info, if given, gathers each frame's duration and disposal plus the loop count as it goes.
+        """
+        with Image.open(image_path) as im:
+            if frame_info is not None:
+                frame_info.update(durations=[], disposals=[], loop=im.info.get("loop", 1), format=im.format)
+            count = getattr(im, "n_frames", 1)
+            for index in range(min(count, limit or count)):
+                im.seek(index)
+                if frame_info is not None:
+                    frame_info["durations"].append(im.info.get("duration", 0))
+                    frame_info["disposals"].append(getattr(im, "disposal_method", im.info.get("disposal", 0)))
+                yield im.convert("RGBA")
+
+    def process_frames(self, image_path, options, workers=None, control=None, frame_info=None, limit=None):
+        """Process the frames of an image in parallel, yielding them in order.
+
+        Only a couple of frames per worker are decoded or in flight at any time,
+        so memory stays bounded however long the animation is.
+        """
+        workers = min(workers or os.cpu_count() or 1, limit or sys.maxsize)
+        frames = self.iter_frames(image_path, frame_info, limit)
+
+        # Detect the background once so every frame is keyed the same way
+        first = next(frames)
+        if options.get("auto_detect"):
+            options = dict(options, auto_detect=False, **self.detect_background(first))
+
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for frame in itertools.chain([first], frames):
+                if control:
+                    control.checkpoint()
+                pending.append(executor.submit(self.process_image, frame, options, control))
+                if len(pending) >= workers * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def save_frames(self, frames, output_path, format_option, frame_info, quality=95, optimize=True):
+        """Save processed frames as an animated or multi-page image"""
+        temp_path = None
+        try:
+            format_name = self.FORMAT_MAP.get(format_option.lower(), "PNG")
+
+            # Ensure the output path has the correct extension
+            base, _ = os.path.splitext(output_path)
+            output_path = f"{base}.{format_option.lower()}"
+            temp_path = output_path + PARTIAL_SUFFIX
+
+            frames = iter(frames)
+            first = next(frames)
+
+            if format_name == "TIFF":
+                from PIL import TiffImagePlugin
+
+                # Append page by page so only one processed page is held at a time
+                with TiffImagePlugin.AppendingTiffWriter(temp_path, True) as tiff:
+                    for page in itertools.chain([first], frames):
+                        with STAGE_STATS.time("encode"):
+                            page.save(tiff, format="TIFF")
+                            tiff.newFrame()
+            else:
+                # Pillow's animated writers gather every frame before encoding, which also
+                # completes the frame info gathered while decoding
+                append_images = list(frames)
+                params = {"save_all": True, "append_images": append_images,
+                          "duration": frame_info["durations"], "loop": frame_info["loop"]}
+                if format_name == "PNG":
+                    disposals = frame_info["disposals"]
+                    if frame_info.get("format") == "GIF":
+                        disposals = [self.APNG_DISPOSAL.get(d, 0) for d in disposals]
+                    params.update(disposal=disposals, blend=0, optimize=optimize)
+                else:
+                    # A transparent canvas, not the source's palette background
+                    params.update(quality=quality, lossless=quality > 90, background=(0, 0, 0, 0))
+                    if quality > 90:
+                        # Lossless sub-frames can drop the canvas alpha flag, so keep full key frames
+                        params.update(kmin=1, kmax=1)
+                with STAGE_STATS.time("encode") as timer:
+                    first.save(temp_path, format=format_name, **params)
+                    timer.nbytes = os.path.getsize(temp_path)
+
+            os.replace(temp_path, output_path)
+            return output_path
+        except BatchCancelled:
+            remove_partial(temp_path)
+            raise
+        except Exception as e:
+            remove_partial(temp_path)
+            raise Exception(f"Failed to save image: {str(e)}")
+
+    def process_animation(self, image_path, output_path, options, format_option, quality=95, optimize=True,
+                          preserve_metadata=False, control=None):
+        """Process and save every frame of an animated or multi-page image"""
+        format_name = self.FORMAT_MAP.get(format_option.lower(), "PNG")
+        if format_name not in self.MULTI_FRAME_FORMATS:
+            # Single-frame formats only get the first frame, so decode no others
+            frames = self.process_frames(image_path, options, control=control, limit=1)
+            try:
+                return self.save_image(next(frames), output_path, format_option, quality, optimize,
+                                       preserve_metadata)
+            finally:
+                frames.close()
+
+        frame_info = {}
+        frames = self.process_frames(image_path, options, control=control, frame_info=frame_info)
+        try:
+            return self.save_frames(frames, output_path, format_option, frame_info, quality, optimize)
+        finally:
+            frames.close()
+
+    # Responsive output sets
+    @staticmethod
+    def output_set_options(options, widths, size):
+        """Options that key an output set at its largest width rather than at full size"""
+        if not widths or options["crop"]:
+            return options
+        width, height = size
+        if options["resize"] and options["width"] > 0 and options["height"] > 0:
+            width, height = options["width"], options["height"]
+        largest = max(widths)
+        if largest >= width:
+            return options
+        return dict(options, resize=True, width=largest, height=max(1, round(height * largest / width)))
+
+    def build_output_set(self, image, widths):
+        """Scale an image to each width, returning (width, image) pairs largest first.
+
+        Like a mipmap chain, each level is downscaled from the level above it
+        rather than from the full image, so small levels cost little. Widths
+        beyond the image's own are made at full size, never upscaled.
+        """
+        levels = []
+        level = image
+        for width in sorted({min(width, image.width) for width in widths}, reverse=True):
+            if width != level.width:
+                level = level.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+            levels.append((width, level))
+        return levels
+
+    def save_output_set(self, image, output_path, widths, formats, quality=95, optimize=True,
+                        preserve_metadata=False, manifest=False):
+        """Save an image at several widths and in several formats, encoding in parallel.
+
+        Each file is named after output_path with a -{width}w suffix. Returns the
+        saved paths, followed by the srcset manifest's path if one was asked for.
+        """
+        base, _ = os.path.splitext(output_path)
+        with STAGE_STATS.time("downscale"):
+            levels = self.build_output_set(image, widths)
+        jobs = [(level, f"{base}-{width}w.{format_option.lower()}", format_option)
+                for width, level in levels for format_option in formats]
+
+        with ThreadPoolExecutor(max_workers=min(len(jobs), os.cpu_count() or 1)) as executor:
+            saves = [executor.submit(self.save_image, level, path, format_option, quality, optimize,
+                                     preserve_metadata) for level, path, format_option in jobs]
+            paths = [save.result() for save in saves]
+
+        if manifest:
+            paths.append(self.save_srcset_manifest(f"{base}.srcset.json", levels, formats, paths))
+        return paths
+
+    def process_animation_set(self, image_path, output_path, options, widths, formats, quality=95, optimize=True,
+                              preserve_metadata=False, manifest=False, control=None):
+        """Process an animated or multi-page image once and save it as a responsive output set.
+
+        Each frame is keyed at the largest width and scaled down to the others,
+        then every width/format pair is saved as process_animation would save
+        it. Returns the saved paths, followed by the manifest's if asked for.
+        """
+        base, _ = os.path.splitext(output_path)
+        info = probe_image(image_path)
+        options = self.output_set_options(options, widths, (info["width"], info["height"]))
+
+        frame_info = {}
+        levels = None
+        level_frames = None
+        frames = self.process_frames(image_path, options, control=control, frame_info=frame_info)
+        try:
+            for frame in frames:
+                with STAGE_STATS.time("downscale"):
+                    frame_levels = self.build_output_set(frame, widths)
+                if levels is None:
+                    levels = frame_levels
+                    level_frames = [[] for _ in levels]
+                for collected, (_, level) in zip(level_frames, frame_levels):
+                    collected.append(level)
+        finally:
+            frames.close()
+
+        def save(collected, path, format_option):
+            if self.FORMAT_MAP.get(format_option.lower(), "PNG") in self.MULTI_FRAME_FORMATS:
+                return self.save_frames(collected, path, format_option, frame_info, quality, optimize)
+            # Single-frame formats only get the first frame
+            return self.save_image(collected[0], path, format_option, quality, optimize, preserve_metadata)
+
+        jobs = [(collected, f"{base}-{width}w.{format_option.lower()}", format_option)
+                for (width, _), collected in zip(levels, level_frames) for format_option in formats]
+        with ThreadPoolExecutor(max_workers=min(len(jobs), os.cpu_count() or 1)) as executor:
+            saves = [executor.submit(save, *job) for job in jobs]
+            paths = [save.result() for save in saves]
+
+        if manifest:
+            paths.append(self.save_srcset_manifest(f"{base}.srcset.json", levels, formats, paths))
+        return paths
+
+    def save_srcset_manifest(self, manifest_path, levels, formats, paths):
+        """Write a JSON manifest of an output set with a ready-made srcset per format"""
+        entries = iter(paths)
+        images = []
+        srcset = {format_option.lower(): [] for format_option in formats}
+        for width, level in levels:
+            files = {}
+            for format_option in formats:
+                name = os.path.basename(next(entries))
+                files[format_option.lower()] = name
+                srcset[format_option.lower()].append(f"{name} {width}w")
+            images.append({"width": width, "height": level.height, "files": files})
+
+        manifest = {"images": images, "srcset": {fmt: ", ".join(items) for fmt, items in srcset.items()}}
+        temp_path = manifest_path + PARTIAL_SUFFIX
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(manifest, f, indent=2)
+            os.replace(temp_path, manifest_path)
+            return manifest_path
+        except Exception as e:
+            remove_partial(temp_path)
+            raise Exception(f"Failed to save srcset manifest: {str(e)}")
+
+
+# Zoomable preview
+
+# Images up to this many pixels are processed whole for the preview; larger
+# ones only as far as the tiles on screen
+PREVIEW_FULL_PIXELS = 4 << 20
+# Closest zoom, in screen pixels per image pixel, and the step of each wheel click
+PREVIEW_MAX_ZOOM = 16.0
+PREVIEW_ZOOM_STEP = 1.25
+# Threads keying preview tiles, so the Tk thread only draws them
+PREVIEW_TILE_WORKERS = 2
+# Shade drawn where a tile is still being keyed
+PREVIEW_PLACEHOLDER = (200, 200, 200, 255)
+
+
+class TilePyramid:
+    """Tiles of an image at full resolution and every halving of it, made on first use.
+
+    Level 0 is the image itself and each level above halves it, up to the
+    one that fits in a single tile. A tile is scaled straight from the part
+    of the image it covers and, given a processor and final options (after
+    any resize, crop and detection), keyed with process_pixels, so only the
+    tiles actually viewed are ever processed. Zoomed-out levels key the
+    scaled-down pixels; at level 0 tiles match the processed image exactly.
+    Recently used tiles are kept up to cache_tiles.
+
+    Given an executor, tiles are made on it instead: view() draws a
+    placeholder for each one not ready yet, and made counts the tiles
+    finished so far, for the UI to poll and redraw.
+    """
+
+    TILE_SIZE = 256
+
+    def __init__(self, image, processor=None, options=None, cache_tiles=192, executor=None):
+        self.image = image
+        self.processor = processor
+        self.options = options
+        self.cache_tiles = cache_tiles
+        self.executor = executor
+        self.made = 0
+        self._tiles = OrderedDict()
+        # Tiles of the latest view, and those queued on the executor
+        self._wanted = set()
+        self._queued = set()
+        self._lock = threading.Lock()
+
+    @property
+    def size(self):
+        return self.image.size
+
+    @property
+    def levels(self):
+        """Number of levels, down to the first that fits in one tile"""
+        largest = max(self.image.size)
+        return max(1, math.ceil(math.log2(largest / self.TILE_SIZE)) + 1) if largest > self.TILE_SIZE else 1
+
+    def level_size(self, level):
+        factor = 1 << level
+        return max(1, -(-self.image.width // factor)), max(1, -(-self.image.height // factor))
+
+    def level_for(self, scale):
+        """The coarsest level with at least one of its pixels per screen pixel at this scale"""
+        if scale >= 1:
+            return 0
+        return min(self.levels - 1, int(math.floor(math.log2(1 / scale))))
+
+    @property
+    def pending(self):
+        """Number of tiles queued or being made in the background"""
+        with self._lock:
+            return len(self._queued)
+
+    def cancel(self):
+        """Skip the background tiles not started yet, as when the pyramid is replaced"""
+        with self._lock:
+            self._wanted.clear()
+
+    def cached_tile(self, level, column, row):
+        """Return a tile if it has been made, or None"""
+        key = (level, column, row)
+        with self._lock:
+            tile = self._tiles.get(key)
+            if tile is not None:
+                self._tiles.move_to_end(key)
+            return tile
+
+    def tile(self, level, column, row):
+        """Return one tile, making (and processing) it the first time it is asked for"""
+        key = (level, column, row)
+        tile = self.cached_tile(*key)
+        if tile is not None:
+            return tile
+
+        factor = 1 << level
+        level_width, level_height = self.level_size(level)
+        box = (column * self.TILE_SIZE, row * self.TILE_SIZE, min(level_width, (column + 1) * self.TILE_SIZE),
+               min(level_height, (row + 1) * self.TILE_SIZE))
+        if level == 0:
+            tile = self.image.crop(box)
+        else:
+            source = (box[0] * factor, box[1] * factor, min(self.image.width, box[2] * factor),
+                      min(self.image.height, box[3] * factor))
+            tile = self.image.resize((box[2] - box[0], box[3] - box[1]), Image.BOX, box=source)
+        if self.options is not None:
+            tile = self.processor.process_pixels(tile, self.options)
+
+        with self._lock:
+            self._tiles[key] = tile
+            while len(self._tiles) > self.cache_tiles:
+                self._tiles.popitem(last=False)
+        return tile
+
+    def region(self, level, box):
+        """Assemble the part of a level inside box from its tiles, or placeholders for those still being made"""
+        region = Image.new("RGBA", (box[2] - box[0], box[3] - box[1]))
+        size = self.TILE_SIZE
+        keys = [(level, column, row) for row in range(box[1] // size, -(-box[3] // size))
+                for column in range(box[0] // size, -(-box[2] // size))]
+        background = self.executor is not None
+        if background:
+            with self._lock:
+                self._wanted = set(keys)
+
+        for key in keys:
+            _, column, row = key
+            position = (column * size - box[0], row * size - box[1])
+            if not background:
+                region.paste(self.tile(*key), position)
+                continue
+            tile = self.cached_tile(*key)
+            if tile is not None:
+                region.paste(tile, position)
+                continue
+            self._queue(key)
+            region.paste(PREVIEW_PLACEHOLDER, position + (min(region.width, position[0] + size),
+                                                          min(region.height, position[1] + size)))
+        return region
+
+    def _queue(self, key):
+        with self._lock:
+            if key in self._queued:
+                return
+            self._queued.add(key)
+        self.executor.submit(self._make_tile, key)
+
+    def _make_tile(self, key):
+        wanted = False
+        try:
+            with self._lock:
+                wanted = key in self._wanted
+            if wanted:
+                self.tile(*key)
+        except Exception as e:
+            print(f"Preview error: {str(e)}")
+        finally:
+            with self._lock:
+                self._queued.discard(key)
+                self.made += wanted
+
+    def view(self, center, scale, size):
+        """Render what a window of size screen pixels shows, centred on center at scale.
+
+        center is in full-resolution pixels and scale is screen pixels per
+        image pixel. Returns the visible part of the image, scaled for the
+        screen, and where its top-left corner goes in the window, or
+        (None, None) if none of the image is in view.
+        """
+        width, height = size
+        left = max(0.0, center[0] - width / 2 / scale)
+        top = max(0.0, center[1] - height / 2 / scale)
+        right = min(float(self.image.width), center[0] + width / 2 / scale)
+        bottom = min(float(self.image.height), center[1] + height / 2 / scale)
+        if right <= left or bottom <= top:
+            return None, None
+
+        level = self.level_for(scale)
+        factor = 1 << level
+        level_width, level_height = self.level_size(level)
+        box = (int(left // factor), int(top // factor), min(level_width, math.ceil(right / factor)),
+               min(level_height, math.ceil(bottom / factor)))
+        region = self.region(level, box)
+
+        screen_scale = scale * factor
+        screen_size = (max(1, round(region.width * screen_scale)), max(1, round(region.height * screen_scale)))
+        if screen_size != region.size:
+            # Show single pixels as sharp squares when zoomed in
+            region = region.resize(screen_size, Image.NEAREST if screen_scale > 1 else Image.BILINEAR)
+        position = (round(width / 2 + (box[0] * factor - center[0]) * scale),
+                    round(height / 2 + (box[1] * factor - center[1]) * scale))
+        return region, position
+
+
+# Compiled processing plans
+
+# Bump when the layout of cached plans changes
+PLAN_FORMAT = 2
+
+# Plans compiled or loaded in this process, by cache key, least recently used first
+PLAN_CACHE_SIZE = 32
+_PLANS = OrderedDict()
+_PLANS_LOCK = threading.Lock()
+# Plans kept in the on-disk cache; older ones are deleted as new ones are saved
+PLAN_DISK_ENTRIES = 32
+
+
+def validate_options(options):
+    """Check processing options, raising an Exception that lists every bad value"""
+    problems = []
+
+    def in_range(name, value, low, high):
+        if not isinstance(value, (int, float)) or not low <= value <= high:
+            problems.append(f"{name} must be between {low} and {high}, not {value!r}")
+
+    def color(name, value, channels=(3, 4)):
+        if not isinstance(value, (list, tuple)) or len(value) not in channels:
+            problems.append(f"{name} must be an RGB colour, not {value!r}")
+            return
+        for channel in value:
+            in_range(name, channel, 0, 255)
+
+    if options["background_mode"] not in ("black", "white", "custom"):
+        problems.append(f"unknown background mode {options['background_mode']!r}")
+    if options.get("engine", DEFAULT_ENGINE) not in PROCESSING_ENGINES:
+        problems.append(f"unknown processing engine {options.get('engine')!r}")
+    in_range("tolerance", options["tolerance"], 0, 100)
+    in_range("alpha value", options["alpha_value"], 0, 255)
+    color("custom colour", options["custom_color"])
+    color("replacement colour", options["replacement_color"])
+    if options["resize"]:
+        in_range("width", options["width"], 0, 1 << 16)
+        in_range("height", options["height"], 0, 1 << 16)
+    if options["crop"] and not (options["crop_right"] > options["crop_left"]
+                                and options["crop_bottom"] > options["crop_top"]):
+        problems.append("the crop box is empty")
+    for key in options.get("key_colors") or []:
+        color("key colour", key.get("color"))
+        in_range("key colour tolerance", key.get("tolerance"), 0, 100)
+    for key_range in options.get("key_ranges") or []:
+        for name, full in (("hue", 360), ("saturation", 100), ("value", 100)):
+            for bound in key_range.get(name, (0, full)):
+                in_range(f"key range {name}", bound, 0, full)
+
+    if problems:
+        raise Exception(f"Invalid options: {'; '.join(problems)}")
+    return options
+
+
+@lru_cache(maxsize=1)
+def plan_version():
+    """Hash of the app version, the Pillow version and this module's code.
+
+    Cached plans made by any other version are ignored and rebuilt.
+    """
+    import hashlib
+    import PIL
+
+    digest = hashlib.sha1(f"{APP_VERSION}|{PIL.__version__}|{PLAN_FORMAT}".encode())
+    try:
+        with open(__file__, "rb") as f:
+            digest.update(f.read())
+    except OSError:
+        pass
+    return digest.hexdigest()[:16]
+
+
+class ProcessingPlan:
+    """A preset compiled for processing: validated options and key tables.
+
+    Everything that doesn't depend on the image is worked out once: the
+    keying thresholds for each tolerance and the colour cube for multi-key
+    setups. install() loads the tables into this process's caches, so every
+    file processed afterwards starts without setup. Plans are cached on disk
+    next to the settings file, keyed on the options alone.
+    """
+
+    def __init__(self, options, thresholds, cube=None):
+        # Plans are shared through the plan cache, so their options are a snapshot
+        self.options = freeze_options(options)
+        self.thresholds = thresholds
+        self.cube = cube
+
+    @staticmethod
+    def cache_key(options):
+        """Name of the cache entry for some options"""
+        import hashlib
+        text = json.dumps(options, sort_keys=True, default=list)
+        return hashlib.sha1(text.encode()).hexdigest()[:20]
+
+    def install(self):
+        """Load the precomputed tables into this process's caches"""
+        for tolerance, thresholds in self.thresholds.items():
+            _THRESHOLDS.setdefault(tolerance, thresholds)
+        if self.cube is not None:
+            matcher = get_color_key_matcher(*color_key_spec(self.options, include_primary=False))
+            self.cube = matcher.load_cube(self.cube)
+        return self
+
+    def save(self, key, cache_dir=PLAN_CACHE_DIR):
+        """Write the plan to the on-disk cache"""
+        import zlib
+
+        data = {
+            "version": plan_version(),
+            "options": self.options,
+            "thresholds": [
+                [tolerance, threshold, [[total, sorted(keyed)] for total, keyed in boundary.items()]]
+                for tolerance, (threshold, boundary) in self.thresholds.items()
+            ],
+            "cube": self.cube is not None
+        }
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            path = os.path.join(cache_dir, key)
+            if self.cube is not None:
+                with open(path + ".cube.part", "wb") as f:
+                    f.write(zlib.compress(self.cube, 1))
+                os.replace(path + ".cube.part", path + ".cube")
+            with open(path + ".json.part", "w") as f:
+                json.dump(data, f)
+            os.replace(path + ".json.part", path + ".json")
+            self.prune(cache_dir)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"Error caching processing plan: {e}")
+
+    @staticmethod
+    def prune(cache_dir=PLAN_CACHE_DIR, keep=PLAN_DISK_ENTRIES):
+        """Delete all but the most recently used plans in the on-disk cache"""
+        import glob
+
+        entries = []
+        for path in glob.glob(os.path.join(cache_dir, "*.json")):
+            try:
+                entries.append((os.path.getmtime(path), path[:-len(".json")]))
+            except OSError:
+                pass
+        entries.sort(reverse=True)
+        for _, path in entries[keep:]:
+            for suffix in (".json", ".cube"):
+                try:
+                    os.remove(path + suffix)
+                except OSError:
+                    pass
+
+    @classmethod
+    def load(cls, key, cache_dir=PLAN_CACHE_DIR):
+        """Read a plan from the on-disk cache, or None if it is missing or out of date"""
+        import zlib
+
+        path = os.path.join(cache_dir, key)
+        try:
+            with open(path + ".json") as f:
+                data = json.load(f)
+            if data.get("version") != plan_version():
+                return None
+            # Mark the entry as recently used, so pruning keeps it
+            os.utime(path + ".json", None)
+
+            cube = None
+            if data["cube"]:
+                with open(path + ".cube", "rb") as f:
+                    cube = zlib.decompress(f.read())
+                if len(cube) != 1 << 24:
+                    return None
+        except (OSError, ValueError, KeyError, zlib.error):
+            return None
+
+        thresholds = {
+            tolerance: (threshold, {total: frozenset(map(tuple, keyed)) for total, keyed in boundary})
+            for tolerance, threshold, boundary in data["thresholds"]
+        }
+        return cls(preset_to_options(data["options"]), thresholds, cube)
+
+
+def compile_options(options, output=None, use_cache=True):
+    """Compile processing options into a ProcessingPlan, checking any output settings given too.
+
+    Plans are reused from memory or from the on-disk cache when one matches,
+    so only the first run of a preset pays for building its tables. With
+    use_cache=False, as for library calls, the disk cache is neither read nor
+    written and a newly built plan isn't kept in memory either.
+    """
+    validate_options(options)
+    if output:
+        for format_option in [output["format"]] + list(output.get("formats") or []):
+            if format_option.lower() not in ImageProcessor.FORMAT_MAP:
+                raise Exception(f"Invalid options: unknown output format {format_option!r}")
+
+    key = ProcessingPlan.cache_key(options)
+    plan = _cached_plan(key)
+    if plan is None and use_cache:
+        plan = ProcessingPlan.load(key)
+    if plan is None:
+        plan = build_plan(options)
+        if use_cache:
+            plan.save(key)
+    if use_cache:
+        _remember_plan(key, plan)
+    return plan
+
+
+def _cached_plan(key):
+    with _PLANS_LOCK:
+        plan = _PLANS.get(key)
+        if plan is not None:
+            _PLANS.move_to_end(key)
+        return plan
+
+
+def _remember_plan(key, plan):
+    with _PLANS_LOCK:
+        _PLANS[key] = plan
+        _PLANS.move_to_end(key)
+        if len(_PLANS) > PLAN_CACHE_SIZE:
+            _PLANS.popitem(last=False)
+
+
+def build_plan(options):
+    """Work out a plan's tables from scratch"""
+    thresholds = {}
+    cube = None
+    if ImageProcessor.uses_lut(options):
+        key_colors, key_ranges = color_key_spec(options)
+        for _, tolerance in key_colors:
+            thresholds[tolerance] = custom_color_thresholds(tolerance)
+        # The cube holds the extra keys only; the plan shares it with the matcher
+        matcher = get_color_key_matcher(key_colors[1:], key_ranges)
+        if len(matcher) >= matcher.CUBE_MIN_KEYS:
+            cube = matcher.cube
+    return ProcessingPlan(options, thresholds, cube)
+
+
+def compile_preset(preset, output=None):
+    """Compile a stored preset into a ProcessingPlan"""
+    return compile_options(preset_to_options(preset), output)
+
+
+def install_cached_plan(options):
+    """Install the plan for some options in this process, if it is cached in memory or on disk"""
+    key = ProcessingPlan.cache_key(options)
+    plan = _cached_plan(key)
+    if plan is None:
+        plan = ProcessingPlan.load(key)
+        if plan is None:
+            # Not compiled yet: look again next time rather than remembering the miss
+            return
+        _remember_plan(key, plan)
+    plan.install()
+
+
+class SharedImage:
+    """RGBA pixels in a shared memory block that worker processes can map.
+
+    Only the small descriptor (block name and size) is pickled between
+    processes. image() maps rows of the block as a Pillow image without
+    copying; write() copies an image's pixels in. The creating side owns the
+    block and unlinks it on close().
+    """
+
+    def __init__(self, size, name=None):
+        from multiprocessing import shared_memory
+
+        self.size = tuple(size)
+        self.owner = name is None
+        if self.owner:
+            self._shm = shared_memory.SharedMemory(create=True, size=max(1, self.size[0] * self.size[1] * 4))
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+        self.name = self._shm.name
+
+    @classmethod
+    def from_image(cls, image):
+        """Copy an RGBA image into a new shared block"""
+        shared = cls(image.size)
+        shared.write(image)
+        return shared
+
+    @classmethod
+    def attach(cls, descriptor):
+        """Map a block created elsewhere from its descriptor"""
+        name, size = descriptor
+        return cls(size, name)
+
+    @property
+    def descriptor(self):
+        return self.name, self.size
+
+    def image(self, top=0, bottom=None):
+        """Map rows top..bottom (all rows by default) as a read-only RGBA image"""
+        width, height = self.size
+        bottom = height if bottom is None else bottom
+        view = self._shm.buf[top * width * 4:bottom * width * 4]
+        image = Image.frombuffer("RGBA", (width, bottom - top), view, "raw", "RGBA", 0, 1)
+        # The block can only be unmapped once no image views it any more
+        image._shared_owner = self
+        return image
+
+    def write(self, image, top=0):
+        """Copy an RGBA image into the block, starting at the given row"""
+        data = image.tobytes()
+        start = top * self.size[0] * 4
+        self._shm.buf[start:start + len(data)] = data
+
+    def close(self):
+        """Unmap the block, and free it if this side created it"""
+        try:
+            self._shm.close()
+        except BufferError:
+            # An image still maps the block; the memory goes when that image does
+            pass
+        if self.owner:
+            try:
+                self._shm.unlink()
+            except FileNotFoundError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def process_shared_strip(source, result, top, bottom, options):
+    """Worker process side: process rows top..bottom of one shared image into another"""
+    install_cached_plan(options)
+    source = SharedImage.attach(source)
+    result = SharedImage.attach(result)
+    try:
+        result.write(ImageProcessor().process_pixels(source.image(top, bottom), options), top)
+    finally:
+        source.close()
+        result.close()
+
+
+class ProcessWorkers:
+    """Runs the per-pixel stage of processing in worker processes.
+
+    The resized and cropped image is copied into shared memory once. Each
+    process maps its own strip of rows, processes it and writes the strip into
+    a shared result block, so no pixel data is pickled either way. The result
+    is handed back still shared, and callers map it directly to save it or to
+    build the preview.
+    """
+
+    def __init__(self, processes=None):
+        self.processes = processes or os.cpu_count() or 1
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                from concurrent.futures import ProcessPoolExecutor
+                self._executor = ProcessPoolExecutor(max_workers=self.processes, initializer=_ignore_interrupts)
+            return self._executor
+
+    def process(self, processor, image, options, control=None):
+        """Process an image across the worker processes, returning a SharedImage with the result"""
+        try:
+            if control:
+                control.checkpoint()
+            img, options = processor.prepare_image(image, options)
+        except BatchCancelled:
+            raise
+        except Exception as e:
+            raise Exception(f"Error processing image: {str(e)}")
+
+        # At least one strip per process, and no strip bigger than usual
+        rows = min(processor.strip_rows(img.size), -(-img.height // self.processes))
+        result = SharedImage(img.size)
+        futures = []
+        try:
+            with SharedImage.from_image(img) as source:
+                # The shared copy is all the workers need
+                del img
+                # The workers' own stages are timed in their processes, so time the round trip here
+                with STAGE_STATS.time("workers", source.size[0] * source.size[1] * 4):
+                    for top in range(0, source.size[1], rows):
+                        if control:
+                            control.checkpoint()
+                        futures.append(self.executor.submit(process_shared_strip, source.descriptor,
+                                                            result.descriptor, top,
+                                                            min(source.size[1], top + rows), options))
+                    for future in futures:
+                        future.result()
+            return result
+        except BatchCancelled:
+            self._abandon(futures, result)
+            raise
+        except Exception as e:
+            self._abandon(futures, result)
+            raise Exception(f"Error processing image: {str(e)}")
+
+    @staticmethod
+    def _abandon(futures, result):
+        for future in futures:
+            future.cancel()
+        result.close()
+
+    def shutdown(self):
+        """Stop the worker processes"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+                self._executor = None
+
+
+def _ignore_interrupts():
+    """Leave Ctrl+C to the parent process, which shuts the workers down itself"""
+    import signal
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def get_process_workers():
+    """The shared pool of worker processes, or None when the settings leave them off"""
+    global PROCESS_WORKERS
+    processes = int(settings.get("worker_processes") or 0)
+    if processes <= 0:
+        return None
+    if PROCESS_WORKERS is None or PROCESS_WORKERS.processes != processes:
+        if PROCESS_WORKERS is not None:
+            PROCESS_WORKERS.shutdown()
+        PROCESS_WORKERS = ProcessWorkers(processes)
+    return PROCESS_WORKERS
+
+
+PROCESS_WORKERS = None
+
+
+# Archives
+
+def archive_member_name(name):
+    """Make an archive member name safe to reuse: relative, with forward slashes and no ".." parts"""
+    parts = [part for part in name.replace("\\", "/").split("/") if part not in ("", ".", "..")]
+    return "/".join(parts) or "image"
+
+
+def iter_archive_images(archive_path):
+    """Yield (member name, bytes) for each image in a zip or tar archive, one member at a time.
+
+    Members are read straight from the archive into memory, never extracted
+    to disk. Tar archives, compressed or not, are read as a single stream.
+    """
+    if archive_path.lower().endswith(".zip"):
+        import zipfile
+
+        with zipfile.ZipFile(archive_path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and info.filename.lower().endswith(IMAGE_EXTENSIONS):
+                    yield info.filename, archive.read(info)
+    else:
+        import tarfile
+
+        with tarfile.open(archive_path, "r|*") as archive:
+            for member in archive:
+                if member.isfile() and member.name.lower().endswith(IMAGE_EXTENSIONS):
+                    yield member.name, archive.extractfile(member).read()
+
+
+class ArchiveWriter:
+    """Streams encoded outputs into a zip or tar archive as they are produced.
+
+    The archive is written under a .part name and renamed by close(), so an
+    interrupted run never leaves a truncated archive under the final name.
+    add() may be called from any thread; repeated names are numbered.
+    """
+
+    def __init__(self, path):
+        import tarfile
+        import zipfile
+
+        self.path = path
+        self.temp_path = path + PARTIAL_SUFFIX
+        self._names = set()
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        extension = split_archive_name(os.path.basename(path))[1].lower()
+        if extension == ".zip":
+            # Image formats are compressed already, so entries are stored as they are
+            self._archive = zipfile.ZipFile(self.temp_path, "w", zipfile.ZIP_STORED, allowZip64=True)
+        elif extension in ARCHIVE_EXTENSIONS:
+            compression = {".tar.gz": "gz", ".tgz": "gz", ".tar.bz2": "bz2", ".tbz2": "bz2", ".tar.xz": "xz",
+                           ".txz": "xz"}.get(extension, "")
+            self._archive = tarfile.open(self.temp_path, f"w|{compression}")
+        else:
+            raise Exception(f"Unsupported archive type: {path}")
+
+    def add(self, name, data):
+        """Add one encoded file to the archive, returning the name it was stored under"""
+        import io
+        import tarfile
+
+        with self._lock:
+            name = self._unique(archive_member_name(name))
+            if isinstance(self._archive, tarfile.TarFile):
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                info.mtime = int(time.time())
+                self._archive.addfile(info, io.BytesIO(data))
+            else:
+                self._archive.writestr(name, data)
+            return name
+
+    def _unique(self, name):
+        stem, extension = os.path.splitext(name)
+        counter = 1
+        while name in self._names:
+            counter += 1
+            name = f"{stem}_{counter}{extension}"
+        self._names.add(name)
+        return name
+
+    def close(self):
+        """Finish the archive and move it into place, returning its path"""
+        with self._lock:
+            self._archive.close()
+            os.replace(self.temp_path, self.path)
+        return self.path
+
+    def abort(self):
+        """Drop a partly written archive"""
+        with self._lock:
+            try:
+                self._archive.close()
+            except Exception:
+                pass
+            remove_partial(self.temp_path)
+
+
+# How often the UI applies batch progress, in milliseconds (10 Hz)
+BATCH_REFRESH_MS = 100
+
+
+def system_memory():
+    """Total physical memory in bytes, or None where it can't be read"""
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def batch_resources():
+    """Worker count and memory budget in bytes, from the settings or the machine"""
+    workers = int(settings.get("batch_workers") or 0) or os.cpu_count() or 1
+    budget_mb = int(settings.get("memory_budget_mb") or 0)
+    if budget_mb > 0:
+        return workers, budget_mb * 1024 * 1024
+    # Default to half of physical memory (2 GB where it's unknown)
+    return workers, (system_memory() or 4 << 30) // 2
+
+
+class MemoryBudget:
+    """Admits batch jobs while their estimated memory fits in a budget.
+
+    At most `slots` jobs run at once. A job larger than the whole budget waits
+    until nothing else is running and then runs alone.
+    """
+
+    def __init__(self, budget, slots):
+        self.budget = budget
+        self.slots = slots
+        self.used = 0
+        self.running = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, cost, control=None):
+        """Block until a job of the given cost may start"""
+        with self._condition:
+            while self.running and (self.running >= self.slots or self.used + cost > self.budget):
+                self._condition.wait(0.1)
+                if control and control.cancelled:
+                    raise BatchCancelled("Batch cancelled")
+            self.used += cost
+            self.running += 1
+
+    def release(self, cost):
+        """Return a finished job's memory to the budget"""
+        with self._condition:
+            self.used -= cost
+            self.running -= 1
+            self._condition.notify_all()
+
+
+# Orders a batch can start its files in
+QUEUE_ORDERS = ("fifo", "smallest", "priority")
+
+
+class BatchScheduler:
+    """Decides which queued file a batch starts next.
+
+    "fifo" keeps queue order. "smallest" starts the files with the fewest
+    pixels first, so quick results come early, but keeps a lane (one worker
+    in four, at least one) for long files, longest first, so they run
+    alongside the short ones instead of alone at the end. A single worker
+    keeps no lane and runs the long files after the short ones. "priority"
+    starts pinned files first, in the order given, then the rest in queue
+    order. Except under "fifo", files too large for the memory budget,
+    which have to run alone, go last.
+    """
+
+    # A file is long at this many times the batch's median pixel count
+    LONG_JOB_FACTOR = 8
+
+    def __init__(self, files, order="fifo", pinned=(), pixels=None, costs=None, memory_budget=None, workers=1):
+        self.order = order if order in QUEUE_ORDERS else "fifo"
+        self.costs = costs or {}
+        # With one worker a lane for long files would hold up every short one
+        self.long_slots = max(1, workers // 4) if workers >= 2 else 0
+        self.running_long = set()
+        self.long_files = set()
+        self._lock = threading.Lock()
+
+        files = list(files)
+        if self.order == "fifo":
+            self.queues = [deque(files)]
+            return
+
+        # Files that have to run alone wait until everything else has started
+        alone = [item for item in files if memory_budget and self.costs.get(item[1], 0) > memory_budget]
+        rest = [item for item in files if item not in alone]
+        if self.order == "priority":
+            rank = {file_path: index for index, file_path in enumerate(pinned)}
+            first = sorted((item for item in rest if item[1] in rank), key=lambda item: rank[item[1]])
+            self.queues = [deque(first), deque(item for item in rest if item[1] not in rank), deque(alone)]
+            return
+
+        pixels = pixels or {}
+        sizes = sorted(pixels.get(file_path, 0) for _, file_path in rest)
+        median = sizes[len(sizes) // 2] if sizes else 0
+        long_jobs = [item for item in rest if median and pixels.get(item[1], 0) >= median * self.LONG_JOB_FACTOR]
+        self.long_files = {file_path for _, file_path in long_jobs}
+        short = sorted((item for item in rest if item[1] not in self.long_files),
+                       key=lambda item: pixels.get(item[1], 0))
+        self.long_queue = deque(sorted(long_jobs, key=lambda item: -pixels.get(item[1], 0)))
+        self.queues = [deque(short), deque(sorted(alone, key=lambda item: pixels.get(item[1], 0)))]
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        """The next (item_id, file_path) to start"""
+        with self._lock:
+            if self.order == "smallest" and self.long_queue:
+                # A long file takes a free lane, or any worker once the short ones have all started
+                if len(self.running_long) < self.long_slots or not self.queues[0]:
+                    item = self.long_queue.popleft()
+                    self.running_long.add(item[1])
+                    return item
+            for queue in self.queues:
+                if queue:
+                    return queue.popleft()
+            raise StopIteration
+
+    def finished(self, file_path):
+        """Note that a started file has finished, freeing its lane if it was long"""
+        if file_path in self.long_files:
+            with self._lock:
+                self.running_long.discard(file_path)
+
+
+class BatchCancelled(Exception):
+    """Raised inside a worker once its batch has been cancelled"""
+
+
+class BatchControl:
+    """Cooperative cancel, pause and resume for a running batch.
+
+    Workers call checkpoint() between files, frames and strips of large images.
+    It blocks on an event while paused, so a paused batch uses no CPU, and
+    raises BatchCancelled once the batch has been cancelled.
+    """
+
+    def __init__(self):
+        self.cancelled = False
+        self._running = threading.Event()
+        self._running.set()
+
+    @property
+    def paused(self):
+        return not self._running.is_set()
+
+    def pause(self):
+        """Hold workers at their next checkpoint"""
+        self._running.clear()
+
+    def resume(self):
+        """Let paused workers continue"""
+        self._running.set()
+
+    def cancel(self):
+        """Stop workers at their next checkpoint, waking any that are paused"""
+        self.cancelled = True
+        self._running.set()
+
+    def checkpoint(self):
+        """Wait while paused and raise BatchCancelled if cancelled"""
+        self._running.wait()
+        if self.cancelled:
+            raise BatchCancelled("Batch cancelled")
+
+
+class BatchProgress:
+    """Gathers batch progress from the worker side and hands it out in bulk.
+
+    Workers record status changes under a lock without touching any UI. A
+    consumer (the Tk poller or the headless reporter) calls flush() at its own
+    pace and gets the latest status of each changed item plus a snapshot with
+    throughput and ETA, so a fast batch cannot flood the event queue.
+    """
+
+    def __init__(self, total, total_bytes=0, total_pixels=0):
+        self.total = total
+        self.total_bytes = total_bytes
+        # Pixels to process, from the file headers, or 0 if some are unknown (or not read yet)
+        self.total_pixels = total_pixels
+        self.done_pixels = 0
+        self.skipped_pixels = 0
+        self.processed = 0
+        self.errors = 0
+        # Files another node of a cluster took care of
+        self.skipped = 0
+        self.done_bytes = 0
+        self.current = None
+        self.finished = False
+        self.cancelled = False
+        self.paused_since = None
+        self.paused_time = 0.0
+        self.start_time = time.monotonic()
+        self.end_time = None
+        self._updates = {}
+        self._lock = threading.Lock()
+
+    def start_item(self, item_id, file_path):
+        """Record that a file has started processing"""
+        with self._lock:
+            self.current = file_path
+            self._updates[item_id] = (file_path, "Processing")
+
+    def finish_item(self, item_id, file_path, status, size=0, error=False, pixels=0):
+        """Record that a file has finished, successfully or not"""
+        with self._lock:
+            if error:
+                self.errors += 1
+            else:
+                self.processed += 1
+            self.done_bytes += size
+            self.done_pixels += pixels
+            self._updates[item_id] = (file_path, status)
+
+    def skip_item(self, item_id, file_path, status, size=0, pixels=0):
+        """Record a file done elsewhere, counting it as done without adding to the throughput"""
+        with self._lock:
+            self.skipped += 1
+            self.total_bytes = max(0, self.total_bytes - size)
+            self.total_pixels = max(0, self.total_pixels - pixels)
+            self.skipped_pixels += pixels
+            self._updates[item_id] = (file_path, status)
+
+    def set_total_pixels(self, total_pixels):
+        """Record the batch's pixel count once every header has been read, so the ETA goes by pixels"""
+        with self._lock:
+            self.total_pixels = max(0, total_pixels - self.skipped_pixels)
+
+    def update_item(self, item_id, file_path, status):
+        """Record a new status for a file that is still processing"""
+        with self._lock:
+            self._updates[item_id] = (file_path, status)
+
+    def cancel_item(self, item_id, file_path):
+        """Record that a file was interrupted by a cancel and is still to do"""
+        with self._lock:
+            self._updates[item_id] = (file_path, "Cancelled")
+
+    def set_paused(self, paused):
+        """Record a pause or resume so paused time doesn't count against throughput"""
+        with self._lock:
+            self._set_paused(paused)
+
+    def _set_paused(self, paused):
+        now = time.monotonic()
+        if paused and self.paused_since is None:
+            self.paused_since = now
+        elif not paused and self.paused_since is not None:
+            self.paused_time += now - self.paused_since
+            self.paused_since = None
+
+    def finish(self, cancelled=False):
+        """Mark the whole batch as finished"""
+        with self._lock:
+            self._set_paused(False)
+            self.finished = True
+            self.cancelled = cancelled
+            self.current = None
+            self.end_time = time.monotonic()
+
+    def snapshot(self):
+        """Return counts, throughput and ETA as a dictionary"""
+        with self._lock:
+            return self._snapshot()
+
+    def flush(self):
+        """Return the item updates since the last flush together with a snapshot"""
+        with self._lock:
+            updates, self._updates = self._updates, {}
+            return updates, self._snapshot()
+
+    def _snapshot(self):
+        now = self.end_time or time.monotonic()
+        paused_time = self.paused_time + (now - self.paused_since if self.paused_since is not None else 0)
+        elapsed = max(1e-6, now - self.start_time - paused_time)
+        worked = self.processed + self.errors
+        done = worked + self.skipped
+        files_per_sec = worked / elapsed
+        bytes_per_sec = self.done_bytes / elapsed
+
+        # Estimate from pixels, or bytes, when every file's is known, otherwise from file count
+        eta = None
+        if not self.finished and worked:
+            if self.total_pixels and self.done_pixels:
+                eta = max(0, self.total_pixels - self.done_pixels) / (self.done_pixels / elapsed)
+            elif self.total_bytes and bytes_per_sec:
+                eta = max(0, self.total_bytes - self.done_bytes) / bytes_per_sec
+            else:
+                eta = (self.total - done) / files_per_sec
+
+        return {
+            "total": self.total,
+            "done": done,
+            "processed": self.processed,
+            "errors": self.errors,
+            "skipped": self.skipped,
+            "current": self.current,
+            "elapsed": elapsed,
+            "files_per_sec": files_per_sec,
+            "mb_per_sec": bytes_per_sec / (1024 * 1024),
+            "eta": eta,
+            "paused": self.paused_since is not None,
+            "cancelled": self.cancelled,
+            "finished": self.finished
+        }
+
+
+def format_batch_status(snapshot):
+    """Describe a progress snapshot in one status-bar line"""
+    if snapshot["finished"]:
+        text = "Cancelled" if snapshot["cancelled"] else "Completed"
+        text += f": {snapshot['processed']} files processed"
+        if snapshot["errors"] > 0:
+            text += f", {snapshot['errors']} errors"
+        if snapshot["skipped"] > 0:
+            text += f", {snapshot['skipped']} by other nodes"
+        if snapshot["cancelled"]:
+            text += f", {snapshot['total'] - snapshot['done']} left"
+        return text + f" in {snapshot['elapsed']:.1f}s ({snapshot['files_per_sec']:.1f} files/s)"
+
+    if snapshot["paused"]:
+        return f"Paused at {snapshot['done']}/{snapshot['total']}"
+
+    text = f"Processing {snapshot['done']}/{snapshot['total']}"
+    if snapshot["current"]:
+        text += f" ({os.path.basename(snapshot['current'])})"
+    text += f" | {snapshot['files_per_sec']:.1f} files/s, {snapshot['mb_per_sec']:.1f} MB/s"
+    if snapshot["eta"] is not None:
+        minutes, seconds = divmod(int(snapshot["eta"]), 60)
+        text += f" | ETA {minutes}:{seconds:02d}"
+    return text
+
+
+# Seconds between forced syncs of the batch journal to disk
+JOURNAL_SYNC_INTERVAL = 1.0
+
+
+class BatchJournal:
+    """Append-only record of a batch, so an interrupted run can be resumed.
+
+    The batch header is synced to disk straight away. Each file's "start" and
+    "done" records are handed to the OS as they happen but only fsynced once
+    per JOURNAL_SYNC_INTERVAL, so a crash of the app loses nothing and a crash
+    of the machine at worst redoes the last second of files.
+    """
+
+    def __init__(self, path=None):
+        # Chosen from the batch by begin() unless given, as when resuming
+        self.path = path
+        self._file = None
+        self._last_sync = 0.0
+        self._lock = threading.Lock()
+
+    def begin(self, options, output, files, variants=None):
+        """Start a fresh journal for a batch of files, run with one or several presets"""
+        try:
+            with self._lock:
+                self.path = self.path or journal_path(files, output)
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self._file = open(self.path, "w", encoding="utf-8")
+        except OSError as e:
+            # The batch itself can still run, it just can't be resumed
+            print(f"Batch journal disabled: {str(e)}")
+            return
+        header = {"event": "batch", "options": options, "output": output, "files": files}
+        if variants:
+            header["variants"] = variants
+        self._write(header, sync=True)
+
+    def record(self, event, file_path, **fields):
+        """Append a state change for one file"""
+        self._write(dict(fields, event=event, path=file_path))
+
+    def close(self, remove=False):
+        """Sync and close the journal, deleting it if nothing is left to resume"""
+        with self._lock:
+            if self._file:
+                self._sync()
+                self._file.close()
+                self._file = None
+        if remove:
+            discard_journal(self.path)
+
+    def _write(self, record, sync=False):
+        with self._lock:
+            if not self._file:
+                return
+            self._file.write(json.dumps(record) + "\n")
+            self._file.flush()
+            if sync or time.monotonic() - self._last_sync >= JOURNAL_SYNC_INTERVAL:
+                self._sync()
+
+    def _sync(self):
+        os.fsync(self._file.fileno())
+        self._last_sync = time.monotonic()
+
+
+def journal_path(files, output):
+    """The journal of a batch, so batches run at the same time or one after another keep their own"""
+    import hashlib
+
+    destination = output.get("archive") or output.get("output_dir")
+    key = json.dumps([sorted(os.path.abspath(file_path) for file_path in files),
+                      os.path.abspath(destination) if destination else None])
+    return os.path.join(JOURNAL_DIR, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".jsonl")
+
+
+def load_journal(path):
+    """Read an interrupted batch back from its journal.
+
+    Returns None when there is no usable journal. Otherwise returns the batch's
+    options and output settings (and presets, for a multi-preset batch), all of
+    its files, the files still pending (those not yet completed successfully),
+    the output path or paths given to each file that was started and the
+    journal's path.
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            lines = f.readlines()
+    except OSError:
+        return None
+
+    header = None
+    done = set()
+    outputs = {}
+    for line in lines:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            # A record torn by the crash
+            continue
+        event = record.get("event")
+        if event == "batch":
+            header = record
+        elif event == "start":
+            outputs[record["path"]] = record.get("output")
+        elif event == "done" and not record.get("error"):
+            # Failed files stay pending, so resuming tries them again
+            done.add(record["path"])
+
+    if header is None:
+        return None
+
+    files = header["files"]
+    pending = [file_path for file_path in files if file_path not in done]
+    return {
+        "options": preset_to_options(header["options"]),
+        "output": header["output"],
+        "files": files,
+        "pending": pending,
+        "outputs": {file_path: outputs[file_path] for file_path in pending if outputs.get(file_path)},
+        "variants": [(name, preset_to_options(options), output)
+                     for name, options, output in header.get("variants") or []] or None,
+        "path": path
+    }
+
+
+def latest_journal():
+    """The most recently interrupted batch with files left, or None.
+
+    Journals that are unreadable or have nothing left to do are deleted.
+    """
+    import glob
+
+    paths = glob.glob(os.path.join(JOURNAL_DIR, "*.jsonl"))
+    for path in sorted(paths, key=os.path.getmtime, reverse=True):
+        state = load_journal(path)
+        if state and state["pending"]:
+            return state
+        discard_journal(path)
+    return None
+
+
+def discard_journal(path):
+    """Delete a batch journal"""
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+# Cluster mode
+
+# Seconds a lease lasts without being renewed before another node takes its file over
+LEASE_TIMEOUT = 300.0
+# Seconds between looks at files leased by other nodes, once a node has nothing else to start
+LEASE_POLL_INTERVAL = 5.0
+
+
+class ClusterLeases:
+    """Lease files through which several machines share the files of one batch.
+
+    Every node runs the same batch with a lease folder on the shared
+    filesystem. A node claims a file by creating its lease with O_EXCL, which
+    only one node can do, and touches its leases every third of the timeout
+    while it works. A lease left untouched for longer than the timeout belongs
+    to a node that died: the first node to rename it aside takes the file
+    over, reusing the output paths the dead node had planned. Finished files
+    get a done marker so no node starts them again, and output names are
+    claimed the same way, so two nodes never write to the same path. Lease
+    ages are measured with the file server's clock, not the nodes' own.
+    """
+
+    def __init__(self, directory, node=None, timeout=LEASE_TIMEOUT):
+        import socket
+
+        self.directory = directory
+        self.node = node or f"{socket.gethostname()}-{os.getpid()}"
+        self.timeout = timeout
+        # Lease records of the files this node holds
+        self._held = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._heartbeat = None
+        os.makedirs(os.path.join(directory, "names"), exist_ok=True)
+        self._clock_path = os.path.join(directory, f"{self.node}.clock")
+
+    def start(self):
+        """Start renewing held leases in the background"""
+        self._stopped.clear()
+        self._heartbeat = threading.Thread(target=self._renew_leases, daemon=True)
+        self._heartbeat.start()
+
+    def stop(self):
+        """Stop renewing leases and give back any still held, such as files a cancel interrupted"""
+        self._stopped.set()
+        if self._heartbeat:
+            self._heartbeat.join()
+            self._heartbeat = None
+        for file_path in list(self._held):
+            self.release(file_path)
+        self._remove(self._clock_path)
+
+    def claim(self, file_path):
+        """Try to take a file for this node.
+
+        Returns "claimed", "done" or "held" (by a live node) with a record:
+        the done marker for "done", and for "claimed" the lease of the dead
+        node it was taken over from, if any.
+        """
+        import uuid
+
+        done = self._read(self._path(file_path, ".done"))
+        if done is not None:
+            return "done", done
+
+        lease_path = self._path(file_path, ".lease")
+        record = {"node": self.node, "token": uuid.uuid4().hex, "path": os.path.abspath(file_path)}
+        previous = None
+        if not self._create(lease_path, record):
+            previous = self._read(lease_path)
+            try:
+                mtime = os.stat(lease_path).st_mtime
+                if self._server_time() - mtime <= self.timeout:
+                    return "held", None
+            except FileNotFoundError:
+                # Finished or given back just now; look again on the next round
+                return "held", None
+
+            # Move the expired lease aside; of several nodes trying, only one succeeds
+            stale_path = f"{lease_path}.{record['token']}.stale"
+            try:
+                os.rename(lease_path, stale_path)
+            except OSError:
+                return "held", None
+            try:
+                stale = self._read(stale_path)
+                if (stale or {}).get("token") != (previous or {}).get("token") \
+                        or os.stat(stale_path).st_mtime != mtime:
+                    # Renewed or taken over since it was read: put it back
+                    try:
+                        os.link(stale_path, lease_path)
+                    except OSError:
+                        pass
+                    return "held", None
+            finally:
+                self._remove(stale_path)
+            if not self._create(lease_path, record):
+                return "held", None
+
+        with self._lock:
+            self._held[file_path] = record
+        return "claimed", previous
+
+    def note_outputs(self, file_path, outputs):
+        """Record the output paths planned for a held file, for a node that may have to take it over"""
+        with self._lock:
+            record = self._held.get(file_path)
+            if record is None:
+                return
+            record["outputs"] = outputs
+        self._write(self._path(file_path, ".lease"), record)
+
+    def complete(self, file_path, status):
+        """Mark a held file as done by this node and give up its lease"""
+        with self._lock:
+            record = self._held.pop(file_path, None)
+        if record is None:
+            return
+        self._write(self._path(file_path, ".done"), dict(record, status=status))
+        self._remove_lease(file_path, record)
+
+    def release(self, file_path):
+        """Give up a held file unfinished, so another node can start it straight away"""
+        with self._lock:
+            record = self._held.pop(file_path, None)
+        if record is not None:
+            self._remove_lease(file_path, record)
+
+    def reserve_name(self, output_path, file_path):
+        """Claim an output path for a file, returning False if it belongs to another file"""
+        import hashlib
+
+        key = hashlib.sha1(os.path.abspath(output_path).encode("utf-8")).hexdigest()
+        path = os.path.join(self.directory, "names", key)
+        owner = {"path": os.path.abspath(file_path), "node": self.node}
+        if self._create(path, owner):
+            return True
+        record = self._read(path)
+        return record is not None and record.get("path") == owner["path"]
+
+    def _renew_leases(self):
+        while not self._stopped.wait(self.timeout / 3):
+            with self._lock:
+                held = list(self._held.items())
+            for file_path, record in held:
+                lease_path = self._path(file_path, ".lease")
+                try:
+                    os.utime(lease_path, None)
+                except FileNotFoundError:
+                    # Moved aside by a node that took this one for dead; take it back if still free
+                    with self._lock:
+                        if file_path not in self._held:
+                            continue
+                    if not self._create(lease_path, record):
+                        print(f"Lease on {file_path} was taken over by another node")
+                except OSError as e:
+                    print(f"Error renewing lease on {file_path}: {str(e)}")
+
+    def _remove_lease(self, file_path, record):
+        # Leave the lease alone if another node has taken it over since
+        lease_path = self._path(file_path, ".lease")
+        if (self._read(lease_path) or {}).get("token") == record["token"]:
+            self._remove(lease_path)
+
+    def _server_time(self):
+        """The file server's current time, read back from a file touched just now"""
+        with open(self._clock_path, "a"):
+            pass
+        os.utime(self._clock_path, None)
+        return os.stat(self._clock_path).st_mtime
+
+    def _path(self, file_path, suffix):
+        import hashlib
+
+        key = hashlib.sha1(os.path.abspath(file_path).encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, key + suffix)
+
+    def _create(self, path, record):
+        """Create a file holding a record, returning False if it already exists"""
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(record, f)
+        return True
+
+    def _write(self, path, record):
+        """Replace a file with a record in one step"""
+        temp_path = f"{path}.{self.node}{PARTIAL_SUFFIX}"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(record, f)
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"Error writing lease file {path}: {str(e)}")
+
+    def _read(self, path):
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class BatchProcessor:
+    """Runs a list of files through an ImageProcessor without touching Tk.
+
+    Options and output settings are taken once for the whole batch; progress is
+    reported through a BatchProgress that the UI or headless mode polls, and
+    pause(), resume() and cancel() may be called from any thread. Files run on
+    several workers, admitted in queue order while their estimated memory
+    fits in the budget. Given variants, a list of (preset name, options,
+    output) triples, each file is decoded once and saved with every preset.
+
+    Zip and tar archives in the list are processed member by member, several
+    at once, into an output archive. With output["archive"] set, every output
+    of the batch goes into that one archive instead of separate files.
+    """
+
+    def __init__(self, processor, options, output, journal=None, resume_outputs=None, workers=None,
+                 memory_budget=None, process_workers=None, variants=None, profiler=None, order=None, pinned=None,
+                 cluster=None):
+        self.processor = processor
+        # Leases sharing the batch with other nodes, in cluster mode
+        self.cluster = cluster
+        # Order files start in (see BatchScheduler), and the pinned files for "priority"
+        self.order = order or settings.get("queue_order") or "fifo"
+        self.pinned = pinned or []
+        self.scheduler = None
+        # Pixels in each file of the running batch, from its header (None if unknown)
+        self.pixels = {}
+        # Profiler keeping reports of slow files, if profiling is on
+        self.profiler = profiler
+        # Worker processes for the per-pixel stage, if enabled
+        self.process_workers = process_workers
+        # Snapshots taken once, so the UI can change while the batch runs
+        self.options = freeze_options(options)
+        self.output = freeze_options(output)
+        self.variants = [(name, freeze_options(variant_options), freeze_options(variant_output))
+                         for name, variant_options, variant_output in variants] if variants else None
+        self.journal = journal
+        # Output paths of files an interrupted run had started, to be redone in place
+        self.resume_outputs = resume_outputs or {}
+        default_workers, default_budget = batch_resources()
+        self.workers = workers or default_workers
+        self.memory_budget = memory_budget or default_budget
+        self.control = BatchControl()
+        self.progress = BatchProgress(0)
+        # Output paths handed out in this batch but possibly not written yet
+        self._reserved = set()
+        for paths in self.resume_outputs.values():
+            for output_path, (_, _, output) in zip([paths] if isinstance(paths, str) else paths,
+                                                   self.variants or [(None, self.options, self.output)]):
+                self._reserved.update(self.output_files(output_path, output))
+        self._plan_lock = threading.Lock()
+        self.plan = None
+        # Archive collecting every output, if the output settings ask for one
+        self.archive = None
+        # Stage timings of this batch alone
+        self.stage_stats = StageStats()
+
+    def pause(self):
+        """Pause the batch at the next file, frame or strip"""
+        self.control.pause()
+        self.progress.set_paused(True)
+
+    def resume(self):
+        """Continue a paused batch where it stopped"""
+        self.progress.set_paused(False)
+        self.control.resume()
+
+    def cancel(self):
+        """Stop the batch, leaving unfinished files as they were"""
+        self.control.cancel()
+
+    def run(self, files):
+        """Process (item_id, file_path) pairs in order until done or cancelled"""
+        completed = False
+        try:
+            completed = self.run_batch(files)
+        except Exception as e:
+            # Such as a lease folder or archive that can no longer be written
+            print(f"Error running batch: {str(e)}")
+        finally:
+            self.end_batch(completed)
+
+    def run_batch(self, files):
+        """Run the batch, returning whether it got through every file"""
+        paths = [file_path for _, file_path in files]
+        sizes = {file_path: self._file_size(file_path) for file_path in paths}
+        self.progress = BatchProgress(len(files), sum(sizes.values()))
+        self.progress.set_paused(self.control.paused)
+
+        # Headers give the ETA in pixels, and the order for anything but "fifo". Files in queue
+        # order start straight away while the headers are read behind them; other orders read
+        # them first, on a few threads, stopping if the batch is paused or cancelled.
+        probes = {}
+        if self.order == "fifo":
+            threading.Thread(target=self.probe_batch, args=(paths, True), daemon=True).start()
+        else:
+            try:
+                probes = self.probe_batch(paths)
+            except BatchCancelled:
+                return False
+
+        # Build (or load) the key tables once, so no file pays for them
+        try:
+            self.plan = compile_options(self.options, self.output).install()
+            for _, options, output in self.variants or []:
+                compile_options(options, output).install()
+        except Exception as e:
+            for item_id, file_path in files:
+                self.finish_item(item_id, file_path, f"Error: {str(e)[:20]}...", error=True)
+            print(f"Error preparing batch: {str(e)}")
+            return False
+
+        if self.output.get("archive"):
+            # An unfinished archive can't be added to later, so these batches aren't journaled
+            self.journal = None
+            try:
+                self.archive = ArchiveWriter(self.output["archive"])
+            except Exception as e:
+                for item_id, file_path in files:
+                    self.finish_item(item_id, file_path, f"Error: {str(e)[:20]}...", error=True)
+                print(f"Error creating archive: {str(e)}")
+                return False
+
+        if self.cluster:
+            # The lease folder records what is done, for every node at once
+            self.journal = None
+
+        if self.journal:
+            self.journal.begin(self.options, self.output, [file_path for _, file_path in files], self.variants)
+            for file_path, output_path in self.resume_outputs.items():
+                self.journal.record("start", file_path, output=output_path)
+
+        budget = MemoryBudget(self.memory_budget, self.workers)
+        STAGE_STATS.attach(self.stage_stats)
+        if self.profiler:
+            self.profiler.start()
+        if self.cluster:
+            self.cluster.start()
+        try:
+            costs = {file_path: self.estimate_cost(file_path) for file_path, info in probes.items() if info}
+            # Files are compared by pixels, or all of them by file size if any header couldn't be read
+            pixels = {file_path: self.pixels.get(file_path) for file_path in probes}
+            if not all(pixels.values()):
+                pixels = {file_path: sizes[file_path] for file_path in probes}
+            self.scheduler = BatchScheduler(files, self.order, self.pinned, pixels, costs, self.memory_budget,
+                                            self.workers)
+
+            # Files other nodes hold, waiting to be finished or taken over
+            deferred = []
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                try:
+                    for item_id, file_path in self.scheduler:
+                        self.control.checkpoint()
+
+                        if not os.path.exists(file_path):
+                            self.scheduler.finished(file_path)
+                            self.finish_item(item_id, file_path, "File not found", error=True)
+                            continue
+                        if self.cluster and not self.claim_item(item_id, file_path, sizes[file_path], deferred):
+                            self.scheduler.finished(file_path)
+                            continue
+
+                        # Admit the job once its estimated memory fits
+                        cost = costs[file_path] if file_path in costs else self.estimate_cost(file_path)
+                        budget.acquire(cost, self.control)
+                        executor.submit(self.run_job, item_id, file_path, sizes[file_path], cost, budget)
+
+                    # Stay until every file is done, taking over those whose node dies
+                    while deferred:
+                        self.wait_for_leases()
+                        waiting, deferred = deferred, []
+                        for item_id, file_path in waiting:
+                            if self.claim_item(item_id, file_path, sizes[file_path], deferred):
+                                cost = costs[file_path] if file_path in costs else self.estimate_cost(file_path)
+                                budget.acquire(cost, self.control)
+                                executor.submit(self.run_job, item_id, file_path, sizes[file_path], cost, budget)
+                except BatchCancelled:
+                    pass
+        finally:
+            if self.cluster:
+                self.cluster.stop()
+            STAGE_STATS.detach(self.stage_stats)
+            if self.profiler:
+                self.profiler.stop()
+
+        return not self.control.cancelled
+
+    def end_batch(self, completed):
+        """Finish the progress, archive and journal however the batch ended"""
+        if self.archive:
+            # Keep whatever was finished, even after a cancel or an error
+            try:
+                self.archive.close()
+            except Exception as e:
+                print(f"Error finishing archive: {str(e)}")
+                self.archive.abort()
+
+        self.progress.finish(cancelled=self.control.cancelled)
+        if self.journal:
+            # Keep the journal after a cancel or an error, so the rest can still be resumed
+            self.journal.close(remove=completed)
+
+    def probe_batch(self, paths, background=False):
+        """Read every file's header, then record the pixel counts and the batch's total.
+
+        Raises BatchCancelled if the batch is cancelled first, unless reading in the background.
+        """
+        try:
+            probes = probe_files(paths, self.control)
+        except BatchCancelled:
+            if background:
+                return {}
+            raise
+        pixels = {file_path: probe_pixels(info) for file_path, info in probes.items()}
+        self.pixels.update(pixels)
+        # The ETA goes by pixels when every file's are known, otherwise by bytes
+        if all(pixels.values()):
+            self.progress.set_total_pixels(sum(pixels.values()))
+        return probes
+
+    def file_pixels(self, file_path):
+        """Pixels in a file, from its header, read now if the batch hasn't yet (None if unknown)"""
+        if file_path not in self.pixels:
+            try:
+                self.pixels[file_path] = probe_pixels(probe_image(file_path))
+            except Exception:
+                self.pixels[file_path] = None
+        return self.pixels[file_path]
+
+    def run_job(self, item_id, file_path, size, cost, budget):
+        """Process one admitted file on a worker thread"""
+        try:
+            self.progress.start_item(item_id, file_path)
+            output_path = self.resume_outputs.get(file_path) or self.plan_output(file_path)
+            if self.journal:
+                self.journal.record("start", file_path, output=output_path)
+            if self.cluster:
+                self.cluster.note_outputs(file_path, output_path)
+            if self.profiler:
+                self.profiler.run(file_path, self.profile_output_dir(output_path), self.process_item,
+                                  item_id, file_path, output_path)
+            else:
+                self.process_item(item_id, file_path, output_path)
+            if self.cluster:
+                self.cluster.complete(file_path, "Completed")
+            self.finish_item(item_id, file_path, "Completed", size)
+        except BatchCancelled:
+            if self.cluster:
+                self.cluster.release(file_path)
+            self.progress.cancel_item(item_id, file_path)
+        except Exception as e:
+            print(f"Error processing {file_path}: {str(e)}")
+            status = f"Error: {str(e)[:20]}..."
+            if self.cluster:
+                self.cluster.complete(file_path, status)
+            self.finish_item(item_id, file_path, status, size, error=True)
+        finally:
+            budget.release(cost)
+            self.scheduler.finished(file_path)
+
+    def claim_item(self, item_id, file_path, size, deferred):
+        """Take a file's lease in cluster mode, adding it to deferred while another node holds it"""
+        state, record = self.cluster.claim(file_path)
+        if state == "claimed":
+            if record and record.get("outputs"):
+                # Redo a dead node's file under the names it had planned
+                self.resume_outputs[file_path] = record["outputs"]
+            return True
+        if state == "done":
+            status = record.get("status", "Completed")
+            self.progress.skip_item(item_id, file_path, f"{status} ({record.get('node')})", size,
+                                    self.file_pixels(file_path) or 0)
+        else:
+            self.progress.update_item(item_id, file_path, "On another node")
+            deferred.append((item_id, file_path))
+        return False
+
+    def wait_for_leases(self):
+        """Sleep until it is time to look at other nodes' leases again, stopping early if cancelled"""
+        deadline = time.monotonic() + min(LEASE_POLL_INTERVAL, self.cluster.timeout / 3)
+        while time.monotonic() < deadline:
+            self.control.checkpoint()
+            time.sleep(0.1)
+
+    def process_item(self, item_id, file_path, output_path):
+        """Process one queued file or archive"""
+        if is_archive(file_path):
+            return self.process_archive(file_path, output_path, item_id)
+        return self.process_file(file_path, output_path)
+
+    def profile_output_dir(self, output_path):
+        """The folder a file's outputs go to, where its profile goes unless a profile folder is set"""
+        if self.archive:
+            return os.path.dirname(os.path.abspath(self.output["archive"]))
+        first = output_path[0] if isinstance(output_path, list) else output_path
+        return os.path.dirname(os.path.abspath(first))
+
+    def estimate_cost(self, file_path, data=None):
+        """Estimated peak memory of a file (or of an image's bytes), or none if its header can't be read"""
+        import io
+
+        if data is None and is_archive(file_path):
+            # Archives run on their own and budget their members themselves
+            return self.memory_budget
+
+        try:
+            variants = self.variants or [(None, self.options, self.output)]
+            # Every preset, and every format of an output set, holds an image being encoded
+            outputs = sum(len(output.get("formats") or [output["format"]]) if output.get("sizes") else 1
+                          for _, _, output in variants)
+            return max(self.processor.estimate_memory(file_path if data is None else io.BytesIO(data), options,
+                                                      output["format"], outputs)
+                       for _, options, output in variants)
+        except Exception:
+            # Let the worker report the unreadable file
+            return 0
+
+    def finish_item(self, item_id, file_path, status, size=0, error=False):
+        """Record a finished file in the progress and the journal"""
+        if self.journal:
+            self.journal.record("done", file_path, status=status, error=error)
+        self.progress.finish_item(item_id, file_path, status, size, error, self.file_pixels(file_path) or 0)
+
+    def plan_output(self, file_path):
+        """Choose a file's output path, distinct from others in the batch (with variants, one per preset)"""
+        output = self.output
+        if self.archive:
+            # A name inside the output archive, which keeps names unique itself
+            return render_output_name(file_path, output["naming_pattern"]) + "." + output["format"]
+        if is_archive(file_path):
+            # Archives give one output archive of the same type
+            extension = split_archive_name(os.path.basename(file_path))[1].lstrip(".")
+            with self._plan_lock:
+                return self.reserve_output(file_path, lambda: build_output_path(
+                    file_path, extension, output["output_dir"], output["naming_pattern"], output["overwrite"],
+                    self._reserved), {})
+
+        variants = self.variants or [(None, self.options, self.output)]
+        output_paths = []
+        with self._plan_lock:
+            for name, _, output in variants:
+                output_paths.append(self.reserve_output(file_path, lambda: build_output_path(
+                    file_path, output["format"], output["output_dir"], output["naming_pattern"], output["overwrite"],
+                    self._reserved, name, output.get("sizes"), output.get("formats"), output.get("srcset")), output))
+        return output_paths if self.variants else output_paths[0]
+
+    def reserve_output(self, file_path, build, output):
+        """Reserve the path build() gives for a file and the files it stands for, retrying while others own it"""
+        while True:
+            output_path = build()
+            self._reserved.update(self.output_files(output_path, output))
+            if not self.cluster or self.cluster.reserve_name(output_path, file_path):
+                return output_path
+
+    @staticmethod
+    def output_files(output_path, output):
+        """An output path together with the files of its responsive set, if the output settings ask for one"""
+        if not output.get("sizes"):
+            return [output_path]
+        formats = output.get("formats") or [output["format"]]
+        return [output_path] + output_set_paths(output_path, output["sizes"], formats, output.get("srcset", False))
+
+    def process_file(self, file_path, output_path=None):
+        """Process and save a single file, returning the output path (or paths, with variants)"""
+        output = self.output
+        output_path = output_path or self.plan_output(file_path)
+        if is_archive(file_path):
+            return self.process_archive(file_path, output_path)
+        if self.archive:
+            # Animated images give their first frame inside archives
+            img = self.processor.load_image(file_path)
+            stem = os.path.splitext(output_path)[0]
+            return [self.archive.add(name, data) for name, data in self.encode_outputs(img, stem)]
+        if self.variants:
+            return self.process_variants(file_path, output_path)
+
+        if self.processor.get_frame_count(file_path) > 1:
+            # Animated or multi-page image
+            return self.process_animation(file_path, output_path, self.options, output)
+
+        img = self.processor.load_image(file_path)
+        options = self.processor.output_set_options(self.options, output.get("sizes"), img.size)
+        if self.process_workers:
+            with self.process_workers.process(self.processor, img, options, self.control) as shared:
+                return self.save_result(shared.image(), output_path, output)
+
+        result = self.processor.process_image(img, options, self.control)
+        return self.save_result(result, output_path, output)
+
+    def process_animation(self, file_path, output_path, options, output):
+        """Process and save an animated or multi-page file, as a responsive output set if asked for"""
+        if output.get("sizes"):
+            return self.processor.process_animation_set(file_path, output_path, options, output["sizes"],
+                                                        output.get("formats") or [output["format"]],
+                                                        output["quality"], output["optimize"],
+                                                        output["preserve_metadata"], output.get("srcset", False),
+                                                        self.control)
+        return self.processor.process_animation(file_path, output_path, options, output["format"],
+                                                output["quality"], output["optimize"],
+                                                output["preserve_metadata"], self.control)
+
+    def save_result(self, result, output_path, output):
+        """Save a processed image as a single file, or as a responsive output set"""
+        if output.get("sizes"):
+            return self.processor.save_output_set(result, output_path, output["sizes"],
+                                                  output.get("formats") or [output["format"]], output["quality"],
+                                                  output["optimize"], output["preserve_metadata"],
+                                                  output.get("srcset", False))
+        return self.processor.save_image(result, output_path, output["format"], output["quality"],
+                                         output["optimize"], output["preserve_metadata"])
+
+    def process_variants(self, file_path, output_paths):
+        """Decode a file once, process it with every preset and save all the results at once"""
+        if self.processor.get_frame_count(file_path) > 1:
+            # Frames are streamed rather than held, so animations take one pass per preset
+            return [self.process_animation(file_path, output_path, options, output)
+                    for (_, options, output), output_path in zip(self.variants, output_paths)]
+
+        img = self.processor.load_image(file_path)
+        options_list = [self.processor.output_set_options(options, output.get("sizes"), img.size)
+                        for _, options, output in self.variants]
+        results = self.processor.process_variants(img, options_list, self.control)
+        self.control.checkpoint()
+
+        # Encoders release the GIL, so the outputs are written side by side
+        with ThreadPoolExecutor(max_workers=len(results)) as executor:
+            saves = [executor.submit(self.save_result, result, output_path, output)
+                     for result, output_path, (_, _, output) in zip(results, output_paths, self.variants)]
+            return [save.result() for save in saves]
+
+    def process_archive(self, file_path, output_path, item_id=None):
+        """Process every image in a zip or tar archive into an output archive.
+
+        Members are streamed from the archive, admitted within the memory
+        budget and processed on several workers at once, and each result is
+        written into the output archive as soon as it is ready.
+        """
+        writer = self.archive
+        prefix = ""
+        if writer:
+            # Inside the batch's archive, an input archive gets its own folder
+            prefix = os.path.splitext(output_path)[0] + "/"
+        else:
+            writer = ArchiveWriter(output_path)
+
+        budget = MemoryBudget(self.memory_budget, self.workers)
+        failures = []
+        counts = {"read": 0, "done": 0}
+        counts_lock = threading.Lock()
+
+        def member_job(name, data, cost):
+            try:
+                image = open_image(data)
+                # Members keep their folders and are named like separate files would be
+                folder, _, filename = name.rpartition("/")
+                stem = prefix + (folder + "/" if folder else "") + render_output_name(filename,
+                                                                                      self.output["naming_pattern"])
+                for entry_name, encoded in self.encode_outputs(image, stem):
+                    with STAGE_STATS.time("archive", len(encoded)):
+                        writer.add(entry_name, encoded)
+            except BatchCancelled:
+                pass
+            except Exception as e:
+                print(f"Error processing {file_path}:{name}: {str(e)}")
+                failures.append(name)
+            finally:
+                budget.release(cost)
+                with counts_lock:
+                    counts["done"] += 1
+                    status = f"Processing {counts['done']}/{counts['read']}"
+                if item_id is not None:
+                    self.progress.update_item(item_id, file_path, status)
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                try:
+                    for name, data in iter_archive_images(file_path):
+                        self.control.checkpoint()
+                        cost = len(data) + self.estimate_cost(name, data)
+                        budget.acquire(cost, self.control)
+                        with counts_lock:
+                            counts["read"] += 1
+                        executor.submit(member_job, archive_member_name(name), data, cost)
+                        del data
+                except BatchCancelled:
+                    raise
+                except Exception as e:
+                    raise Exception(f"Failed to read archive: {str(e)}")
+        except BaseException:
+            if writer is not self.archive:
+                writer.abort()
+            raise
+
+        # Running members finish even after a cancel, so check again before keeping the archive
+        if self.control.cancelled and writer is not self.archive:
+            writer.abort()
+            raise BatchCancelled()
+        if writer is not self.archive:
+            writer.close()
+        if failures:
+            raise Exception(f"{len(failures)} of {counts['read']} images failed")
+        return output_path
+
+    def encode_outputs(self, image, stem):
+        """Process a decoded image with every preset and encode the results in memory.
+
+        Returns (name, bytes) pairs named after stem, the way separate files
+        would be named: a _{preset} suffix per preset and -{width}w per size
+        of an output set.
+        """
+        variants = self.variants or [(None, self.options, self.output)]
+        options_list = [self.processor.output_set_options(options, output.get("sizes"), image.size)
+                        for _, options, output in variants]
+        if self.variants:
+            results = self.processor.process_variants(image, options_list, self.control)
+        else:
+            results = [self.processor.process_image(image, options_list[0], self.control)]
+
+        entries = []
+        for (preset, _, output), result in zip(variants, results):
+            name = f"{stem}_{preset}" if preset else stem
+            if output.get("sizes"):
+                for width, level in self.processor.build_output_set(result, output["sizes"]):
+                    for format_option in output.get("formats") or [output["format"]]:
+                        data = self.processor.encode_image(level, format_option, output["quality"],
+                                                           output["optimize"])
+                        entries.append((f"{name}-{width}w.{format_option.lower()}", data))
+            else:
+                data = self.processor.encode_image(result, output["format"], output["quality"], output["optimize"])
+                entries.append((f"{name}.{output['format'].lower()}", data))
+        return entries
+
+    @staticmethod
+    def _file_size(file_path):
+        try:
+            return os.path.getsize(file_path)
+        except OSError:
+            return 0
+
+
+# Library API
+#
+# These functions take image bytes, a path, a file-like object or a PIL image
+# and never touch Tk or (unless given a path) the disk. They keep no state
+# between calls, so any number of threads may call them at once.
+
+def open_image(source):
+    """Decode bytes, a path, a file-like object or a PIL image into an RGBA image.
+
+    Animated and multi-page sources give their first frame. PIL images already
+    in RGBA are used as they are; processing never modifies its input.
+    """
+    import io
+
+    if isinstance(source, Image.Image):
+        if source.mode == "RGBA":
+            return source
+        with STAGE_STATS.time("convert", source.width * source.height * 4):
+            return source.convert("RGBA")
+    nbytes = 0
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        nbytes = len(source)
+        source = io.BytesIO(source)
+    try:
+        with Image.open(source) as im:
+            with STAGE_STATS.time("decode", nbytes):
+                im.load()
+            with STAGE_STATS.time("convert", im.width * im.height * 4):
+                return im.convert("RGBA")
+    except Exception as e:
+        raise Exception(f"Failed to load image: {str(e)}")
+
+
+def resolve_options(options=None, preset=None):
+    """Combine a preset (by name or as a dict) with option overrides into validated options"""
+    if isinstance(preset, str):
+        preset_name = preset
+        preset = get_preset(preset_name)
+        if preset is None:
+            raise Exception(f"Preset '{preset_name}' not found.")
+    merged = dict(preset or {}, **(options or {}))
+    # Library calls never touch the plan cache on disk
+    return compile_options(preset_to_options(merged), use_cache=False).install().options
+
+
+def process(source, options=None, preset=None):
+    """Remove the background of an image in memory, returning the processed RGBA PIL image.
+
+    options holds any processing options to change (see DEFAULT_OPTIONS),
+    applied on top of preset, a preset name or dict. Invalid options raise an
+    Exception listing every problem.
+    """
+    return ImageProcessor().process_image(open_image(source), resolve_options(options, preset))
+
+
+def convert(source, options=None, preset=None, format_option=None, quality=None, optimize=None, output=None):
+    """Process an image in memory and encode it, returning the encoded bytes.
+
+    format_option, quality and optimize default to the preset's output
+    settings, then to PNG. Given a writable file-like output, the bytes are
+    written to it and output is returned instead.
+    """
+    if isinstance(preset, str):
+        preset_name = preset
+        preset = get_preset(preset_name)
+        if preset is None:
+            raise Exception(f"Preset '{preset_name}' not found.")
+    preset = preset or {}
+
+    format_option = format_option or preset.get("output_format", "png")
+    if format_option.lower() not in ImageProcessor.FORMAT_MAP:
+        raise Exception(f"Invalid options: unknown output format {format_option!r}")
+    quality = preset.get("output_quality", 95) if quality is None else quality
+    optimize = preset.get("output_optimize", True) if optimize is None else optimize
+
+    processor = ImageProcessor()
+    result = processor.process_image(open_image(source), resolve_options(options, preset))
+    data = processor.encode_image(result, format_option, quality, optimize)
+    if output is None:
+        return data
+    output.write(data)
+    return output
+
+
+# Conversion service
+
+SERVICE_PORT = 8765
+
+# Largest request body the service accepts
+SERVICE_MAX_BODY = 256 * 1024 * 1024
+
+# Seconds an idle keep-alive connection is held open
+SERVICE_IDLE_TIMEOUT = 30
+
+# Distinct preset and option combinations whose resolved options the service keeps
+SERVICE_OPTIONS_CACHE = 64
+
+# Content types of the output formats
+FORMAT_CONTENT_TYPES = {"PNG": "image/png", "JPEG": "image/jpeg", "WEBP": "image/webp", "TIFF": "image/tiff",
+                        "BMP": "image/bmp"}
+
+
+class ServiceBusy(Exception):
+    """Raised when the service already has as many requests waiting as it allows"""
+
+
+class ConversionService:
+    """Converts images for other programs over HTTP on this machine.
+
+    A fixed pool of ImageProcessors, one per concurrent conversion, is warmed
+    up before the first request, so requests pay neither interpreter start-up
+    nor first-use table building. Requests beyond the pool wait in line up to
+    max_pending, and are turned away as busy past that. Latency is recorded
+    per request and summarised by stats().
+
+    Files named in requests must lie under path_root if one is given; with
+    allow_paths False, requests can only send image bytes.
+    """
+
+    def __init__(self, workers=None, max_pending=None, process_workers=None, path_root=None, allow_paths=True):
+        import queue
+
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = self.workers * 4 if max_pending is None else max_pending
+        self.process_workers = process_workers
+        self.path_root = os.path.realpath(path_root) if path_root else None
+        self.allow_paths = allow_paths or bool(path_root)
+        # Resolved options by preset and overrides, least recently used first
+        self._options = OrderedDict()
+        self._processors = queue.Queue()
+        for _ in range(self.workers):
+            self._processors.put(ImageProcessor())
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._active = 0
+        self._requests = 0
+        self._errors = 0
+        self._rejected = 0
+        self._latencies = deque(maxlen=1000)
+        self.started = time.time()
+
+    def warm_up(self, presets=()):
+        """Compile the presets and run a small image through every processor"""
+        probe = Image.new("RGBA", (64, 64), (0, 0, 0, 255))
+        probe.paste((200, 120, 40, 255), (16, 16, 48, 48))
+        plans = [compile_preset(get_preset(name)) for name in presets] or [compile_options(preset_to_options({}))]
+        for _ in range(self.workers):
+            processor = self._processors.get()
+            try:
+                for plan in plans:
+                    plan.install()
+                    self.encode(processor, probe, plan.options, "png", 95, True)
+            finally:
+                self._processors.put(processor)
+
+    def admit(self):
+        """Take a place in line for a request, raising ServiceBusy if the line is full.
+
+        Requests are admitted before their body is read, so a full service
+        holds no more than max_pending bodies in memory.
+        """
+        with self._lock:
+            if self._waiting >= self.max_pending and self._processors.empty():
+                self._rejected += 1
+                raise ServiceBusy(f"{self._waiting} requests already waiting")
+            self._waiting += 1
+
+    def withdraw(self):
+        """Give back the place of an admitted request that won't be converted"""
+        with self._lock:
+            self._waiting -= 1
+
+    def convert(self, source, options, format_option="png", quality=95, optimize=True, admitted=False):
+        """Process image bytes or a file path and return (encoded bytes, timings in ms)"""
+        if not admitted:
+            self.admit()
+
+        start = time.perf_counter()
+        processor = self._processors.get()
+        timings = {"queue": (time.perf_counter() - start) * 1000}
+        with self._lock:
+            self._waiting -= 1
+            self._active += 1
+        try:
+            stage = time.perf_counter()
+            image = open_image(source)
+            timings["decode"] = (time.perf_counter() - stage) * 1000
+            data = self.encode(processor, image, options, format_option, quality, optimize, timings)
+            self._record(start, error=False)
+            return data, timings
+        except Exception:
+            self._record(start, error=True)
+            raise
+        finally:
+            with self._lock:
+                self._active -= 1
+            self._processors.put(processor)
+
+    def encode(self, processor, image, options, format_option, quality, optimize, timings=None):
+        """Process a decoded image with a pooled processor and encode it"""
+        timings = {} if timings is None else timings
+        stage = time.perf_counter()
+        if self.process_workers:
+            with self.process_workers.process(processor, image, options) as shared:
+                timings["process"] = (time.perf_counter() - stage) * 1000
+                stage = time.perf_counter()
+                data = processor.encode_image(shared.image(), format_option, quality, optimize)
+        else:
+            result = processor.process_image(image, options)
+            timings["process"] = (time.perf_counter() - stage) * 1000
+            stage = time.perf_counter()
+            data = processor.encode_image(result, format_option, quality, optimize)
+        timings["encode"] = (time.perf_counter() - stage) * 1000
+        return data
+
+    def _record(self, start, error):
+        with self._lock:
+            self._requests += 1
+            self._errors += error
+            self._latencies.append((time.perf_counter() - start) * 1000)
+
+    def stats(self):
+        """Request counts, load and latency percentiles (ms) over the last 1000 requests"""
+        with self._lock:
+            latencies = sorted(self._latencies)
+            stats = {"requests": self._requests, "errors": self._errors, "rejected": self._rejected,
+                     "active": self._active, "waiting": self._waiting, "workers": self.workers,
+                     "max_pending": self.max_pending, "uptime": round(time.time() - self.started, 1)}
+
+        for name, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+            stats[f"latency_{name}"] = (round(latencies[min(len(latencies) - 1, int(len(latencies) * fraction))], 1)
+                                        if latencies else None)
+        return stats
+
+    def resolve_path(self, path):
+        """Check a file path named in a request, returning it resolved.
+
+        Refused paths raise a PermissionError that names neither the path nor
+        the root, so clients can't learn about files they may not read.
+        """
+        if not self.allow_paths:
+            # File paths are only accepted on a loopback address or under --serve-root
+            raise PermissionError("Path not allowed")
+        path = os.path.realpath(path)
+        if self.path_root:
+            try:
+                inside = os.path.commonpath([path, self.path_root]) == self.path_root
+            except ValueError:
+                # On another drive
+                inside = False
+            if not inside:
+                raise PermissionError("Path not allowed")
+        return path
+
+    def request_options(self, params):
+        """Build options and output settings from a request's preset name and overrides"""
+        preset = {}
+        if params.get("preset"):
+            preset = get_preset(params["preset"])
+            if preset is None:
+                raise Exception(f"Preset '{params['preset']}' not found.")
+
+        # Compiled in memory only, and remembered, so repeated requests don't validate or build tables again
+        key = json.dumps([preset, params.get("options")], sort_keys=True, default=list)
+        with self._lock:
+            options = self._options.get(key)
+            if options is not None:
+                self._options.move_to_end(key)
+        if options is None:
+            merged = dict(preset, **(params.get("options") or {}))
+            options = compile_options(preset_to_options(merged), use_cache=False).install().options
+            with self._lock:
+                self._options[key] = options
+                if len(self._options) > SERVICE_OPTIONS_CACHE:
+                    self._options.popitem(last=False)
+
+        format_option = params.get("format") or preset.get("output_format", "png")
+        if format_option.lower() not in ImageProcessor.FORMAT_MAP:
+            raise Exception(f"Invalid options: unknown output format {format_option!r}")
+        quality = int(params.get("quality") or preset.get("output_quality", 95))
+        optimize = params.get("optimize", preset.get("output_optimize", True))
+        if isinstance(optimize, str):
+            optimize = optimize.lower() not in ("0", "false", "no")
+        return options, format_option, quality, optimize
+
+
+def make_service_handler(service, quiet=False):
+    """Build the HTTP request handler class serving a ConversionService"""
+    from http.server import BaseHTTPRequestHandler
+    from urllib.parse import urlsplit, parse_qsl
+
+    class ServiceHandler(BaseHTTPRequestHandler):
+        # Keep connections open between requests
+        protocol_version = "HTTP/1.1"
+        timeout = SERVICE_IDLE_TIMEOUT
+
+        def do_GET(self):
+            path = urlsplit(self.path).path
+            if path in ("/health", "/stats"):
+                self.send_json(200, dict(service.stats(), status="ok"))
+            else:
+                self.send_json(404, {"error": "Not found. POST images to /convert, GET /stats."})
+
+        def do_POST(self):
+            url = urlsplit(self.path)
+            if url.path != "/convert":
+                self.send_json(404, {"error": "Not found. POST images to /convert."})
+                return
+
+            start = time.perf_counter()
+            # The body is left unread on these answers, so the connection can't be reused
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+            except ValueError:
+                length = -1
+            if length < 0:
+                self.close_connection = True
+                self.send_json(400, {"error": "Content-Length must be a whole number of bytes"})
+                return
+            if length > SERVICE_MAX_BODY:
+                self.close_connection = True
+                self.send_json(413, {"error": f"Request body over {SERVICE_MAX_BODY} bytes"})
+                return
+            try:
+                service.admit()
+            except ServiceBusy as e:
+                self.close_connection = True
+                self.send_json(503, {"error": f"Busy: {str(e)}"}, {"Retry-After": "1"})
+                return
+
+            try:
+                body = self.rfile.read(length)
+                # Either raw image bytes with query parameters, or JSON naming a file
+                params = dict(parse_qsl(url.query))
+                source = body
+                if self.headers.get("Content-Type", "").startswith("application/json"):
+                    request = json.loads(body or b"{}")
+                    params.update(request)
+                    if not request.get("path"):
+                        raise ValueError("JSON requests need a \"path\" to an image file")
+                    source = service.resolve_path(request["path"])
+                elif not body:
+                    raise ValueError("Send image bytes, or JSON with a \"path\"")
+                if isinstance(params.get("options"), str):
+                    params["options"] = json.loads(params["options"])
+                options, format_option, quality, optimize = service.request_options(params)
+            except Exception as e:
+                service.withdraw()
+                self.send_json(403 if isinstance(e, PermissionError) else 400, {"error": str(e)})
+                return
+
+            try:
+                data, timings = service.convert(source, options, format_option, quality, optimize, admitted=True)
+            except Exception as e:
+                if isinstance(source, str):
+                    # Errors name the file, so they are only logged here
+                    self.log_error("Error converting %s: %s", source, str(e))
+                    self.send_json(422, {"error": "Failed to convert the image at that path"})
+                else:
+                    self.send_json(422, {"error": str(e)})
+                return
+
+            total = (time.perf_counter() - start) * 1000
+            format_name = ImageProcessor.FORMAT_MAP[format_option.lower()]
+            self.send_response(200)
+            self.send_header("Content-Type", FORMAT_CONTENT_TYPES.get(format_name, "application/octet-stream"))
+            self.send_header("Content-Length", str(len(data)))
+            self.send_header("Server-Timing", ", ".join(f"{name};dur={value:.1f}" for name, value in timings.items()))
+            self.send_header("X-Processing-Time-Ms", f"{total:.1f}")
+            self.end_headers()
+            self.wfile.write(data)
+
+        def send_json(self, status, data, headers=None):
+            body = json.dumps(data).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def parse_request(self):
+            self._started = time.perf_counter()
+            return super().parse_request()
+
+        def log_request(self, code="-", size="-"):
+            # One line per request with its latency up to the response
+            if not quiet:
+                elapsed = (time.perf_counter() - getattr(self, "_started", time.perf_counter())) * 1000
+                self.log_message('"%s" %s %.1f ms', self.requestline, str(code), elapsed)
+
+    return ServiceHandler
+
+
+def run_service(args):
+    """Serve conversions on localhost until interrupted"""
+    from http.server import ThreadingHTTPServer
+
+    for preset_name in args.preset or ():
+        if get_preset(preset_name) is None:
+            print(f"Preset '{preset_name}' not found.")
+            return 1
+
+    process_workers = ProcessWorkers(args.processes) if args.processes else get_process_workers()
+    try:
+        # Files on disk can be named by local programs, or by anyone under --serve-root
+        import ipaddress
+        try:
+            loopback = args.host == "localhost" or ipaddress.ip_address(args.host).is_loopback
+        except ValueError:
+            loopback = False
+        service = ConversionService(args.workers, args.max_pending, process_workers, args.serve_root, loopback)
+        start = time.perf_counter()
+        service.warm_up(args.preset or ())
+        print(f"Warmed {service.workers} processors in {time.perf_counter() - start:.2f}s", flush=True)
+
+        server = ThreadingHTTPServer((args.host, args.serve), make_service_handler(service, args.progress == "none"))
+        server.daemon_threads = True
+        print(f"Serving on http://{args.host}:{server.server_address[1]}/convert (Ctrl+C to stop)", flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+    finally:
+        # Stop the worker processes before the interpreter starts tearing down
+        if process_workers is not None:
+            process_workers.shutdown()
+    return 0
+
+
+class App:
+    def __init__(self, root):
+        self.root = root
+        self.root.title("Background Remover and Color Inverter")
+        self.root.geometry("900x700")
+        self.root.minsize(800, 600)
+
+        # Set icon if available
+        try:
+            if os.name == 'nt':  # Windows
+                self.root.iconbitmap('icon.ico')
+            else:  # Linux/Mac
+                icon = tk.PhotoImage(file='icon.png')
+                self.root.iconphoto(True, icon)
+        except:
+            pass
+
+        # Initialize the image processor
+        self.processor = ImageProcessor()
+
+        # Initialize variables
+        self.init_variables()
+        mark_startup("variables")
+
+        # Create the UI
+        self.create_menu()
+        mark_startup("menu")
+        self.create_main_ui()
+        mark_startup("main window")
+
+        # Apply theme
+        self.apply_theme(settings.get("theme", "light"))
+        mark_startup("theme")
+
+        # Set up drag and drop
+        self.setup_drag_drop()
+
+        # Update recent files menu
+        self.update_recent_files_menu()
+
+        # Create processing queue
+        self.processing_queue = []
+        self.is_processing = False
+        self.batch = None
+        self.shared_result = None
+
+        # Add creator info
+        self.add_creator_info()
+
+        # Offer to finish a batch that was interrupted last time
+        self.root.after(0, self.offer_resume)
+
+    def offer_resume(self):
+        """Offer to resume the batch recorded in the journal, if one was interrupted"""
+        state = latest_journal()
+        if not state:
+            return
+
+        message = (f"A previous batch was interrupted with {len(state['pending'])} of "
+                   f"{len(state['files'])} files left. Resume it now?")
+        if not messagebox.askyesno("Resume Batch", message):
+            discard_journal(state["path"])
+            return
+
+        # Rebuild the queue, then carry on with the pending files only
+        self.ensure_tab(self.batch_frame)
+        pending = set(state["pending"])
+        files = []
+        for file_path in state["files"]:
+            status = "Pending" if file_path in pending else "Completed"
+            item = self.queue_list.insert("", "end", values=(file_path, status))
+            self.probe_queue_item(item, file_path)
+            if file_path in pending:
+                files.append((item, file_path))
+
+        self.settings_notebook.select(self.batch_frame)
+        self.start_batch(files, state["options"], state["output"], state["outputs"], state["variants"],
+                         state["path"])
+
+    def init_variables(self):
+        """Initialize all variables used in the application"""
+        # Background mode
+        self.bg_mode_var = StringVar(value="black")
+
+        # Custom color
+        self.custom_color_var = StringVar(value="#000000")
+        self.custom_color_rgb = (0, 0, 0)
+
+        # Additional key colours and HSV ranges for custom mode
+        self.key_colors = []
+        self.key_ranges = []
+
+        # Tolerance
+        self.tolerance_var = IntVar(value=15)
+
+        # Detect the background of every processed image
+        self.auto_detect_var = BooleanVar(value=False)
+
+        # Resize options
+        self.resize_var = BooleanVar(value=False)
+        self.width_var = StringVar(value="")
+        self.height_var = StringVar(value="")
+
+        # Crop options
+        self.crop_var = BooleanVar(value=False)
+        self.crop_left_var = IntVar(value=0)
+        self.crop_top_var = IntVar(value=0)
+        self.crop_right_var = IntVar(value=100)
+        self.crop_bottom_var = IntVar(value=100)
+
+        # Color options
+        self.invert_colors_var = BooleanVar(value=True)
+
+        # Alpha options
+        self.adjust_alpha_var = BooleanVar(value=False)
+        self.alpha_value_var = IntVar(value=255)
+
+        # Background replacement
+        self.replace_bg_var = BooleanVar(value=False)
+        self.replacement_color_var = StringVar(value="#FFFFFF")
+        self.replacement_color_rgb = (255, 255, 255)
+
+        # Output options
+        self.output_format_var = StringVar(value=settings.get("default_format", "png"))
+        self.output_quality_var = IntVar(value=95)
+        self.output_optimize_var = BooleanVar(value=True)
+        self.preserve_metadata_var = BooleanVar(value=settings.get("preserve_metadata", True))
+        self.overwrite_var = BooleanVar(value=settings.get("overwrite_existing", False))
+        self.custom_output_var = BooleanVar(value=False)
+        self.output_dir_var = StringVar(value=settings.get("last_output_dir", ""))
+        self.naming_pattern_var = StringVar(value=settings.get("custom_naming", "{filename}_converted"))
+
+        # Responsive output set: extra widths and formats from one processed image
+        self.output_widths_var = StringVar(value="")
+        self.output_formats_var = StringVar(value="")
+        self.srcset_var = BooleanVar(value=False)
+
+        # Preview
+        self.preview_var = BooleanVar(value=True)
+
+        # Background header probes of queued files
+        self.prober = HeaderProber()
+        self.probe_polling = False
+
+        # Current file/folder, the image being edited and its processed version
+        self.current_file = None
+        self.original_image = None
+        self.processed_image = None
+        self.current_folder = None
+        self.current_frame_count = 1
+
+        # Preview images
+        self.original_preview = None
+        self.processed_preview = None
+
+        # Zoomable preview: tile pyramids of both images, how original pixels map
+        # onto processed ones, and the view as a scale (None fits each image)
+        # and centre in original image pixels
+        self.original_pyramid = None
+        self.processed_pyramid = None
+        # Threads keying the tiles of large images, and the tiles made when the preview was last drawn
+        self.tile_executor = None
+        self.preview_tiles_drawn = 0
+        self.preview_tile_polling = False
+        self.preview_mapping = (1.0, 1.0, 0, 0)
+        self.preview_scale = None
+        self.preview_center = None
+        self.preview_drag = None
+        self.preview_render_pending = False
+
+    def create_menu(self):
+        """Create the application menu"""
+        self.menu_bar = Menu(self.root)
+
+        # File menu
+        self.file_menu = Menu(self.menu_bar, tearoff=0)
+        self.file_menu.add_command(label="Open File...", command=self.open_file, accelerator="Ctrl+O")
+        self.file_menu.add_command(label="Open Folder...", command=self.open_folder, accelerator="Ctrl+Shift+O")
+        self.file_menu.add_command(label="Open Multiple Files...", command=self.open_multiple_files)
+
+        # Recent files submenu
+        self.recent_menu = Menu(self.file_menu, tearoff=0)
+        self.file_menu.add_cascade(label="Recent Files", menu=self.recent_menu)
+
+        self.file_menu.add_separator()
+        self.file_menu.add_command(label="Save Current Image...", command=self.save_current_image, accelerator="Ctrl+S")
+        self.file_menu.add_command(label="Save All", command=self.process_queue, accelerator="Ctrl+Shift+S")
+        self.file_menu.add_separator()
+        self.file_menu.add_command(label="Exit", command=self.root.quit, accelerator="Alt+F4")
+
+        self.menu_bar.add_cascade(label="File", menu=self.file_menu)
+
+        # Edit menu
+        self.edit_menu = Menu(self.menu_bar, tearoff=0)
+        self.edit_menu.add_command(label="Clear Queue", command=self.clear_queue)
+        self.edit_menu.add_separator()
+
+        # Presets submenu
+        self.presets_menu = Menu(self.edit_menu, tearoff=0)
+        self.presets_menu.add_command(label="Save Current Settings as Preset...", command=self.save_preset)
+        self.presets_menu.add_command(label="Manage Presets...", command=self.manage_presets)
+        self.presets_menu.add_separator()
+
+        # Add default presets
+        self.presets_menu.add_command(label="Logo on Black", command=lambda: self.load_preset("logo_black"))
+        self.presets_menu.add_command(label="Logo on White", command=lambda: self.load_preset("logo_white"))
+        self.presets_menu.add_command(label="Product Image", command=lambda: self.load_preset("product"))
+
+        self.edit_menu.add_cascade(label="Presets", menu=self.presets_menu)
+        self.edit_menu.add_separator()
+        self.edit_menu.add_command(label="Preferences...", command=self.show_preferences)
+
+        self.menu_bar.add_cascade(label="Edit", menu=self.edit_menu)
+
+        # View menu
+        self.view_menu = Menu(self.menu_bar, tearoff=0)
+        self.view_menu.add_checkbutton(label="Show Preview", variable=self.preview_var,
+                                       command=self.toggle_preview)
+
+        # Theme submenu
+        self.theme_menu = Menu(self.view_menu, tearoff=0)
+        self.theme_menu.add_command(label="Light", command=lambda: self.apply_theme("light"))
+        self.theme_menu.add_command(label="Dark", command=lambda: self.apply_theme("dark"))
+
+        self.view_menu.add_cascade(label="Theme", menu=self.theme_menu)
+        self.view_menu.add_separator()
+        self.view_menu.add_command(label="Processing Stats...", command=self.show_stage_stats)
+
+        self.menu_bar.add_cascade(label="View", menu=self.view_menu)
+
+        # Help menu
+        self.help_menu = Menu(self.menu_bar, tearoff=0)
+        self.help_menu.add_command(label="Documentation", command=self.show_documentation)
+        self.help_menu.add_command(label="About", command=self.show_about)
+
+        self.menu_bar.add_cascade(label="Help", menu=self.help_menu)
+
+        self.root.config(menu=self.menu_bar)
+
+        # Keyboard shortcuts
+        self.root.bind("<Control-o>", lambda event: self.open_file())
+        self.root.bind("<Control-Shift-O>", lambda event: self.open_folder())
+        self.root.bind("<Control-s>", lambda event: self.save_current_image())
+        self.root.bind("<Control-Shift-S>", lambda event: self.process_queue())
+
+    def create_main_ui(self):
+        """Create the main user interface"""
+        # Main container with two columns
+        self.main_frame = ttk.PanedWindow(self.root, orient=tk.HORIZONTAL)
+        self.main_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+
+        # Left column - Settings
+        self.settings_frame = ttk.Frame(self.main_frame)
+        self.main_frame.add(self.settings_frame, weight=40)
+
+        # Right column - Preview
+        self.preview_frame = ttk.Frame(self.main_frame)
+        self.main_frame.add(self.preview_frame, weight=60)
+
+        # Create settings UI
+        self.create_settings_ui()
+
+        # Create preview UI
+        self.create_preview_ui()
+
+        # Create status bar
+        self.create_status_bar()
+
+    def create_settings_ui(self):
+        """Create the settings panel UI"""
+        # Use a notebook for tabs
+        self.settings_notebook = ttk.Notebook(self.settings_frame)
+        self.settings_notebook.pack(fill=tk.BOTH, expand=True)
+
+        # Basic tab
+        self.basic_frame = ttk.Frame(self.settings_notebook)
+        self.settings_notebook.add(self.basic_frame, text="Basic")
+
+        # Advanced tab
+        self.advanced_frame = ttk.Frame(self.settings_notebook)
+        self.settings_notebook.add(self.advanced_frame, text="Advanced")
+
+        # Output tab
+        self.output_frame = ttk.Frame(self.settings_notebook)
+        self.settings_notebook.add(self.output_frame, text="Output")
+
+        # Batch tab
+        self.batch_frame = ttk.Frame(self.settings_notebook)
+        self.settings_notebook.add(self.batch_frame, text="Batch")
+
+        # Fill the basic tab
+        self.create_basic_settings()
+
+        # The other tabs are filled the first time they are shown or needed
+        self.bg_color_preview = None
+        self.tab_builders = {
+            str(self.advanced_frame): self.create_advanced_settings,
+            str(self.output_frame): self.create_output_settings,
+            str(self.batch_frame): self.create_batch_settings
+        }
+        self.settings_notebook.bind("<<NotebookTabChanged>>",
+                                    lambda event: self.ensure_tab(self.settings_notebook.select()))
+
+    def ensure_tab(self, tab):
+        """Fill a settings tab if it hasn't been built yet"""
+        builder = self.tab_builders.pop(str(tab), None)
+        if builder:
+            builder()
+
+    def create_basic_settings(self):
+        """Create basic settings UI"""
+        # Background mode frame
+        bg_frame = ttk.LabelFrame(self.basic_frame, text="Background Detection")
+        bg_frame.pack(fill=tk.X, padx=10, pady=5)
+
+        # Background mode radio buttons
+        ttk.Radiobutton(bg_frame, text="Black Background", variable=self.bg_mode_var,
+                        value="black", command=self.update_preview).pack(anchor="w", padx=10, pady=2)
+        ttk.Radiobutton(bg_frame, text="White Background", variable=self.bg_mode_var,
+                        value="white", command=self.update_preview).pack(anchor="w", padx=10, pady=2)
+        ttk.Radiobutton(bg_frame, text="Custom Color", variable=self.bg_mode_var,
+                        value="custom", command=self.update_preview).pack(anchor="w", padx=10, pady=2)
+
+        # Custom color picker
+        color_frame = ttk.Frame(bg_frame)
+        color_frame.pack(fill=tk.X, padx=10, pady=5)
+
+        ttk.Label(color_frame, text="Custom Color:").pack(side=tk.LEFT, padx=5)
+        self.color_preview = ttk.Label(color_frame, text="      ", background="#000000")
+        self.color_preview.pack(side=tk.LEFT, padx=5)
+        ttk.Button(color_frame, text="Pick Color", command=self.pick_color).pack(side=tk.LEFT, padx=5)
+        ttk.Button(color_frame, text="Extra Keys...", command=self.manage_key_colors).pack(side=tk.LEFT, padx=5)
+
+        # Tolerance slider
+        tolerance_frame = ttk.Frame(bg_frame)
+        tolerance_frame.pack(fill=tk.X, padx=10, pady=5)
+
+        ttk.Label(tolerance_frame, text="Tolerance:").pack(side=tk.LEFT, padx=5)
+        ttk.Scale(tolerance_frame, from_=0, to=100, orient=HORIZONTAL,
+                  variable=self.tolerance_var, command=lambda _: self.update_preview()).pack(side=tk.LEFT, fill=tk.X,
+                                                                                             expand=True, padx=5)
+        ttk.Label(tolerance_frame, textvariable=self.tolerance_var).pack(side=tk.LEFT, padx=5)
+
+        # Automatic background detection
+        detect_frame = ttk.Frame(bg_frame)
+        detect_frame.pack(fill=tk.X, padx=10, pady=5)
+
+        ttk.Button(detect_frame, text="Auto Detect", command=self.auto_detect_background).pack(side=tk.LEFT, padx=5)
+        ttk.Checkbutton(detect_frame, text="Detect for each file", variable=self.auto_detect_var,
+                        command=self.update_preview).pack(side=tk.LEFT, padx=5)
+
+        # Color options frame
+        color_options_frame = ttk.LabelFrame(self.basic_frame, text="Color Options")
+        color_options_frame.pack(fill=tk.X, padx=10, pady=5)
+
+        ttk.Checkbutton(color_options_frame, text="Invert Colors", variable=self.invert_colors_var,
+                        command=self.update_preview).pack(anchor="w", padx=10, pady=5)
+
+        # Resize frame
+        resize_frame = ttk.LabelFrame(self.basic_frame, text="Resize")
+        resize_frame.pack(fill=tk.X, padx=10, pady=5)
+
+        ttk.Checkbutton(resize_frame, text="Resize Image", variable=self.resize_var,
+                        command=self.toggle_resize).pack(anchor="w", padx=10, pady=2)
+
+        # Width and height inputs
+        size_frame = ttk.Frame(resize_frame)
+        size_frame.pack(fill=tk.X, padx=10, pady=5)
+
+        ttk.Label(size_frame, text="Width:").grid(row=0, column=0, padx=5, pady=2, sticky="w")
+        ttk.Entry(size_frame, textvariable=self.width_var, width=8).grid(row=0, column=1, padx=5, pady=2)
+        ttk.Label(size_frame, text="pixels").grid(row=0, column=2, padx=5, pady=2, sticky="w")
+
+        ttk.Label(size_frame, text="Height:").grid(row=1, column=0, padx=5, pady=2, sticky="w")
+        ttk.Entry(size_frame, textvariable=self.height_var, width=8).grid(row=1, column=1, padx=5, pady=2)
+        ttk.Label(size_frame, text="pixels").grid(row=1, column=2, padx=5, pady=2, sticky="w")
+
+        # Action buttons
+        action_frame = ttk.Frame(self.basic_frame)
+        action_frame.pack(fill=tk.X, padx=10, pady=10)
+
+        ttk.Button(action_frame, text="Open File", command=self.open_file).pack(side=tk.LEFT, padx=5)
+        ttk.Button(action_frame, text="Open Folder", command=self.open_folder).pack(side=tk.LEFT, padx=5)
+        ttk.Button(action_frame, text="Process & Save", command=self.process_current).pack(side=tk.LEFT, padx=5)
+
+    def create_advanced_settings(self):
+        """Create advanced settings UI"""
+        # Crop frame
+        crop_frame = ttk.LabelFrame(self.advanced_frame, text="Crop")
+        crop_frame.pack(fill=tk.X, padx=10, pady=5)
+
+        ttk.Checkbutton(crop_frame, text="Crop Image", variable=self.crop_var,
+                        command=self.toggle_crop).pack(anchor="w", padx=10, pady=2)
+
+        # Crop controls
+        crop_controls = ttk.Frame(crop_frame)
+        crop_controls.pack(fill=tk.X, padx=10, pady=5)
+
+        ttk.Label(crop_controls, text="Left:").grid(row=0, column=0, padx=5, pady=2, sticky="w")
+        ttk.Scale(crop_controls, from_=0, to=100, orient=HORIZONTAL,
+                  variable=self.crop_left_var, command=lambda _: self.update_preview()).grid(row=0, column=1, padx=5,
+                                                                                             pady=2, sticky="ew")
+
+        ttk.Label(crop_controls, text="Top:").grid(row=1, column=0, padx=5, pady=2, sticky="w")
+        ttk.Scale(crop_controls, from_=0, to=100, orient=HORIZONTAL,
+                  variable=self.crop_top_var, command=lambda _: self.update_preview()).grid(row=1, column=1, padx=5,
+                                                                                            pady=2, sticky="ew")
+
+        ttk.Label(crop_controls, text="Right:").grid(row=2, column=0, padx=5, pady=2, sticky="w")
+        ttk.Scale(crop_controls, from_=0, to=100, orient=HORIZONTAL,
+                  variable=self.crop_right_var, command=lambda _: self.update_preview()).grid(row=2, column=1, padx=5,
+                                                                                              pady=2, sticky="ew")
+
+        ttk.Label(crop_controls, text="Bottom:").grid(row=3, column=0, padx=5, pady=2, sticky="w")
+        ttk.Scale(crop_controls, from_=0, to=100, orient=HORIZONTAL,
+                  variable=self.crop_bottom_var, command=lambda _: self.update_preview()).grid(row=3, column=1, padx=5,
+                                                                                               pady=2, sticky="ew")
+
+        crop_controls.columnconfigure(1, weight=1)
+
+        # Alpha adjustment frame
+        alpha_frame = ttk.LabelFrame(self.advanced_frame, text="Transparency")
+        alpha_frame.pack(fill=tk.X, padx=10, pady=5)
+
+        ttk.Checkbutton(alpha_frame, text="Adjust Transparency", variable=self.adjust_alpha_var,
+                        command=self.toggle_alpha).pack(anchor="w", padx=10, pady=2)
+
+        # Alpha slider
+        alpha_slider_frame = ttk.Frame(alpha_frame)
+        alpha_slider_frame.pack(fill=tk.X, padx=10, pady=5)
+
+        ttk.Label(alpha_slider_frame, text="Alpha:").pack(side=tk.LEFT, padx=5)
+        ttk.Scale(alpha_slider_frame, from_=0, to=255, orient=HORIZONTAL,
+                  variable=self.alpha_value_var, command=lambda _: self.update_preview()).pack(side=tk.LEFT, fill=tk.X,
+                                                                                               expand=True, padx=5)
+        ttk.Label(alpha_slider_frame, textvariable=self.alpha_value_var).pack(side=tk.LEFT, padx=5)
+
+        # Background replacement frame
+        bg_replace_frame = ttk.LabelFrame(self.advanced_frame, text="Background Replacement")
+        bg_replace_frame.pack(fill=tk.X, padx=10, pady=5)
+
+        ttk.Checkbutton(bg_replace_frame, text="Replace Background", variable=self.replace_bg_var,
+                        command=self.toggle_bg_replacement).pack(anchor="w", padx=10, pady=2)
+
+        # Background color picker
+        bg_color_frame = ttk.Frame(bg_replace_frame)
+        bg_color_frame.pack(fill=tk.X, padx=10, pady=5)
+
+        ttk.Label(bg_color_frame, text="Background Color:").pack(side=tk.LEFT, padx=5)
+        self.bg_color_preview = ttk.Label(bg_color_frame, text="      ",
+                                          background=self.replacement_color_var.get())
+        self.bg_color_preview.pack(side=tk.LEFT, padx=5)
+        ttk.Button(bg_color_frame, text="Pick Color", command=self.pick_bg_color).pack(side=tk.LEFT, padx=5)
+
+    def create_output_settings(self):
+        """Create output settings UI"""
+        # Format frame
+        format_frame = ttk.LabelFrame(self.output_frame, text="Output Format")
+        format_frame.pack(fill=tk.X, padx=10, pady=5)
+
+        formats = [("PNG (with transparency)", "png"),
+                   ("JPEG (no transparency)", "jpg"),
+                   ("WebP (with transparency)", "webp"),
+                   ("TIFF (with transparency)", "tiff"),
+                   ("BMP (no transparency)", "bmp")]
+
+        for text, value in formats:
+            ttk.Radiobutton(format_frame, text=text, variable=self.output_format_var,
+                            value=value).pack(anchor="w", padx=10, pady=2)
+
+        # Quality settings (for JPEG/WebP)
+        quality_frame = ttk.Frame(format_frame)
+        quality_frame.pack(fill=tk.X, padx=10, pady=5)
+
+        ttk.Label(quality_frame, text="Quality:").pack(side=tk.LEFT, padx=5)
+        ttk.Scale(quality_frame, from_=1, to=100, orient=HORIZONTAL,
+                  variable=self.output_quality_var).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        ttk.Label(quality_frame, textvariable=self.output_quality_var).pack(side=tk.LEFT, padx=5)
+
+        ttk.Checkbutton(format_frame, text="Optimize File Size",
+                        variable=self.output_optimize_var).pack(anchor="w", padx=10, pady=2)
+
+        # Responsive output set frame
+        set_frame = ttk.LabelFrame(self.output_frame, text="Responsive Output Set")
+        set_frame.pack(fill=tk.X, padx=10, pady=5)
+
+        widths_frame = ttk.Frame(set_frame)
+        widths_frame.pack(fill=tk.X, padx=10, pady=2)
+        ttk.Label(widths_frame, text="Widths:").pack(side=tk.LEFT, padx=5)
+        widths_entry = ttk.Entry(widths_frame, textvariable=self.output_widths_var)
+        widths_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        ttk.Label(widths_frame, text="Formats:").pack(side=tk.LEFT, padx=5)
+        formats_entry = ttk.Entry(widths_frame, textvariable=self.output_formats_var, width=12)
+        formats_entry.pack(side=tk.LEFT, padx=5)
+        for entry, variable, formats in ((widths_entry, self.output_widths_var, False),
+                                         (formats_entry, self.output_formats_var, True)):
+            for sequence in ("<FocusOut>", "<Return>"):
+                entry.bind(sequence, lambda e, variable=variable, formats=formats:
+                           self.validate_output_set(variable, formats))
+
+        ttk.Label(set_frame, text="e.g. widths 320, 640, 1280 and formats webp, png (blank: the format above)").pack(
+            anchor="w", padx=10, pady=2)
+        ttk.Checkbutton(set_frame, text="Write srcset manifest (JSON)",
+                        variable=self.srcset_var).pack(anchor="w", padx=10, pady=2)
+
+        # Output location frame
+        location_frame = ttk.LabelFrame(self.output_frame, text="Output Location")
+        location_frame.pack(fill=tk.X, padx=10, pady=5)
+
+        ttk.Radiobutton(location_frame, text="Save to 'converted' subfolder",
+                        variable=self.custom_output_var, value=False).pack(anchor="w", padx=10, pady=2)
+        ttk.Radiobutton(location_frame, text="Save to custom location",
+                        variable=self.custom_output_var, value=True).pack(anchor="w", padx=10, pady=2)
+
+        # Custom output directory
+        dir_frame = ttk.Frame(location_frame)
+        dir_frame.pack(fill=tk.X, padx=10, pady=5)
+
+        self.output_dir_entry = ttk.Entry(dir_frame, textvariable=self.output_dir_var)
+        self.output_dir_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        ttk.Button(dir_frame, text="Browse...", command=self.browse_output_dir).pack(side=tk.LEFT, padx=5)
+
+        # File naming frame
+        naming_frame = ttk.LabelFrame(self.output_frame, text="File Naming")
+        naming_frame.pack(fill=tk.X, padx=10, pady=5)
+
+        ttk.Label(naming_frame, text="Pattern:").pack(anchor="w", padx=10, pady=2)
+        ttk.Entry(naming_frame, textvariable=self.naming_pattern_var).pack(fill=tk.X, padx=10, pady=2)
+
+        ttk.Label(naming_frame, text="Available variables: {filename}, {date}, {time}, {counter}").pack(anchor="w",
+                                                                                                        padx=10, pady=2)
+
+        # File handling options
+        options_frame = ttk.Frame(self.output_frame)
+        options_frame.pack(fill=tk.X, padx=10, pady=5)
+
+        ttk.Checkbutton(options_frame, text="Preserve metadata",
+                        variable=self.preserve_metadata_var).pack(anchor="w", padx=10, pady=2)
+        ttk.Checkbutton(options_frame, text="Overwrite existing files",
+                        variable=self.overwrite_var).pack(anchor="w", padx=10, pady=2)
+
+    def create_batch_settings(self):
+        """Create batch processing UI"""
+        # Queue frame
+        queue_frame = ttk.LabelFrame(self.batch_frame, text="Processing Queue")
+        queue_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+
+        # Queue list
+        self.queue_list = ttk.Treeview(queue_frame, columns=("path", "status") + QUEUE_PROBE_COLUMNS,
+                                       show="headings")
+        self.queue_list.heading("path", text="File Path")
+        self.queue_list.heading("status", text="Status")
+        self.queue_list.column("path", width=300)
+        self.queue_list.column("status", width=100)
+        # Header details, filled in by background probes as files are queued
+        for column, heading, width in (("dimensions", "Size", 90), ("mode", "Mode", 50), ("format", "Format", 60),
+                                       ("frames", "Frames", 55), ("file_size", "File Size", 75)):
+            self.queue_list.heading(column, text=heading)
+            self.queue_list.column(column, width=width, anchor=tk.E if column != "mode" else tk.W)
+        self.queue_list.tag_configure("pinned", font=("Helvetica", 9, "bold"))
+        self.queue_list.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+
+        # Scrollbar for queue list
+        scrollbar = ttk.Scrollbar(queue_frame, orient="vertical", command=self.queue_list.yview)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.queue_list.configure(yscrollcommand=scrollbar.set)
+
+        # Queue controls
+        controls_frame = ttk.Frame(self.batch_frame)
+        controls_frame.pack(fill=tk.X, padx=10, pady=5)
+
+        ttk.Button(controls_frame, text="Add Files", command=self.open_multiple_files).pack(side=tk.LEFT, padx=5)
+        ttk.Button(controls_frame, text="Remove Selected", command=self.remove_selected).pack(side=tk.LEFT, padx=5)
+        ttk.Button(controls_frame, text="Pin / Unpin", command=self.toggle_pin_selected).pack(side=tk.LEFT, padx=5)
+        ttk.Button(controls_frame, text="Clear Queue", command=self.clear_queue).pack(side=tk.LEFT, padx=5)
+        ttk.Button(controls_frame, text="Process All", command=self.process_queue).pack(side=tk.LEFT, padx=5)
+        ttk.Button(controls_frame, text="Process with Presets...",
+                   command=self.process_queue_with_presets).pack(side=tk.LEFT, padx=5)
+
+        # Controls for a running batch
+        self.pause_button = ttk.Button(controls_frame, text="Pause", command=self.toggle_pause_batch,
+                                       state=tk.DISABLED)
+        self.pause_button.pack(side=tk.LEFT, padx=5)
+        self.cancel_button = ttk.Button(controls_frame, text="Cancel", command=self.cancel_batch,
+                                        state=tk.DISABLED)
+        self.cancel_button.pack(side=tk.LEFT, padx=5)
+
+    def create_preview_ui(self):
+        """Create the preview panel UI"""
+        # Preview container
+        preview_container = ttk.Frame(self.preview_frame)
+        preview_container.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+
+        # Original image preview
+        original_frame = ttk.LabelFrame(preview_container, text="Original Image")
+        original_frame.pack(fill=tk.BOTH, expand=True, side=tk.LEFT, padx=5, pady=5)
+
+        self.original_canvas = tk.Canvas(original_frame, bg="#f0f0f0")
+        self.original_canvas.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+
+        # Processed image preview
+        processed_frame = ttk.LabelFrame(preview_container, text="Processed Image")
+        processed_frame.pack(fill=tk.BOTH, expand=True, side=tk.LEFT, padx=5, pady=5)
+
+        self.processed_canvas = tk.Canvas(processed_frame, bg="#f0f0f0")
+        self.processed_canvas.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+
+        # Preview controls
+        controls_frame = ttk.Frame(self.preview_frame)
+        controls_frame.pack(fill=tk.X, padx=10, pady=5)
+
+        ttk.Button(controls_frame, text="Update Preview", command=self.update_preview).pack(side=tk.LEFT, padx=5)
+        ttk.Checkbutton(controls_frame, text="Auto Preview", variable=self.preview_var).pack(side=tk.LEFT, padx=5)
+
+        # Zoom with the wheel around the pointer, drag to pan, double-click to fit
+        ttk.Button(controls_frame, text="Fit", command=lambda: self.set_preview_zoom(None)).pack(side=tk.RIGHT,
+                                                                                                  padx=5)
+        ttk.Button(controls_frame, text="1:1", command=lambda: self.set_preview_zoom(1.0)).pack(side=tk.RIGHT, padx=5)
+        self.zoom_label = ttk.Label(controls_frame, text="Fit", width=6)
+        self.zoom_label.pack(side=tk.RIGHT, padx=5)
+
+        for canvas in (self.original_canvas, self.processed_canvas):
+            canvas.bind("<MouseWheel>", self.on_preview_wheel)
+            canvas.bind("<Button-4>", self.on_preview_wheel)
+            canvas.bind("<Button-5>", self.on_preview_wheel)
+            canvas.bind("<ButtonPress-1>", self.on_preview_press)
+            canvas.bind("<B1-Motion>", self.on_preview_drag)
+            canvas.bind("<Double-Button-1>", lambda event: self.set_preview_zoom(None))
+            canvas.bind("<Configure>", lambda event: self.schedule_preview_render())
+
+    def create_status_bar(self):
+        """Create the status bar"""
+        self.status_bar = ttk.Frame(self.root, relief=tk.SUNKEN, borderwidth=1)
+        self.status_bar.pack(side=tk.BOTTOM, fill=tk.X)
+
+        self.status_label = ttk.Label(self.status_bar, text="Ready")
+        self.status_label.pack(side=tk.LEFT, padx=5, pady=2)
+
+        self.progress_bar = ttk.Progressbar(self.status_bar, orient="horizontal", length=200, mode="determinate")
+        self.progress_bar.pack(side=tk.RIGHT, padx=5, pady=2)
+
+    def add_creator_info(self):
+        """Add creator information to the status bar"""
+        creator_label = ttk.Label(self.status_bar, text="Created by Vinay Ahari")
+        creator_label.pack(side=tk.RIGHT, padx=10, pady=2)
+
+    def setup_drag_drop(self):
+        """Set up drag and drop functionality"""
+        try:
+            # This will only work on Windows with additional libraries
+            if os.name == 'nt':
+                self.root.drop_target_register("DND_Files")
+                self.root.dnd_bind('<<Drop>>', self.handle_drop)
+        except:
+            # If drag and drop is not available, just pass
+            pass
+
+    def handle_drop(self, event):
+        """Handle drag and drop events"""
+        files = self.root.tk.splitlist(event.data)
+        for file in files:
+            if os.path.isfile(file) and (file.lower().endswith(IMAGE_EXTENSIONS) or is_archive(file)):
+                self.add_to_queue(file)
+            elif os.path.isdir(file):
+                self.process_folder_path(file)
+
+    def update_recent_files_menu(self):
+        """Update the recent files menu"""
+        # Clear the menu
+        self.recent_menu.delete(0, tk.END)
+
+        # Add recent files
+        recent_files = settings.get("recent_files", [])
+        if recent_files:
+            for file in recent_files:
+                self.recent_menu.add_command(label=os.path.basename(file),
+                                             command=lambda f=file: self.open_recent_file(f))
+
+            self.recent_menu.add_separator()
+            self.recent_menu.add_command(label="Clear Recent Files", command=self.clear_recent_files)
+        else:
+            self.recent_menu.add_command(label="No Recent Files", state=tk.DISABLED)
+
+    def apply_theme(self, theme_name):
+        """Apply the selected theme"""
+        if theme_name == "dark":
+            # Set dark theme colors
+            self.root.configure(bg="#2d2d2d")
+            style = ttk.Style()
+            style.theme_use("clam")
+            style.configure(".", background="#2d2d2d", foreground="#ffffff")
+            style.configure("TFrame", background="#2d2d2d")
+            style.configure("TLabel", background="#2d2d2d", foreground="#ffffff")
+            style.configure("TButton", background="#3d3d3d", foreground="#ffffff")
+            style.configure("TCheckbutton", background="#2d2d2d", foreground="#ffffff")
+            style.configure("TRadiobutton", background="#2d2d2d", foreground="#ffffff")
+            style.configure("TNotebook", background="#2d2d2d", foreground="#ffffff")
+            style.configure("TNotebook.Tab", background="#3d3d3d", foreground="#ffffff")
+
+            # Update canvas colors
+            self.original_canvas.configure(bg="#3d3d3d")
+            self.processed_canvas.configure(bg="#3d3d3d")
+        else:
+            # Set light theme colors
+            self.root.configure(bg="#f0f0f0")
+            style = ttk.Style()
+            style.theme_use("clam")
+            style.configure(".", background="#f0f0f0", foreground="#000000")
+            style.configure("TFrame", background="#f0f0f0")
+            style.configure("TLabel", background="#f0f0f0", foreground="#000000")
+            style.configure("TButton", background="#e0e0e0", foreground="#000000")
+            style.configure("TCheckbutton", background="#f0f0f0", foreground="#000000")
+            style.configure("TRadiobutton", background="#f0f0f0", foreground="#000000")
+            style.configure("TNotebook", background="#f0f0f0", foreground="#000000")
+            style.configure("TNotebook.Tab", background="#e0e0e0", foreground="#000000")
+
+            # Update canvas colors
+            self.original_canvas.configure(bg="#ffffff")
+            self.processed_canvas.configure(bg="#ffffff")
+
+        # Save the theme setting (not at startup, when it hasn't changed)
+        if settings.get("theme") != theme_name:
+            settings["theme"] = theme_name
+            save_settings(settings)
+
+    # File operations
+    def open_file(self):
+        """Open a single image file"""
+        file_path = filedialog.askopenfilename(
+            filetypes=[("Image files", "*.png;*.jpg;*.jpeg;*.webp;*.tiff;*.tif;*.bmp;*.gif")]
+        )
+
+        if file_path:
+            self.load_image(file_path)
+            self.add_to_recent_files(file_path)
+
+    def open_folder(self):
+        """Open a folder of images"""
+        folder_path = filedialog.askdirectory()
+        if folder_path:
+            self.process_folder_path(folder_path)
+
+    def open_multiple_files(self):
+        """Open multiple image files"""
+        file_paths = filedialog.askopenfilenames(
+            filetypes=[("Image files", "*.png;*.jpg;*.jpeg;*.webp;*.tiff;*.tif;*.bmp;*.gif"),
+                       ("Image archives", "*.zip;*.tar;*.tar.gz;*.tgz;*.tar.bz2;*.tbz2;*.tar.xz;*.txz")]
+        )
+
+        if file_paths:
+            for file_path in file_paths:
+                self.add_to_queue(file_path)
+
+            # Load the first image for preview
+            images = [file_path for file_path in file_paths if not is_archive(file_path)]
+            if not self.current_file and images:
+                self.load_image(images[0])
+
+    def open_recent_file(self, file_path):
+        """Open a file from the recent files list"""
+        if os.path.exists(file_path):
+            self.load_image(file_path)
+        else:
+            messagebox.showerror("File Not Found", f"The file {file_path} no longer exists.")
+            # Remove from recent files
+            recent_files = settings.get("recent_files", [])
+            if file_path in recent_files:
+                recent_files.remove(file_path)
+                settings["recent_files"] = recent_files
+                save_settings(settings)
+                self.update_recent_files_menu()
+
+    def add_to_recent_files(self, file_path):
+        """Add a file to the recent files list"""
+        recent_files = settings.get("recent_files", [])
+
+        # Remove if already exists
+        if file_path in recent_files:
+            recent_files.remove(file_path)
+
+        # Add to the beginning
+        recent_files.insert(0, file_path)
+
+        # Limit to MAX_RECENT
+        recent_files = recent_files[:MAX_RECENT]
+
+        # Save to settings
+        settings["recent_files"] = recent_files
+        save_settings(settings)
+
+        # Update menu
+        self.update_recent_files_menu()
+
+    def clear_recent_files(self):
+        """Clear the recent files list"""
+        settings["recent_files"] = []
+        save_settings(settings)
+        self.update_recent_files_menu()
+
+    def load_image(self, file_path):
+        """Load an image for editing"""
+        try:
+            self.current_file = file_path
+            self.original_image = self.processor.load_image(file_path)
+            if self.original_pyramid is not None:
+                self.original_pyramid.cancel()
+            self.original_pyramid = None
+            self.preview_scale = self.preview_center = None
+            self.current_frame_count = self.processor.get_frame_count(file_path)
+
+            # Update status
+            status = f"Loaded: {os.path.basename(file_path)}"
+            if self.current_frame_count > 1:
+                status += f" ({self.current_frame_count} frames, previewing the first)"
+            self.status_label.config(text=status)
+
+            # Update preview
+            self.update_preview()
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to load image: {str(e)}")
+
+    def process_folder_path(self, folder_path):
+        """Process all images in a folder"""
+        count = 0
+        for filename in os.listdir(folder_path):
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                file_path = os.path.join(folder_path, filename)
+                self.add_to_queue(file_path)
+                count += 1
+
+        if count > 0:
+            self.status_label.config(text=f"Added {count} images from folder to queue")
+
+            # Load the first image for preview if no image is currently loaded
+            if not self.current_file and count > 0:
+                for filename in os.listdir(folder_path):
+                    if filename.lower().endswith(IMAGE_EXTENSIONS):
+                        self.load_image(os.path.join(folder_path, filename))
+                        break
+        else:
+            messagebox.showinfo("No Images", "No supported image files found in the selected folder.")
+
+    def add_to_queue(self, file_path):
+        """Add a file to the processing queue"""
+        self.ensure_tab(self.batch_frame)
+
+        # Check if already in queue
+        for item in self.queue_list.get_children():
+            if self.queue_list.item(item, "values")[0] == file_path:
+                return
+
+        # Add to queue
+        item = self.queue_list.insert("", "end", values=(file_path, "Pending"))
+        self.probe_queue_item(item, file_path)
+
+    def probe_queue_item(self, item, file_path):
+        """Read a queued file's header in the background and show it once the next poll picks it up"""
+        self.prober.submit(item, file_path)
+        if not self.probe_polling:
+            self.probe_polling = True
+            self.root.after(BATCH_REFRESH_MS, self.poll_probes)
+
+    def poll_probes(self):
+        """Fill the header columns of the queued files probed since the last poll"""
+        for item, info in self.prober.flush().items():
+            if not self.queue_list.exists(item):
+                continue
+            if info is None:
+                self.queue_list.set(item, "format", "Unreadable")
+                continue
+            if info["width"]:
+                self.queue_list.set(item, "dimensions", f"{info['width']} x {info['height']}")
+                self.queue_list.set(item, "mode", info["mode"])
+                self.queue_list.set(item, "frames", info["frames"])
+            self.queue_list.set(item, "format", info["format"])
+            self.queue_list.set(item, "file_size", format_file_size(info["bytes"]))
+
+        if self.prober.busy:
+            self.root.after(BATCH_REFRESH_MS, self.poll_probes)
+        else:
+            self.probe_polling = False
+
+    def remove_selected(self):
+        """Remove selected items from the queue"""
+        self.ensure_tab(self.batch_frame)
+        selected = self.queue_list.selection()
+        for item in selected:
+            self.queue_list.delete(item)
+
+    def toggle_pin_selected(self):
+        """Pin the selected files to the top of the queue, or unpin them if they all are pinned"""
+        self.ensure_tab(self.batch_frame)
+        items = self.queue_list.get_children()
+        selected = [item for item in items if item in self.queue_list.selection()]
+        if not selected:
+            return
+
+        tags = () if all(self.queue_list.tag_has("pinned", item) for item in selected) else ("pinned",)
+        for item in selected:
+            self.queue_list.item(item, tags=tags)
+
+        # Pinned files stay on top; the selection goes right below the others pinned before it
+        pinned = [item for item in items if self.queue_list.tag_has("pinned", item) and item not in selected]
+        rest = [item for item in items if item not in pinned and item not in selected]
+        for index, item in enumerate(pinned + selected + rest):
+            self.queue_list.move(item, "", index)
+
+    def pinned_files(self):
+        """Paths of the pinned queue files, in queue order"""
+        return [self.queue_list.item(item, "values")[0] for item in self.queue_list.get_children()
+                if self.queue_list.tag_has("pinned", item)]
+
+    def clear_queue(self):
+        """Clear the processing queue"""
+        self.ensure_tab(self.batch_frame)
+        for item in self.queue_list.get_children():
+            self.queue_list.delete(item)
+
+    def process_queue(self):
+        """Process all files in the queue"""
+        files = self.queued_files()
+        if files:
+            # Take the settings once for the whole batch
+            self.start_batch(files, self.get_processing_options(), self.get_output_settings())
+
+    def process_queue_with_presets(self):
+        """Process the queue with several presets at once, decoding each file only once"""
+        if self.is_processing:
+            messagebox.showinfo("Processing", "Already processing files. Please wait.")
+            return
+
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Process with Presets")
+        dialog.geometry("300x300")
+        dialog.transient(self.root)
+        dialog.grab_set()
+
+        ttk.Label(dialog, text="Save one output per selected preset:").pack(anchor=tk.W, padx=10, pady=(10, 0))
+        preset_list = tk.Listbox(dialog, selectmode=tk.MULTIPLE)
+        preset_list.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        names = list(DEFAULT_PRESETS) + [name for name in settings.get("presets", {}) if name not in DEFAULT_PRESETS]
+        for name in names:
+            preset_list.insert(tk.END, name)
+
+        def start():
+            selected = [names[index] for index in preset_list.curselection()]
+            if not selected:
+                messagebox.showinfo("No Presets", "Select at least one preset.", parent=dialog)
+                return
+            dialog.destroy()
+
+            files = self.queued_files()
+            if not files:
+                return
+            base_output = self.get_output_settings()
+            variants = []
+            for name in selected:
+                preset = get_preset(name)
+                output = dict(base_output, format=preset.get("output_format", base_output["format"]),
+                              quality=preset.get("output_quality", base_output["quality"]),
+                              optimize=preset.get("output_optimize", base_output["optimize"]))
+                variants.append((name, preset_to_options(preset), output))
+            _, options, output = variants[0]
+            self.start_batch(files, options, output, variants=variants)
+
+        button_frame = ttk.Frame(dialog)
+        button_frame.pack(fill=tk.X, padx=10, pady=10)
+        ttk.Button(button_frame, text="Process", command=start).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Cancel", command=dialog.destroy).pack(side=tk.RIGHT, padx=5)
+
+    def queued_files(self):
+        """Return the (item_id, file_path) pairs to process next, or None if there is nothing to do"""
+        if self.is_processing:
+            messagebox.showinfo("Processing", "Already processing files. Please wait.")
+            return None
+
+        self.ensure_tab(self.batch_frame)
+
+        items = self.queue_list.get_children()
+        if not items:
+            messagebox.showinfo("Empty Queue", "No files in the processing queue.")
+            return None
+
+        # Pick up from the first unfinished file, skipping completed ones
+        files = []
+        for item in items:
+            file_path, status = self.queue_list.item(item, "values")[:2]
+            if status != "Completed":
+                files.append((item, file_path))
+
+        if not files:
+            if not messagebox.askyesno("Process Again",
+                                       "All files in the queue are completed. Process them again?"):
+                return None
+            files = [(item, self.queue_list.item(item, "values")[0]) for item in items]
+        return files
+
+    def start_batch(self, files, options, output, resume_outputs=None, variants=None, journal_path=None):
+        """Start processing (item_id, file_path) pairs in the background"""
+        self.batch = BatchProcessor(self.processor, options, output, BatchJournal(journal_path), resume_outputs,
+                                    process_workers=get_process_workers(), variants=variants,
+                                    profiler=slow_file_profiler(), pinned=self.pinned_files())
+
+        # Start processing thread and poll its progress at a fixed rate
+        self.is_processing = True
+        self.pause_button.config(text="Pause", state=tk.NORMAL)
+        self.cancel_button.config(state=tk.NORMAL)
+        threading.Thread(target=self.batch.run, args=(files,), daemon=True).start()
+        self.root.after(BATCH_REFRESH_MS, self.poll_batch_progress)
+
+    def toggle_pause_batch(self):
+        """Pause the running batch, or resume it if paused"""
+        if not self.is_processing:
+            return
+
+        if self.batch.control.paused:
+            self.batch.resume()
+            self.pause_button.config(text="Pause")
+        else:
+            self.batch.pause()
+            self.pause_button.config(text="Resume")
+
+    def cancel_batch(self):
+        """Cancel the running batch; Process All later continues with the unfinished files"""
+        if not self.is_processing:
+            return
+
+        self.batch.cancel()
+        self.pause_button.config(state=tk.DISABLED)
+        self.cancel_button.config(state=tk.DISABLED)
+        self.status_label.config(text="Cancelling...")
+
+    def poll_batch_progress(self):
+        """Apply the batch progress gathered since the last poll to the UI"""
+        updates, snapshot = self.batch.progress.flush()
+
+        for item_id, (file_path, status) in updates.items():
+            if self.queue_list.exists(item_id):
+                self.queue_list.set(item_id, "status", status)
+
+        self.progress_bar.configure(maximum=max(1, snapshot["total"]), value=snapshot["done"])
+        self.status_label.config(text=format_batch_status(snapshot))
+
+        if snapshot["finished"]:
+            self.is_processing = False
+            self.pause_button.config(text="Pause", state=tk.DISABLED)
+            self.cancel_button.config(state=tk.DISABLED)
+        else:
+            self.root.after(BATCH_REFRESH_MS, self.poll_batch_progress)
+
+    def process_current(self):
+        """Process and save the current image"""
+        if not self.current_file:
+            messagebox.showinfo("No Image", "Please open an image first.")
+            return
+
+        try:
+            # Get processing options
+            options = self.get_processing_options()
+
+            # Get output path
+            output = self.get_output_settings()
+            output_path = build_output_path(self.current_file, output["format"], output["output_dir"],
+                                            output["naming_pattern"], output["overwrite"], sizes=output["sizes"],
+                                            formats=output["formats"], manifest=output["srcset"])
+
+            if self.current_frame_count > 1 and output["sizes"]:
+                # Animated responsive output set
+                saved = self.processor.process_animation_set(self.current_file, output_path, options,
+                                                             output["sizes"], output["formats"] or [output["format"]],
+                                                             output["quality"], output["optimize"],
+                                                             output["preserve_metadata"], output["srcset"])
+                messagebox.showinfo("Success", f"Saved {len(saved)} files to:\n{os.path.dirname(saved[0])}")
+                return
+            elif self.current_frame_count > 1:
+                # Animated or multi-page image
+                saved_path = self.processor.process_animation(
+                    self.current_file,
+                    output_path,
+                    options,
+                    self.output_format_var.get(),
+                    self.output_quality_var.get(),
+                    self.output_optimize_var.get(),
+                    self.preserve_metadata_var.get()
+                )
+            else:
+                # Process image
+                result = self.run_processing(options)
+
+                if output["sizes"]:
+                    # Responsive output set
+                    saved = self.processor.save_output_set(result, output_path, output["sizes"],
+                                                           output["formats"] or [output["format"]],
+                                                           output["quality"], output["optimize"],
+                                                           output["preserve_metadata"], output["srcset"])
+                    messagebox.showinfo("Success", f"Saved {len(saved)} files to:\n{os.path.dirname(saved[0])}")
+                    return
+
+                # Save image
+                saved_path = self.processor.save_image(
+                    result,
+                    output_path,
+                    self.output_format_var.get(),
+                    self.output_quality_var.get(),
+                    self.output_optimize_var.get(),
+                    self.preserve_metadata_var.get()
+                )
+
+            messagebox.showinfo("Success", f"Image saved to:\n{saved_path}")
+
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to process image: {str(e)}")
+
+    def save_current_image(self):
+        """Save the current processed image"""
+        if not self.current_file or not self.original_image:
+            messagebox.showinfo("No Image", "Please open an image first.")
+            return
+
+        try:
+            # Get default filename
+            directory = os.path.dirname(self.current_file)
+            filename = os.path.basename(self.current_file)
+            base_name, _ = os.path.splitext(filename)
+            default_filename = f"{base_name}_converted.{self.output_format_var.get()}"
+
+            # Ask for save location
+            output_path = filedialog.asksaveasfilename(
+                initialdir=directory,
+                initialfile=default_filename,
+                defaultextension=f".{self.output_format_var.get()}",
+                filetypes=[
+                    ("PNG files", "*.png"),
+                    ("JPEG files", "*.jpg"),
+                    ("WebP files", "*.webp"),
+                    ("TIFF files", "*.tiff"),
+                    ("BMP files", "*.bmp"),
+                    ("All files", "*.*")
+                ]
+            )
+
+            if output_path:
+                # Large images are only processed as far as the preview shows them
+                processed = self.processed_image
+                if processed is None:
+                    processed = self.run_processing(self.get_processing_options())
+
+                # Save image
+                self.processor.save_image(
+                    processed,
+                    output_path,
+                    self.output_format_var.get(),
+                    self.output_quality_var.get(),
+                    self.output_optimize_var.get(),
+                    self.preserve_metadata_var.get()
+                )
+
+                messagebox.showinfo("Success", f"Image saved to:\n{output_path}")
+
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to save image: {str(e)}")
+
+    def get_processing_options(self):
+        """Take a read-only snapshot of all processing options set in the UI"""
+        try:
+            width = int(self.width_var.get()) if self.resize_var.get() and self.width_var.get() else 0
+            height = int(self.height_var.get()) if self.resize_var.get() and self.height_var.get() else 0
+        except ValueError:
+            width, height = 0, 0
+
+        return freeze_options({
+            "background_mode": self.bg_mode_var.get(),
+            "custom_color": self.custom_color_rgb,
+            "tolerance": self.tolerance_var.get(),
+            "auto_detect": self.auto_detect_var.get(),
+            "resize": self.resize_var.get(),
+            "width": width,
+            "height": height,
+            "crop": self.crop_var.get(),
+            "crop_left": self.crop_left_var.get(),
+            "crop_top": self.crop_top_var.get(),
+            "crop_right": self.crop_right_var.get(),
+            "crop_bottom": self.crop_bottom_var.get(),
+            "invert_colors": self.invert_colors_var.get(),
+            "adjust_alpha": self.adjust_alpha_var.get(),
+            "alpha_value": self.alpha_value_var.get(),
+            "replace_background": self.replace_bg_var.get(),
+            "replacement_color": self.replacement_color_rgb,
+            "key_colors": list(self.key_colors),
+            "key_ranges": list(self.key_ranges),
+            "engine": settings.get("processing_engine", DEFAULT_ENGINE)
+        })
+
+    def get_output_settings(self):
+        """Get the output settings as a dictionary"""
+        output_dir = None
+        if self.custom_output_var.get() and self.output_dir_var.get():
+            output_dir = self.output_dir_var.get()
+            # Save the last used directory
+            settings["last_output_dir"] = output_dir
+            save_settings(settings)
+
+        try:
+            sizes, formats = parse_output_set(self.output_widths_var.get(), self.output_formats_var.get())
+        except Exception as e:
+            # The fields are checked as they are entered, so this is a value set some other way
+            print(f"Ignoring output set: {str(e)}")
+            sizes, formats = [], []
+
+        return {
+            "format": self.output_format_var.get(),
+            "quality": self.output_quality_var.get(),
+            "optimize": self.output_optimize_var.get(),
+            "preserve_metadata": self.preserve_metadata_var.get(),
+            "output_dir": output_dir,
+            "naming_pattern": self.naming_pattern_var.get(),
+            "overwrite": self.overwrite_var.get(),
+            "sizes": sizes,
+            "formats": formats,
+            "srcset": self.srcset_var.get()
+        }
+
+    def validate_output_set(self, variable, formats=False):
+        """Check the output set widths or formats once entered, clearing the field if it doesn't parse"""
+        try:
+            if formats:
+                parse_output_set("", variable.get())
+            else:
+                parse_output_set(variable.get())
+        except Exception as e:
+            # Clear it first, so the focus moving to the message doesn't report it again
+            variable.set("")
+            messagebox.showerror("Error", f"{str(e)}\nThe field has been cleared.")
+
+    def get_output_path(self, input_path):
+        """Generate output path based on settings"""
+        output = self.get_output_settings()
+        return build_output_path(input_path, output["format"], output["output_dir"], output["naming_pattern"],
+                                 output["overwrite"], sizes=output["sizes"], formats=output["formats"],
+                                 manifest=output["srcset"])
+
+    # UI event handlers
+    def update_preview(self):
+        """Update the image preview"""
+        if not self.current_file or not self.original_image:
+            return
+
+        if not self.preview_var.get():
+            return
+
+        try:
+            # Tiles of large images are scaled and keyed off the Tk thread
+            large = self.original_image.width * self.original_image.height > PREVIEW_FULL_PIXELS
+            if large and self.tile_executor is None:
+                self.tile_executor = ThreadPoolExecutor(max_workers=PREVIEW_TILE_WORKERS)
+            if self.original_pyramid is None or self.original_pyramid.image is not self.original_image:
+                self.original_pyramid = TilePyramid(self.original_image, executor=self.tile_executor if large else None)
+
+            # Process image with current settings
+            options = self.get_processing_options()
+            # The old pyramid may map the shared result that processing replaces
+            if self.processed_pyramid is not None:
+                self.processed_pyramid.cancel()
+            self.processed_pyramid = None
+            if not large:
+                processed = self.run_processing(options)
+                self.processed_image = processed  # Store for later use
+                self.processed_pyramid = TilePyramid(processed)
+            else:
+                # Only the tiles in view are processed; saving processes the whole image
+                self.release_shared_result()
+                self.processed_image = None
+                base, options = self.preview_base(options)
+                self.processed_pyramid = TilePyramid(base, self.processor, options, executor=self.tile_executor)
+            self.preview_mapping = self.preview_geometry(options)
+
+            self.render_preview()
+
+        except Exception as e:
+            print(f"Preview error: {str(e)}")
+
+    def preview_base(self, options):
+        """The image the processed preview's tiles are keyed from, with the final options"""
+        if self.processor.geometry_key(options) != (None, None):
+            return self.processor.prepare_image(self.original_image, options)
+        # Without a resize or crop the loaded image is used as it is, not copied
+        if options.get("auto_detect"):
+            options = dict(options, **self.processor.detect_background(self.original_image))
+        return self.original_image, options
+
+    def preview_geometry(self, options):
+        """Scale and offset taking original image pixels to processed image pixels"""
+        scale_x = scale_y = 1.0
+        if options["resize"] and options["width"] > 0 and options["height"] > 0:
+            scale_x = options["width"] / self.original_image.width
+            scale_y = options["height"] / self.original_image.height
+        offset_x = offset_y = 0
+        if options["crop"]:
+            offset_x, offset_y = options["crop_left"], options["crop_top"]
+        return scale_x, scale_y, offset_x, offset_y
+
+    def preview_view(self):
+        """The preview's scale and centre in original pixels, working out the fitted ones if needed"""
+        if self.preview_scale is not None:
+            return self.preview_scale, self.preview_center
+        width, height = self.original_image.size
+        canvas_width = max(1, self.original_canvas.winfo_width())
+        canvas_height = max(1, self.original_canvas.winfo_height())
+        return min(1.0, canvas_width / width, canvas_height / height), (width / 2, height / 2)
+
+    def render_preview(self):
+        """Draw both preview panes at the current zoom and position"""
+        from PIL import ImageTk
+
+        self.preview_render_pending = False
+        if self.original_pyramid is None or self.processed_pyramid is None:
+            return
+
+        scale_x, scale_y, offset_x, offset_y = self.preview_mapping
+        for canvas, pyramid, name in ((self.original_canvas, self.original_pyramid, "original_preview"),
+                                      (self.processed_canvas, self.processed_pyramid, "processed_preview")):
+            canvas.delete("all")
+            size = (max(1, canvas.winfo_width()), max(1, canvas.winfo_height()))
+            if self.preview_scale is None:
+                # Each pane fits its own image, never enlarging it
+                width, height = pyramid.size
+                scale, center = min(1.0, size[0] / width, size[1] / height), (width / 2, height / 2)
+            else:
+                scale, center = self.preview_scale, self.preview_center
+                if pyramid is self.processed_pyramid:
+                    scale = scale / scale_x
+                    center = (center[0] * scale_x - offset_x, center[1] * scale_y - offset_y)
+
+            image, position = pyramid.view(center, scale, size)
+            photo = ImageTk.PhotoImage(image) if image is not None else None
+            setattr(self, name, photo)  # Keep reference to prevent garbage collection
+            if photo is not None:
+                canvas.create_image(position[0], position[1], image=photo, anchor=tk.NW)
+
+        self.zoom_label.config(text="Fit" if self.preview_scale is None else f"{self.preview_scale:.0%}")
+
+        # Tiles still being made show as placeholders; draw them again as they come in
+        self.preview_tiles_drawn = self.original_pyramid.made + self.processed_pyramid.made
+        if (self.original_pyramid.pending or self.processed_pyramid.pending) and not self.preview_tile_polling:
+            self.preview_tile_polling = True
+            self.root.after(BATCH_REFRESH_MS, self.poll_preview_tiles)
+
+    def poll_preview_tiles(self):
+        """Redraw the preview when background tiles have been made since it was last drawn"""
+        if self.original_pyramid is None or self.processed_pyramid is None:
+            self.preview_tile_polling = False
+            return
+        pending = self.original_pyramid.pending or self.processed_pyramid.pending
+        if self.original_pyramid.made + self.processed_pyramid.made != self.preview_tiles_drawn:
+            self.render_preview()
+        elif not pending:
+            self.preview_tile_polling = False
+            return
+        self.root.after(BATCH_REFRESH_MS, self.poll_preview_tiles)
+
+    def schedule_preview_render(self):
+        """Redraw the preview once the pending events are handled, however many ask for it"""
+        if not self.preview_render_pending and self.original_pyramid is not None:
+            self.preview_render_pending = True
+            self.root.after_idle(self.render_preview)
+
+    def set_preview_zoom(self, scale, anchor=None):
+        """Zoom the preview to scale (None fits it), keeping the point anchor pixels from the pane centre still"""
+        if self.original_pyramid is None:
+            return
+
+        if scale is None:
+            self.preview_scale = self.preview_center = None
+        else:
+            old_scale, center = self.preview_view()
+            scale = min(PREVIEW_MAX_ZOOM, max(0.01, scale))
+            if anchor is not None:
+                # Both panes show original pixels at the same screen scale, so either pane's offset will do
+                center = (center[0] + anchor[0] / old_scale - anchor[0] / scale,
+                          center[1] + anchor[1] / old_scale - anchor[1] / scale)
+            self.preview_scale = scale
+            self.preview_center = self.clamp_preview_center(center)
+        self.schedule_preview_render()
+
+    def clamp_preview_center(self, center):
+        """Keep the preview centre over the image"""
+        width, height = self.original_image.size
+        return min(max(center[0], 0.0), float(width)), min(max(center[1], 0.0), float(height))
+
+    def on_preview_wheel(self, event):
+        """Zoom the preview in or out around the pointer"""
+        if self.original_pyramid is None:
+            return
+        zoom_in = getattr(event, "num", None) == 4 or getattr(event, "delta", 0) > 0
+        scale, _ = self.preview_view()
+        anchor = (event.x - event.widget.winfo_width() / 2, event.y - event.widget.winfo_height() / 2)
+        self.set_preview_zoom(scale * PREVIEW_ZOOM_STEP if zoom_in else scale / PREVIEW_ZOOM_STEP, anchor)
+
+    def on_preview_press(self, event):
+        """Start panning the preview"""
+        if self.original_pyramid is None:
+            return
+        scale, center = self.preview_view()
+        self.preview_drag = (event.x, event.y, scale, center)
+
+    def on_preview_drag(self, event):
+        """Pan the preview with the pointer"""
+        if self.preview_drag is None or self.original_pyramid is None:
+            return
+        x, y, scale, center = self.preview_drag
+        self.preview_scale = scale
+        self.preview_center = self.clamp_preview_center((center[0] - (event.x - x) / scale,
+                                                         center[1] - (event.y - y) / scale))
+        self.schedule_preview_render()
+
+    def run_processing(self, options):
+        """Process the loaded image, in the worker processes when they are enabled"""
+        workers = get_process_workers()
+        if workers is None:
+            return self.processor.process_image(self.original_image, options)
+
+        # The result stays in shared memory until the next one replaces it
+        shared = workers.process(self.processor, self.original_image, options)
+        previous, self.shared_result = self.shared_result, shared
+        if previous:
+            previous.close()
+        return shared.image()
+
+    def release_shared_result(self):
+        """Free the shared memory behind the last processed image"""
+        if self.shared_result:
+            self.processed_image = None
+            self.processed_pyramid = None
+            self.shared_result.close()
+            self.shared_result = None
+
+    def toggle_preview(self):
+        """Toggle automatic preview"""
+        if self.preview_var.get():
+            self.update_preview()
+
+    def toggle_resize(self):
+        """Enable/disable resize fields"""
+        state = "normal" if self.resize_var.get() else "disabled"
+        for widget in self.settings_frame.winfo_children():
+            if isinstance(widget, ttk.Entry) and (
+                    widget.winfo_name() == "width" or widget.winfo_name() == "height"):
+                widget.configure(state=state)
+
+        self.update_preview()
+
+    def toggle_crop(self):
+        """Enable/disable crop controls"""
+        state = "normal" if self.crop_var.get() else "disabled"
+        # Enable/disable crop sliders
+        for widget in self.advanced_frame.winfo_children():
+            if isinstance(widget, ttk.Scale) and widget.winfo_name().startswith("crop_"):
+                widget.configure(state=state)
+
+        self.update_preview()
+
+    def toggle_alpha(self):
+        """Enable/disable alpha slider"""
+        state = "normal" if self.adjust_alpha_var.get() else "disabled"
+        # Enable/disable alpha slider
+        for widget in self.advanced_frame.winfo_children():
+            if isinstance(widget, ttk.Scale) and widget.winfo_name() == "alpha":
+                widget.configure(state=state)
+
+        self.update_preview()
+
+    def toggle_bg_replacement(self):
+        """Enable/disable background replacement controls"""
+        state = "normal" if self.replace_bg_var.get() else "disabled"
+        # Enable/disable background color picker
+        for widget in self.advanced_frame.winfo_children():
+            if isinstance(widget, ttk.Button) and widget.winfo_name() == "bg_color_picker":
+                widget.configure(state=state)
+
+        self.update_preview()
+
+    def pick_color(self):
+        """Open color picker for background color"""
+        color = colorchooser.askcolor(initialcolor=self.custom_color_var.get())
+        if color[1]:  # If color is selected (not canceled)
+            self.custom_color_var.set(color[1])
+            self.custom_color_rgb = color[0]
+            self.color_preview.configure(background=color[1])
+            self.update_preview()
+
+    def auto_detect_background(self):
+        """Detect the background of the current image and apply it to the controls"""
+        if not self.current_file or not self.original_image:
+            messagebox.showinfo("No Image", "Please open an image first.")
+            return
+
+        detected = self.processor.detect_background(self.original_image)
+        self.bg_mode_var.set(detected["background_mode"])
+        self.tolerance_var.set(detected["tolerance"])
+        if detected["background_mode"] == "custom":
+            color = "#%02x%02x%02x" % detected["custom_color"]
+            self.custom_color_var.set(color)
+            self.custom_color_rgb = detected["custom_color"]
+            self.color_preview.configure(background=color)
+
+        self.status_label.config(text=f"Detected {detected['background_mode']} background, "
+                                      f"tolerance {detected['tolerance']}")
+        self.update_preview()
+
+    def pick_bg_color(self):
+        """Open color picker for replacement background color"""
+        color = colorchooser.askcolor(initialcolor=self.replacement_color_var.get())
+        if color[1]:  # If color is selected (not canceled)
+            self.replacement_color_var.set(color[1])
+            self.replacement_color_rgb = color[0]
+            self.bg_color_preview.configure(background=color[1])
+            self.update_preview()
+
+    def manage_key_colors(self):
+        """Open a dialog to manage additional key colours and HSV ranges"""
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Extra Keys")
+        dialog.geometry("380x300")
+        dialog.resizable(False, False)
+        dialog.transient(self.root)
+        dialog.grab_set()
+
+        key_list = tk.Listbox(dialog)
+        key_list.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+
+        def refresh():
+            key_list.delete(0, tk.END)
+            for key in self.key_colors:
+                r, g, b = key["color"]
+                key_list.insert(tk.END, f"Colour #{r:02x}{g:02x}{b:02x}, tolerance {key['tolerance']}")
+            for key_range in self.key_ranges:
+                key_list.insert(tk.END, "HSV hue {}-{}, saturation {}-{}%, value {}-{}%".format(
+                    *key_range["hue"], *key_range["saturation"], *key_range["value"]))
+
+        def add_color():
+            color = colorchooser.askcolor(parent=dialog)
+            if color[1]:
+                self.key_colors.append({"color": [int(c) for c in color[0]],
+                                        "tolerance": self.tolerance_var.get()})
+                refresh()
+                self.update_preview()
+
+        def add_range():
+            text = simpledialog.askstring(
+                "Add HSV Range",
+                "Hue (degrees), saturation and value (%) as ranges,\nfor example: 200-260, 20-100, 30-100",
+                parent=dialog)
+            if not text:
+                return
+            try:
+                bounds = [[float(v) for v in part.split("-")] for part in text.split(",")]
+                if len(bounds) != 3 or any(len(b) != 2 for b in bounds):
+                    raise ValueError(text)
+            except ValueError:
+                messagebox.showerror("Invalid Range", "Please enter three ranges like 200-260, 20-100, 30-100.",
+                                     parent=dialog)
+                return
+            self.key_ranges.append({"hue": bounds[0], "saturation": bounds[1], "value": bounds[2]})
+            refresh()
+            self.update_preview()
+
+        def remove():
+            selection = key_list.curselection()
+            if selection:
+                index = selection[0]
+                if index < len(self.key_colors):
+                    del self.key_colors[index]
+                else:
+                    del self.key_ranges[index - len(self.key_colors)]
+                refresh()
+                self.update_preview()
+
+        refresh()
+
+        button_frame = ttk.Frame(dialog)
+        button_frame.pack(fill=tk.X, padx=10, pady=10)
+
+        ttk.Button(button_frame, text="Add Colour", command=add_color).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Add HSV Range", command=add_range).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Remove", command=remove).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Close", command=dialog.destroy).pack(side=tk.RIGHT, padx=5)
+
+    def browse_output_dir(self):
+        """Browse for output directory"""
+        directory = filedialog.askdirectory(initialdir=self.output_dir_var.get() or os.path.expanduser("~"))
+        if directory:
+            self.output_dir_var.set(directory)
+
+    # Preset management
+    def save_preset(self):
+        """Save current settings as a preset"""
+        preset_name = simpledialog.askstring("Save Preset", "Enter a name for this preset:")
+        if preset_name:
+            # Get current settings
+            preset = {
+                "background_mode": self.bg_mode_var.get(),
+                "custom_color": self.custom_color_var.get(),
+                "tolerance": self.tolerance_var.get(),
+                "auto_detect": self.auto_detect_var.get(),
+                "key_colors": list(self.key_colors),
+                "key_ranges": list(self.key_ranges),
+                "invert_colors": self.invert_colors_var.get(),
+                "resize": self.resize_var.get(),
+                "width": self.width_var.get(),
+                "height": self.height_var.get(),
+                "crop": self.crop_var.get(),
+                "crop_left": self.crop_left_var.get(),
+                "crop_top": self.crop_top_var.get(),
+                "crop_right": self.crop_right_var.get(),
+                "crop_bottom": self.crop_bottom_var.get(),
+                "adjust_alpha": self.adjust_alpha_var.get(),
+                "alpha_value": self.alpha_value_var.get(),
+                "replace_background": self.replace_bg_var.get(),
+                "replacement_color": self.replacement_color_var.get(),
+                "output_format": self.output_format_var.get(),
+                "output_quality": self.output_quality_var.get(),
+                "output_optimize": self.output_optimize_var.get(),
+                "output_widths": self.output_widths_var.get(),
+                "output_formats": self.output_formats_var.get(),
+                "output_srcset": self.srcset_var.get()
+            }
+
+            # Save to settings
+            presets = settings.get("presets", {})
+            presets[preset_name] = preset
+            settings["presets"] = presets
+            save_settings(settings)
+
+            # Update presets menu
+            self.update_presets_menu()
+
+            messagebox.showinfo("Preset Saved", f"Preset '{preset_name}' has been saved.")
+
+    def load_preset(self, preset_name):
+        """Load a preset"""
+        # Get preset (from saved or default)
+        preset = get_preset(preset_name)
+
+        if not preset:
+            messagebox.showerror("Error", f"Preset '{preset_name}' not found.")
+            return
+
+        # Apply preset settings
+        self.bg_mode_var.set(preset.get("background_mode", "black"))
+        self.custom_color_var.set(preset.get("custom_color", "#000000"))
+        self.custom_color_rgb = hex_to_rgb(self.custom_color_var.get())
+        self.color_preview.configure(background=self.custom_color_var.get())
+        self.tolerance_var.set(preset.get("tolerance", 15))
+        self.auto_detect_var.set(preset.get("auto_detect", False))
+        self.key_colors = list(preset.get("key_colors", []))
+        self.key_ranges = list(preset.get("key_ranges", []))
+        self.invert_colors_var.set(preset.get("invert_colors", True))
+        self.resize_var.set(preset.get("resize", False))
+        self.width_var.set(preset.get("width", ""))
+        self.height_var.set(preset.get("height", ""))
+        self.crop_var.set(preset.get("crop", False))
+        self.crop_left_var.set(preset.get("crop_left", 0))
+        self.crop_top_var.set(preset.get("crop_top", 0))
+        self.crop_right_var.set(preset.get("crop_right", 100))
+        self.crop_bottom_var.set(preset.get("crop_bottom", 100))
+        self.adjust_alpha_var.set(preset.get("adjust_alpha", False))
+        self.alpha_value_var.set(preset.get("alpha_value", 255))
+        self.replace_bg_var.set(preset.get("replace_background", False))
+        self.replacement_color_var.set(preset.get("replacement_color", "#FFFFFF"))
+        self.replacement_color_rgb = hex_to_rgb(self.replacement_color_var.get())
+        if self.bg_color_preview is not None:
+            self.bg_color_preview.configure(background=self.replacement_color_var.get())
+        self.output_format_var.set(preset.get("output_format", "png"))
+        self.output_quality_var.set(preset.get("output_quality", 95))
+        self.output_optimize_var.set(preset.get("output_optimize", True))
+        self.output_widths_var.set(preset.get("output_widths", ""))
+        self.output_formats_var.set(preset.get("output_formats", ""))
+        self.srcset_var.set(preset.get("output_srcset", False))
+
+        # Update UI states
+        self.toggle_resize()
+        self.toggle_crop()
+        self.toggle_alpha()
+        self.toggle_bg_replacement()
+
+        # Update preview
+        self.update_preview()
+
+        # Compile the preset in the background, so the first run starts warm
+        options = self.get_processing_options()
+        output = {"format": self.output_format_var.get(), "quality": self.output_quality_var.get(),
+                  "optimize": self.output_optimize_var.get()}
+        threading.Thread(target=self.warm_plan, args=(options, output), daemon=True).start()
+
+        self.status_label.config(text=f"Loaded preset: {preset_name}")
+
+    @staticmethod
+    def warm_plan(options, output):
+        """Compile and install a processing plan, ignoring options that don't validate yet"""
+        try:
+            compile_options(options, output).install()
+        except Exception as e:
+            print(f"Error compiling preset: {str(e)}")
+
+    def update_presets_menu(self):
+        """Update the presets menu with saved presets"""
+        # Clear user presets
+        for i in range(self.presets_menu.index("end") - 3):
+            self.presets_menu.delete(3)
+
+        # Add saved presets
+        presets = settings.get("presets", {})
+        for preset_name in presets:
+            self.presets_menu.add_command(label=preset_name,
+                                          command=lambda name=preset_name: self.load_preset(name))
+
+    def manage_presets(self):
+        """Open a dialog to manage presets"""
+        presets = settings.get("presets", {})
+        if not presets:
+            messagebox.showinfo("No Presets", "You don't have any saved presets.")
+            return
+
+        # Create preset manager dialog
+        preset_manager = tk.Toplevel(self.root)
+        preset_manager.title("Manage Presets")
+        preset_manager.geometry("300x300")
+        preset_manager.resizable(False, False)
+        preset_manager.transient(self.root)
+        preset_manager.grab_set()
+
+        # Create listbox for presets
+        preset_list = tk.Listbox(preset_manager)
+        preset_list.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+
+        # Add presets to listbox
+        for preset_name in presets:
+            preset_list.insert(tk.END, preset_name)
+
+        # Create buttons
+        button_frame = ttk.Frame(preset_manager)
+        button_frame.pack(fill=tk.X, padx=10, pady=10)
+
+        ttk.Button(button_frame, text="Load",
+                   command=lambda: self.load_preset_from_manager(preset_list, preset_manager)).pack(
+            side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Delete",
+                   command=lambda: self.delete_preset(preset_list)).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Close",
+                   command=preset_manager.destroy).pack(side=tk.RIGHT, padx=5)
+
+    def load_preset_from_manager(self, preset_list, manager):
+        """Load a preset from the preset manager"""
+        selection = preset_list.curselection()
+        if selection:
+            preset_name = preset_list.get(selection[0])
+            manager.destroy()
+            self.load_preset(preset_name)
+
+    def delete_preset(self, preset_list):
+        """Delete a preset"""
+        selection = preset_list.curselection()
+        if selection:
+            preset_name = preset_list.get(selection[0])
+            confirm = messagebox.askyesno("Confirm Delete",
+                                          f"Are you sure you want to delete the preset '{preset_name}'?")
+            if confirm:
+                presets = settings.get("presets", {})
+                if preset_name in presets:
+                    del presets[preset_name]
+                    settings["presets"] = presets
+                    save_settings(settings)
+                    preset_list.delete(selection[0])
+                    self.update_presets_menu()
+
+    # Preferences and help
+    def show_preferences(self):
+        """Show preferences dialog"""
+        prefs = tk.Toplevel(self.root)
+        prefs.title("Preferences")
+        prefs.geometry("420x530")
+        prefs.resizable(False, False)
+        prefs.transient(self.root)
+        prefs.grab_set()
+
+        # Create notebook for preference tabs
+        pref_notebook = ttk.Notebook(prefs)
+        pref_notebook.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+
+        # General tab
+        general_frame = ttk.Frame(pref_notebook)
+        pref_notebook.add(general_frame, text="General")
+
+        # Theme selection
+        theme_frame = ttk.LabelFrame(general_frame, text="Theme")
+        theme_frame.pack(fill=tk.X, padx=10, pady=5)
+
+        theme_var = StringVar(value=settings.get("theme", "light"))
+        ttk.Radiobutton(theme_frame, text="Light Theme", variable=theme_var,
+                        value="light").pack(anchor="w", padx=10, pady=2)
+        ttk.Radiobutton(theme_frame, text="Dark Theme", variable=theme_var,
+                        value="dark").pack(anchor="w", padx=10, pady=2)
+
+        # Default format
+        format_frame = ttk.LabelFrame(general_frame, text="Default Output Format")
+        format_frame.pack(fill=tk.X, padx=10, pady=5)
+
+        format_var = StringVar(value=settings.get("default_format", "png"))
+        ttk.Radiobutton(format_frame, text="PNG", variable=format_var,
+                        value="png").pack(anchor="w", padx=10, pady=2)
+        ttk.Radiobutton(format_frame, text="JPEG", variable=format_var,
+                        value="jpg").pack(anchor="w", padx=10, pady=2)
+        ttk.Radiobutton(format_frame, text="WebP", variable=format_var,
+                        value="webp").pack(anchor="w", padx=10, pady=2)
+
+        # File handling tab
+        file_frame = ttk.Frame(pref_notebook)
+        pref_notebook.add(file_frame, text="File Handling")
+
+        # Metadata option
+        metadata_var = BooleanVar(value=settings.get("preserve_metadata", True))
+        ttk.Checkbutton(file_frame, text="Preserve image metadata by default",
+                        variable=metadata_var).pack(anchor="w", padx=10, pady=5)
+
+        # Overwrite option
+        overwrite_var = BooleanVar(value=settings.get("overwrite_existing", False))
+        ttk.Checkbutton(file_frame, text="Overwrite existing files by default",
+                        variable=overwrite_var).pack(anchor="w", padx=10, pady=5)
+
+        # Default naming pattern
+        naming_frame = ttk.LabelFrame(file_frame, text="Default Naming Pattern")
+        naming_frame.pack(fill=tk.X, padx=10, pady=5)
+
+        naming_var = StringVar(value=settings.get("custom_naming", "{filename}_converted"))
+        ttk.Entry(naming_frame, textvariable=naming_var).pack(fill=tk.X, padx=10, pady=5)
+        ttk.Label(naming_frame, text="Available variables: {filename}, {date}, {time}, {counter}").pack(
+            anchor="w", padx=10, pady=2)
+
+        # Performance tab
+        performance_frame = ttk.Frame(pref_notebook)
+        pref_notebook.add(performance_frame, text="Performance")
+
+        ttk.Label(performance_frame, text="Files processed at once (0 = number of CPUs):").pack(
+            anchor="w", padx=10, pady=(10, 2))
+        workers_var = IntVar(value=settings.get("batch_workers", 0))
+        ttk.Spinbox(performance_frame, from_=0, to=64, textvariable=workers_var, width=8).pack(
+            anchor="w", padx=10, pady=2)
+
+        ttk.Label(performance_frame, text="Memory budget in MB (0 = half of RAM):").pack(
+            anchor="w", padx=10, pady=(10, 2))
+        budget_var = IntVar(value=settings.get("memory_budget_mb", 0))
+        ttk.Spinbox(performance_frame, from_=0, to=1048576, increment=256, textvariable=budget_var,
+                    width=10).pack(anchor="w", padx=10, pady=2)
+
+        ttk.Label(performance_frame, text="Worker processes for pixel work (0 = off):").pack(
+            anchor="w", padx=10, pady=(10, 2))
+        processes_var = IntVar(value=settings.get("worker_processes", 0))
+        ttk.Spinbox(performance_frame, from_=0, to=64, textvariable=processes_var, width=8).pack(
+            anchor="w", padx=10, pady=2)
+
+        ttk.Label(performance_frame, text="Start files in (priority starts pinned files first):").pack(
+            anchor="w", padx=10, pady=(10, 2))
+        order_var = StringVar(value=settings.get("queue_order", "fifo"))
+        ttk.Combobox(performance_frame, textvariable=order_var, values=QUEUE_ORDERS, state="readonly",
+                     width=10).pack(anchor="w", padx=10, pady=2)
+
+        profile_var = BooleanVar(value=settings.get("profile_slow_files", False))
+        ttk.Checkbutton(performance_frame, text="Profile slow files (cProfile and tracemalloc)",
+                        variable=profile_var).pack(anchor="w", padx=10, pady=(10, 2))
+        ttk.Label(performance_frame, text="Keep profiles of files taking at least (seconds):").pack(
+            anchor="w", padx=10, pady=2)
+        threshold_var = tk.DoubleVar(value=settings.get("profile_threshold", 10.0))
+        ttk.Spinbox(performance_frame, from_=0, to=3600, increment=1, textvariable=threshold_var, width=8).pack(
+            anchor="w", padx=10, pady=2)
+        ttk.Label(performance_frame, text="Profiles folder (empty = a profiles folder beside the output):").pack(
+            anchor="w", padx=10, pady=2)
+        profile_dir_var = StringVar(value=settings.get("profile_dir", ""))
+        ttk.Entry(performance_frame, textvariable=profile_dir_var, width=40).pack(anchor="w", padx=10, pady=2)
+
+        # Save button
+        def save_preferences():
+            try:
+                settings["batch_workers"] = max(0, workers_var.get())
+                settings["memory_budget_mb"] = max(0, budget_var.get())
+                settings["worker_processes"] = max(0, processes_var.get())
+                settings["profile_threshold"] = max(0.0, threshold_var.get())
+            except tk.TclError:
+                messagebox.showerror("Preferences", "Performance settings must be numbers.")
+                return
+            settings["queue_order"] = order_var.get()
+            settings["profile_slow_files"] = profile_var.get()
+            settings["profile_dir"] = profile_dir_var.get().strip()
+            settings["theme"] = theme_var.get()
+            settings["default_format"] = format_var.get()
+            settings["preserve_metadata"] = metadata_var.get()
+            settings["overwrite_existing"] = overwrite_var.get()
+            settings["custom_naming"] = naming_var.get()
+            save_settings(settings)
+
+            # Apply theme
+            self.apply_theme(theme_var.get())
+
+            # Update variables
+            self.output_format_var.set(format_var.get())
+            self.preserve_metadata_var.set(metadata_var.get())
+            self.overwrite_var.set(overwrite_var.get())
+            self.naming_pattern_var.set(naming_var.get())
+
+            prefs.destroy()
+            messagebox.showinfo("Preferences", "Preferences have been saved.")
+
+        ttk.Button(prefs, text="Save", command=save_preferences).pack(side=tk.RIGHT, padx=10, pady=10)
+        ttk.Button(prefs, text="Cancel", command=prefs.destroy).pack(side=tk.RIGHT, padx=0, pady=10)
+
+    def show_documentation(self):
+        """Show documentation"""
+        # Try to open documentation in web browser
+        try:
+            import webbrowser
+            webbrowser.open("https://github.com/vinayhr5/enhanced-image-converter/blob/main/README.md")
+        except:
+            # If web browser can't be opened, show documentation in a dialog
+            doc = tk.Toplevel(self.root)
+            doc.title("Documentation")
+            doc.geometry("600x500")
+            doc.transient(self.root)
+
+            # Create text widget with scrollbar
+            text_frame = ttk.Frame(doc)
+            text_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+
+            scrollbar = ttk.Scrollbar(text_frame)
+            scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+            text = tk.Text(text_frame, wrap=tk.WORD, yscrollcommand=scrollbar.set)
+            text.pack(fill=tk.BOTH, expand=True)
+            scrollbar.config(command=text.yview)
+
+            # Add documentation text
+            documentation = """
+                            # Background Remover and Color Inverter
+
+    ## Basic Usage
+
+    1. Open an image file using File > Open File or the "Open File" button.
+    2. Select the background type (black, white, or custom color).
+    3. Adjust the tolerance slider to control how much of the background is removed.
+    4. Check "Invert Colors" if you want to invert the colors of the non-background areas.
+    5. Click "Process & Save" to save the processed image.
+
+    ## Advanced Features
+
+        ### Resize
+
+    Check "Resize Image" and enter the desired width and height in pixels.
+
+    ### Crop
+
+    Check "Crop Image" and use the sliders to adjust the crop area.
+
+    ### Transparency
+
+    Check "Adjust Transparency" and use the slider to control the overall transparency.
+
+    ### Background Replacement
+
+    Check "Replace Background" and choose a color to replace the transparent areas.
+
+    ## Batch Processing
+
+    1. Add multiple files to the queue using File > Open Multiple Files.
+    2. Configure your processing settings.
+    3. Click "Process All" to process all files in the queue.
+
+    ## Presets
+
+    Save your current settings as a preset using Edit > Presets > Save Current Settings as Preset.
+    Load a preset using Edit > Presets and selecting the preset name.
+
+    ## Output Options
+
+    - Choose the output format (PNG, JPEG, WebP, etc.)
+    - Adjust quality settings for JPEG and WebP
+    - Set custom output directory
+    - Configure file naming pattern
+            """
+
+            text.insert(tk.END, documentation)
+            text.config(state=tk.DISABLED)
+
+            ttk.Button(doc, text="Close", command=doc.destroy).pack(pady=10)
+
+    def show_stage_stats(self):
+        """Show where processing time went, for the last batch or the whole session"""
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Processing Stats")
+        dialog.geometry("620x360")
+        dialog.transient(self.root)
+
+        scope_var = tk.StringVar(value="batch" if self.batch else "session")
+        columns = ("calls", "total", "average", "max", "mb", "share")
+        headings = ("Calls", "Total (s)", "Avg (ms)", "Max (ms)", "MB", "Share")
+
+        scope_frame = ttk.Frame(dialog)
+        scope_frame.pack(fill=tk.X, padx=10, pady=(10, 0))
+        table = ttk.Treeview(dialog, columns=columns, show="tree headings")
+        table.heading("#0", text="Stage")
+        table.column("#0", width=120)
+        for column, heading in zip(columns, headings):
+            table.heading(column, text=heading)
+            table.column(column, width=80, anchor=tk.E)
+        table.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+
+        def stats():
+            return self.batch.stage_stats if scope_var.get() == "batch" and self.batch else STAGE_STATS
+
+        def refresh():
+            table.delete(*table.get_children())
+            for name, stage in stats().snapshot().items():
+                table.insert("", tk.END, text=name, values=(
+                    stage["count"], f"{stage['seconds']:.3f}", f"{stage['seconds'] * 1000 / stage['count']:.2f}",
+                    f"{stage['max_ms']:.2f}", f"{stage['bytes'] / 1e6:.1f}", f"{stage['share']:.1%}"))
+
+        def export():
+            path = filedialog.asksaveasfilename(parent=dialog, defaultextension=".json",
+                                                initialfile=f"stage_stats_{scope_var.get()}.json",
+                                                filetypes=[("JSON files", "*.json"), ("All files", "*.*")])
+            if not path:
+                return
+            try:
+                stats().save_json(path, scope=scope_var.get())
+            except Exception as e:
+                messagebox.showerror("Error", str(e), parent=dialog)
+
+        ttk.Radiobutton(scope_frame, text="Last batch", variable=scope_var, value="batch", command=refresh,
+                        state=tk.NORMAL if self.batch else tk.DISABLED).pack(side=tk.LEFT)
+        ttk.Radiobutton(scope_frame, text="Session", variable=scope_var, value="session",
+                        command=refresh).pack(side=tk.LEFT, padx=10)
+
+        button_frame = ttk.Frame(dialog)
+        button_frame.pack(fill=tk.X, padx=10, pady=(0, 10))
+        ttk.Button(button_frame, text="Refresh", command=refresh).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Export JSON...", command=export).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Close", command=dialog.destroy).pack(side=tk.RIGHT, padx=5)
+        refresh()
+
+    def show_about(self):
+        """Show about dialog"""
+        about = tk.Toplevel(self.root)
+        about.title("About")
+        about.geometry("400x300")
+        about.resizable(False, False)
+        about.transient(self.root)
+        about.grab_set()
+
+        # App icon
+        try:
+            if os.name == 'nt':  # Windows
+                logo = tk.PhotoImage(file='icon.png')
+                logo_label = ttk.Label(about, image=logo)
+                logo_label.image = logo  # Keep a reference
+                logo_label.pack(pady=10)
+            else:  # Linux/Mac
+                logo = tk.PhotoImage(file='icon.png')
+                logo_label = ttk.Label(about, image=logo)
+                logo_label.image = logo  # Keep a reference
+                logo_label.pack(pady=10)
+        except:
+            pass
+
+        # App info
+        ttk.Label(about, text="Background Remover and Color Inverter",
+                  font=("Helvetica", 14, "bold")).pack(pady=5)
+        ttk.Label(about, text=f"Version {APP_VERSION}").pack()
+        ttk.Label(about, text="Created by Vinay Ahari").pack(pady=5)
+
+        # Description
+        description = ttk.Label(about, text="A tool for removing backgrounds from images and inverting colors.",
+                                wraplength=350, justify="center")
+        description.pack(pady=10)
+
+        # Close button
+        ttk.Button(about, text="Close", command=about.destroy).pack(pady=10)
+
+
+def parse_args(argv=None):
+    """Parse the command line"""
+    parser = argparse.ArgumentParser(description="Background Remover and Color Inverter")
+    parser.add_argument("inputs", nargs="*",
+                        help="image files, folders or zip/tar archives to process without the UI")
+    parser.add_argument("--headless", action="store_true", help="process the inputs without opening the UI")
+    parser.add_argument("--preset", action="append",
+                        help="name of a saved or built-in preset to apply; repeat it to decode each input "
+                             "once and save one output per preset")
+    parser.add_argument("--format", help="output format (png, jpg, webp, tiff, bmp)")
+    parser.add_argument("--quality", type=int, help="output quality for JPEG and WebP")
+    parser.add_argument("--widths", help="save a responsive set at these comma-separated widths, e.g. 320,640,1280")
+    parser.add_argument("--formats", help="formats of the responsive set, e.g. webp,png (default: --format)")
+    parser.add_argument("--srcset", action="store_true", help="write a JSON srcset manifest beside each set")
+    parser.add_argument("--output-dir", help="output folder (default: a 'converted' folder next to each input)")
+    parser.add_argument("--output-archive", metavar="PATH",
+                        help="write every output into this zip or tar archive instead of separate files")
+    parser.add_argument("--naming", help="file naming pattern, e.g. {filename}_converted")
+    parser.add_argument("--overwrite", action="store_true", help="overwrite existing output files")
+    parser.add_argument("--resume", action="store_true", help="finish the most recently interrupted batch")
+    parser.add_argument("--profile-slow", type=float, metavar="SECONDS",
+                        help="profile files and keep cProfile and tracemalloc reports of those taking this long")
+    parser.add_argument("--profile-dir", metavar="DIR",
+                        help="folder for profiles of slow files (default: a profiles folder beside the output)")
+    parser.add_argument("--stats-json", metavar="PATH",
+                        help="write the time and bytes spent in each processing stage to this JSON file")
+    parser.add_argument("--workers", type=int, help="number of files to process at once (default: CPU count)")
+    parser.add_argument("--memory-budget", type=int, metavar="MB",
+                        help="memory the running files may use together (default: half of RAM)")
+    parser.add_argument("--processes", type=int,
+                        help="worker processes for the per-pixel work, sharing pixels through shared memory")
+    parser.add_argument("--order", choices=QUEUE_ORDERS,
+                        help="order files start in: queue order, smallest first or pinned files first "
+                             "(default: the queue_order setting)")
+    parser.add_argument("--pin", action="append", metavar="PATTERN",
+                        help="start files matching this path or wildcard first (repeatable; implies --order priority)")
+    parser.add_argument("--cluster", metavar="DIR",
+                        help="share the batch with other machines running the same command, through lease files "
+                             "in this folder on the shared filesystem")
+    parser.add_argument("--lease-timeout", type=float, default=LEASE_TIMEOUT, metavar="SECONDS",
+                        help="seconds after which a silent node's files are taken over (default: %(default)s)")
+    parser.add_argument("--progress", choices=("text", "json", "none"), default="text",
+                        help="how to report progress: a status line, JSON lines or nothing")
+    parser.add_argument("--progress-interval", type=float, default=1.0,
+                        help="seconds between progress reports")
+    parser.add_argument("--serve", type=int, nargs="?", const=SERVICE_PORT, metavar="PORT",
+                        help=f"serve conversions over HTTP on localhost (default port {SERVICE_PORT})")
+    parser.add_argument("--host", default="127.0.0.1", help="address to serve on (default: 127.0.0.1)")
+    parser.add_argument("--serve-root", metavar="DIR",
+                        help="only convert files named in requests if they are in this folder")
+    parser.add_argument("--max-pending", type=int,
+                        help="requests allowed to wait for a free worker before the service answers busy")
+    parser.add_argument("--startup-report", nargs="?", const="text", choices=("text", "json"),
+                        help="open the UI, report how long each startup phase and import took, and exit")
+    return parser.parse_args(argv)
+
+
+def report_progress(updates, snapshot, style):
+    """Print one round of batch progress in the requested style"""
+    if style == "json":
+        event = dict(snapshot, event="progress",
+                     items=[{"path": path, "status": status} for path, status in updates.values()])
+        print(json.dumps(event), flush=True)
+    elif style == "text":
+        print(format_batch_status(snapshot), flush=True)
+
+
+def run_headless(args):
+    """Process files from the command line, reporting the same progress the UI shows"""
+    process_workers = ProcessWorkers(args.processes) if args.processes else get_process_workers()
+    try:
+        return run_headless_batch(args, process_workers)
+    finally:
+        # Stop the worker processes before the interpreter starts tearing down
+        if process_workers is not None:
+            process_workers.shutdown()
+
+
+def run_headless_batch(args, process_workers):
+    """Set up and run the batch the command line asks for"""
+    if args.cluster and (args.resume or args.output_archive):
+        print("--cluster can't be combined with --resume (run the same command again instead) or --output-archive.")
+        return 1
+    if args.resume:
+        state = latest_journal()
+        if not state:
+            print("No interrupted batch to resume.")
+            return 1
+        batch = BatchProcessor(ImageProcessor(), state["options"], state["output"], BatchJournal(state["path"]),
+                               state["outputs"], variants=state["variants"],
+                               **batch_limits(args, state["pending"], process_workers))
+        return run_batch(batch, state["pending"], args)
+
+    files = collect_image_files(args.inputs)
+    if not files:
+        print("No supported image files found.")
+        return 1
+    if args.output_archive and not is_archive(args.output_archive):
+        print(f"Unsupported archive type: {args.output_archive} (use .zip, .tar, .tar.gz, .tar.bz2 or .tar.xz)")
+        return 1
+
+    variants = []
+    for preset_name in args.preset or [None]:
+        preset = {}
+        if preset_name:
+            preset = get_preset(preset_name)
+            if preset is None:
+                print(f"Preset '{preset_name}' not found.")
+                return 1
+
+        try:
+            sizes, formats = parse_output_set(args.widths or preset.get("output_widths", ""),
+                                              args.formats or preset.get("output_formats", ""))
+            output = {
+                "format": args.format or preset.get("output_format", settings.get("default_format", "png")),
+                "quality": args.quality or preset.get("output_quality", 95),
+                "optimize": preset.get("output_optimize", True),
+                "preserve_metadata": settings.get("preserve_metadata", True),
+                "output_dir": args.output_dir,
+                "naming_pattern": args.naming or settings.get("custom_naming", "{filename}_converted"),
+                "overwrite": args.overwrite or settings.get("overwrite_existing", False),
+                "archive": args.output_archive,
+                "sizes": sizes,
+                "formats": formats,
+                "srcset": args.srcset or preset.get("output_srcset", False)
+            }
+            plan = compile_preset(preset, output)
+        except Exception as e:
+            print(str(e))
+            return 1
+        variants.append((preset_name, plan.options, output))
+
+    # Several presets share one decode of each file
+    _, options, output = variants[0]
+    if len(variants) == 1:
+        variants = None
+    cluster = None
+    if args.cluster:
+        try:
+            cluster = ClusterLeases(args.cluster, timeout=args.lease_timeout)
+        except OSError as e:
+            print(f"Failed to open the lease folder: {str(e)}")
+            return 1
+    journal = BatchJournal(journal_path(files, output))
+    state = None if args.cluster else load_journal(journal.path)
+    if state and state["pending"]:
+        print(f"Note: replacing an interrupted run of this batch with {len(state['pending'])} files left "
+              f"(use --resume to finish it instead).")
+    batch = BatchProcessor(ImageProcessor(), options, output, journal, variants=variants, cluster=cluster,
+                           **batch_limits(args, files, process_workers))
+    return run_batch(batch, files, args)
+
+
+def batch_limits(args, files, process_workers=None):
+    """Worker count, memory budget, profiling and queue order given on the command line, if any"""
+    profiler = slow_file_profiler()
+    if args.profile_slow is not None:
+        profiler = SlowFileProfiler(args.profile_slow, args.profile_dir)
+    elif profiler and args.profile_dir:
+        profiler.directory = args.profile_dir
+    return {
+        "workers": args.workers,
+        "memory_budget": args.memory_budget * 1024 * 1024 if args.memory_budget else None,
+        "process_workers": process_workers,
+        "profiler": profiler,
+        "order": args.order or ("priority" if args.pin else None),
+        "pinned": pinned_paths(files, args.pin or [])
+    }
+
+
+def pinned_paths(files, patterns):
+    """The files matching any pin pattern, by path, file name or wildcard, in the order the patterns are given"""
+    pinned = []
+    for pattern in patterns:
+        for file_path in files:
+            if file_path in pinned:
+                continue
+            if (os.path.abspath(file_path) == os.path.abspath(pattern) or fnmatch.fnmatch(file_path, pattern)
+                    or fnmatch.fnmatch(os.path.basename(file_path), pattern)):
+                pinned.append(file_path)
+    return pinned
+
+
+def run_batch(batch, files, args):
+    """Run a batch on a worker thread, reporting progress until it ends"""
+    worker = threading.Thread(target=batch.run, args=(list(enumerate(files)),), daemon=True)
+    worker.start()
+
+    while worker.is_alive():
+        try:
+            worker.join(args.progress_interval)
+        except KeyboardInterrupt:
+            # Ctrl+C stops cleanly at the next checkpoint
+            batch.cancel()
+        updates, snapshot = batch.progress.flush()
+        report_progress(updates, snapshot, args.progress)
+
+    snapshot = batch.progress.snapshot()
+    if args.stats_json:
+        try:
+            batch.stage_stats.save_json(args.stats_json, files=snapshot["total"], processed=snapshot["processed"],
+                                        errors=snapshot["errors"], elapsed=round(snapshot["elapsed"], 3))
+        except Exception as e:
+            print(str(e))
+    if snapshot["cancelled"]:
+        return 130
+    return 1 if snapshot["errors"] else 0
+
+
+def import_breakdown(limit=10):
+    """Time this module's imports in a fresh interpreter, as python -X importtime does.
+
+    Returns the module's total import time and its costliest direct imports,
+    both in microseconds.
+    """
+    import subprocess
+
+    module_dir = os.path.dirname(os.path.abspath(__file__))
+    module = os.path.splitext(os.path.basename(__file__))[0]
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [module_dir, os.environ.get("PYTHONPATH")])))
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            capture_output=True, text=True, env=env)
+
+    # Children are listed before their parent, indented two spaces per level
+    total = 0
+    children = []
+    direct = []
+    for line in result.stderr.splitlines():
+        parts = line.partition("import time:")[2].split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        cumulative = int(parts[1])
+        depth = (len(parts[2]) - len(parts[2].lstrip()) - 1) // 2
+        name = parts[2].strip()
+        if depth == 1:
+            children.append((name, cumulative))
+        elif depth == 0:
+            if name == module:
+                total, direct = cumulative, children
+            children = []
+
+    direct.sort(key=lambda item: item[1], reverse=True)
+    return total, direct[:limit]
+
+
+def print_startup_report(style="text"):
+    """Print how long each startup phase and the costliest imports took"""
+    import platform
+    import PIL
+
+    phases = []
+    previous = 0.0
+    for phase, at in STARTUP_TIMES:
+        phases.append({"phase": phase, "ms": round((at - previous) * 1000, 1), "at_ms": round(at * 1000, 1)})
+        previous = at
+
+    total, imports = import_breakdown()
+    report = {
+        "version": APP_VERSION,
+        "python": platform.python_version(),
+        "pillow": PIL.__version__,
+        "phases": phases,
+        "import_ms": round(total / 1000, 1),
+        "imports": [{"module": name, "ms": round(cumulative / 1000, 1)} for name, cumulative in imports]
+    }
+
+    if style == "json":
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"Startup report (version {report['version']}, Python {report['python']}, Pillow {report['pillow']})")
+    for phase in phases:
+        print(f"  {phase['phase']:<14} {phase['ms']:>8.1f} ms  (at {phase['at_ms']:.1f} ms)")
+    print(f"Module import in a fresh interpreter: {report['import_ms']:.1f} ms, costliest imports:")
+    for entry in report["imports"]:
+        print(f"  {entry['module']:<28} {entry['ms']:>8.1f} ms")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.serve is not None:
+        sys.exit(run_service(args))
+    if args.headless or args.inputs or args.resume:
+        sys.exit(run_headless(args))
+    if tk is None:
+        print("Tkinter is not available. Use --headless or --serve, or import this module as a library.")
+        sys.exit(1)
+
+    root = tk.Tk()
+    mark_startup("tk")
+    app = App(root)
+
+    if args.startup_report:
+        # Draw the first frame, without running scheduled work such as the resume offer
+        root.update_idletasks()
+        mark_startup("first frame")
+        print_startup_report(args.startup_report)
+        root.destroy()
+        return
+
+    root.mainloop()
+
+    # Save settings on exit
+    save_settings(settings)
+    app.release_shared_result()
+    if PROCESS_WORKERS is not None:
+        PROCESS_WORKERS.shutdown()
+
+
+if __name__ == "__main__":
+    main()